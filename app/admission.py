@@ -0,0 +1,185 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from app.hedging import LatencyWindow
+
+
+class Overloaded(RuntimeError):
+    """
+    The request was shed by admission control (wait queue full or the wait
+    timed out). `retry_after_s` is a hint for the Retry-After header.
+    """
+
+    def __init__(self, message: str, retry_after_s: int):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit in front of the upstream pipeline.
+
+    - each upstream call reports its latency (observe)
+    - latency above the threshold, or a failed call, cuts the limit by
+      `decrease_factor` (at most once per threshold interval)
+    - otherwise, while the limit is actually in use, it grows by about
+      one per `limit` successful calls
+    - threshold: `target_latency_s`, or `latency_tolerance` x the rolling
+      p10 (the no-queueing baseline) once `min_samples` calls were seen
+
+    Requests over the limit wait in a FIFO queue of at most `max_queue`;
+    a full queue or a wait longer than `queue_timeout_s` raises Overloaded.
+    acquire/release must run on the event loop; observe is thread-safe.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled=True,
+        initial_limit=20,
+        min_limit=2,
+        max_limit=200,
+        max_queue=50,
+        queue_timeout_s=5.0,
+        target_latency_s=None,
+        latency_tolerance=2.0,
+        decrease_factor=0.8,
+        window=200,
+        min_samples=20,
+        clock=time.monotonic,
+    ):
+        self.enabled = enabled
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.target_latency_s = target_latency_s
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow(window)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._limit = float(initial_limit)
+        self._last_decrease = float("-inf")
+        self._waiters = deque()
+        self.in_flight = 0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def threshold_s(self) -> float | None:
+        if self.target_latency_s is not None:
+            return self.target_latency_s
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(0.1) * self.latency_tolerance
+
+    def retry_after_s(self) -> int:
+        p50 = self.latencies.percentile(0.5)
+        return max(1, math.ceil(p50)) if p50 is not None else 1
+
+    def check_queue(self) -> None:
+        """
+        Raises Overloaded if a new request would be rejected right away
+        (lets callers shed before committing to a response).
+        """
+        if self.enabled and len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("admission queue full", self.retry_after_s())
+
+    # ---------------------------
+    # Feedback
+    # ---------------------------
+    def observe(self, latency_s: float, ok: bool = True) -> None:
+        with self._lock:
+            threshold = self.threshold_s()
+            congested = not ok or (threshold is not None and latency_s > threshold)
+            if ok:
+                self.latencies.add(latency_s)
+
+            now = self._clock()
+            if congested:
+                # one cut per "round trip", not one per late response
+                if now - self._last_decrease >= (threshold or 1.0):
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif self.in_flight >= self._limit / 2:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+
+    # ---------------------------
+    # Admission
+    # ---------------------------
+    async def acquire(self) -> None:
+        if not self.enabled:
+            return
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        self.check_queue()
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("timed out waiting for admission", self.retry_after_s())
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # slot was granted as we were cancelled
+            raise
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+        self.admitted += 1
+
+    def release(self) -> None:
+        if not self.enabled:
+            return
+        self.in_flight -= 1
+        # hand freed slots (and any growth of the limit) to waiters, in order
+        while self._waiters and self.in_flight < self.limit:
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        threshold = self.threshold_s()
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "decreases": self.decreases,
+            "latency_threshold_ms": round(threshold * 1000, 1) if threshold is not None else None,
+        }
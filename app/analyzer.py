@@ -0,0 +1,209 @@
+import re
+from dataclasses import dataclass
+from functools import cached_property
+
+from app.patterns import trie_pattern
+
+DISCLAIMER = "This is for educational purposes only and not medical advice."
+
+# Markers that indicate chain-of-thought / reasoning leakage
+REASONING_MARKERS = [
+    "Here are my reasoning steps",
+    "My reasoning",
+    "Let's think step by step",
+    "Chain-of-thought",
+    "Chain of thought",
+    "Reasoning:",
+    "we need to",
+    "so we need to",
+    "therefore we need",
+    "i will",
+    "we must",
+]
+
+# Markers that indicate advice / directives we want to remove
+ADVICE_MARKERS = [
+    "you should",
+    "try to",
+    "i recommend",
+    "recommend",
+    "managing",
+    "manage ",
+    "stay hydrated",
+    "drink water",
+    "get adequate",
+    "exercise",
+    "take ",
+    "avoid ",
+    "start ",
+    "stop ",
+    "cut down",
+    "reduce ",
+    "increase ",
+    "talk to your doctor",
+]
+
+# Prompt fragments that must never reach the user
+FORBIDDEN_FRAGMENTS = [
+    "Rewrite to remove ALL advice",
+    "Rewrite into a clean final answer",
+    "OUTPUT RULES",
+    "Chain-of-thought",
+    "Chain of thought",
+    "Reasoning:",
+    "Now rewrite",
+    "as the last sentence",
+]
+
+REASONING = "reasoning"
+ADVICE = "advice"
+FORBIDDEN = "forbidden"
+# Not a flag: tells clean() whether its line heuristics can apply at all
+_META = "meta"
+_META_MARKERS = ["here are my reasoning steps:", "we need", "we must"]
+
+
+def _marker_table() -> dict[str, frozenset]:
+    """
+    Lowercased marker -> categories. A marker also carries the categories of
+    every marker it contains: the scan reports the longest marker starting
+    at a position, and whatever it contains occurs in the text too.
+    """
+    table: dict[str, set] = {}
+    for category, markers in (
+        (REASONING, REASONING_MARKERS),
+        (ADVICE, ADVICE_MARKERS),
+        (FORBIDDEN, FORBIDDEN_FRAGMENTS),
+        (_META, _META_MARKERS),
+    ):
+        for m in markers:
+            table.setdefault(m.lower(), set()).add(category)
+    return {
+        m: frozenset().union(*(cats for other, cats in table.items() if other in m))
+        for m in table
+    }
+
+
+_CATEGORIES = _marker_table()
+_MARKER_RE = re.compile(trie_pattern(_CATEGORIES))
+
+# The cleanup heuristics in one substitution:
+# - "Here are my reasoning steps: ..." up to the end of its paragraph
+# - planning / meta lines ("we need ...", "we must ...", "thus we need ...")
+_CLEAN_RE = re.compile(
+    r"(?im)here are my reasoning steps:(?s:.*?)(?=\n\n|\Z)"
+    r"|^(?:we need|so we need|therefore we need|we must|thus we need).*$"
+)
+
+MAX_MARKER_LEN = max(len(m) for m in _CATEGORIES)
+
+# The disclaimer with any spacing and case, and a word left outside it
+_DISCLAIMER_RE = re.compile(r"\s+".join(map(re.escape, DISCLAIMER.split())), re.IGNORECASE)
+_WORD_RE = re.compile(r"\w")
+
+
+def _find_markers(lowered: str):
+    """
+    Yields (marker, start) for every marker occurrence, overlaps included.
+
+    One compiled search over the text; after a hit the search resumes at the
+    next character, so a marker starting inside another is still found.
+    """
+    search = _MARKER_RE.search
+    m = search(lowered)
+    while m is not None:
+        yield m.group(), m.start()
+        m = search(lowered, m.start() + 1)
+
+
+def _categories_in(lowered: str) -> set:
+    found = set()
+    for marker, _ in _find_markers(lowered):
+        found |= _CATEGORIES[marker]
+    return found
+
+
+def scan(text: str) -> frozenset:
+    """
+    Categories of every marker in `text` (cheap check for streaming windows).
+    """
+    return frozenset(_categories_in(text.lower()) - {_META})
+
+
+def _is_disclaimer_only(text: str) -> bool:
+    # No body: nothing but the disclaimer, whitespace and punctuation. A short
+    # answer is still an answer (with the stop sequence it has no disclaimer)
+    return _WORD_RE.search(_DISCLAIMER_RE.sub(" ", text)) is None
+
+
+@dataclass
+class Analysis:
+    """
+    Everything the pipeline checks about one candidate answer, from one scan.
+
+    spans are (category, start, end) over the lowercased text (the same
+    offsets as the input for ASCII text). cleaned_text is the cleaned answer
+    ending with the disclaimer exactly once, or "" when nothing is left.
+    """
+
+    text: str
+    has_reasoning: bool
+    looks_like_advice: bool
+    has_forbidden: bool
+    is_disclaimer_only: bool
+    spans: list[tuple[str, int, int]]
+    _has_meta: bool = False
+
+    @property
+    def acceptable(self) -> bool:
+        return not (self.has_reasoning or self.looks_like_advice or self.is_disclaimer_only)
+
+    @cached_property
+    def cleaned_text(self) -> str:
+        return clean(self.text, _has_meta=self._has_meta)
+
+
+def analyze(text: str) -> Analysis:
+    text = text or ""
+    lowered = text.lower()
+
+    categories = set()
+    spans = []
+    for marker, start in _find_markers(lowered):
+        for category in _CATEGORIES[marker]:
+            categories.add(category)
+            if category != _META:
+                spans.append((category, start, start + len(marker)))
+
+    head = lowered.lstrip()[: len("so we need")]
+    return Analysis(
+        text=text,
+        has_reasoning=REASONING in categories or head.startswith(("we need", "so we need")),
+        looks_like_advice=ADVICE in categories,
+        has_forbidden=FORBIDDEN in categories,
+        is_disclaimer_only=_is_disclaimer_only(text),
+        spans=spans,
+        _has_meta=_META in categories,
+    )
+
+
+def clean(text: str, _has_meta: bool | None = None) -> str:
+    """
+    Best-effort cleanup:
+    - Remove obvious reasoning blocks / meta instructions
+    - Ensure final disclaimer sentence exists exactly once at the end
+    Returns "" if nothing is left.
+    """
+    text = (text or "").strip()
+    if _has_meta is None:
+        _has_meta = _META in _categories_in(text.lower())
+    if _has_meta:
+        text = _CLEAN_RE.sub("", text)
+    text = text.replace(DISCLAIMER, "").strip()
+    if not text:
+        return ""
+
+    if not text.endswith((".", "!", "?")):
+        text += "."
+    return text + " " + DISCLAIMER
+
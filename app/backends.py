@@ -0,0 +1,302 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+class NoBackendAvailable(RuntimeError):
+    """Every backend is at its concurrency limit."""
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """
+    One OpenAI-compatible endpoint (provider or self-hosted replica).
+
+    - weight: relative share of traffic (2.0 takes about twice as much as 1.0)
+    - max_concurrency: in-flight calls allowed before the backend is skipped
+    """
+
+    name: str
+    base_url: str
+    api_key: str | None
+    model: str
+    weight: float = 1.0
+    max_concurrency: int = 64
+
+    @classmethod
+    def from_dict(cls, raw: dict, *, default_api_key: str | None, default_model: str) -> "BackendConfig":
+        config = cls(
+            name=raw.get("name") or raw["base_url"],
+            base_url=raw["base_url"],
+            api_key=raw.get("api_key") or default_api_key,
+            model=raw.get("model") or default_model,
+            weight=float(raw.get("weight", 1.0)),
+            max_concurrency=int(raw.get("max_concurrency", 64)),
+        )
+        # weight divides the routing score; max_concurrency < 1 never gets traffic
+        if not config.weight > 0:
+            raise ValueError(f"backend {config.name!r}: weight must be > 0")
+        if config.max_concurrency < 1:
+            raise ValueError(f"backend {config.name!r}: max_concurrency must be >= 1")
+        return config
+
+
+def load_backend_configs(raw_json: str | None, path: str | None, **defaults) -> list[BackendConfig]:
+    """
+    Parse the backend list from a JSON string (HF_BACKENDS) or a JSON file
+    (HF_BACKENDS_FILE). Returns [] when neither is set.
+    """
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            raw_json = f.read()
+    if not raw_json:
+        return []
+
+    entries = json.loads(raw_json)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("backend config must be a non-empty JSON list")
+    configs = [BackendConfig.from_dict(e, **defaults) for e in entries]
+    names = [c.name for c in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("backend names must be unique")
+    return configs
+
+
+class Backend:
+    """
+    A configured endpoint with its clients and live routing state.
+    """
+
+    def __init__(
+        self,
+        config: BackendConfig,
+        client=None,
+        async_client=None,
+        initial_latency_s=1.0,
+        factory=None,
+    ):
+        self.config = config
+        # factory(config) -> (client, async_client), called on first use
+        self._factory = factory
+        self._client = client
+        self._async_client = async_client
+        self._clients_lock = threading.Lock()
+
+        self.outstanding = 0
+        self.ewma_s = initial_latency_s
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def _build_clients(self) -> None:
+        # Requests on the event loop and in the threadpool can race to the
+        # first call; the factory must run once (each run opens a pool)
+        if self._factory is None:
+            return
+        with self._clients_lock:
+            if self._client is None or self._async_client is None:
+                client, async_client = self._factory(self.config)
+                self._client = self._client or client
+                self._async_client = self._async_client or async_client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._build_clients()
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._build_clients()
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, value) -> None:
+        self._async_client = value
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None or self._async_client is not None
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def model(self) -> str:
+        return self.config.model
+
+    def score(self) -> float:
+        # Expected wait if this request joins the backend's queue
+        return self.ewma_s * (self.outstanding + 1) / self.config.weight
+
+
+class BackendPool:
+    """
+    Routes each call to the backend with the lowest
+    EWMA latency x (outstanding + 1) / weight.
+
+    - backends at max_concurrency are skipped
+    - `eject_after` consecutive failures eject a backend for `eject_s`
+      seconds; after that it gets traffic again (a failure re-ejects it)
+    - if every backend is ejected, ejection is ignored rather than failing
+      all traffic (the circuit breaker decides when to stop calling)
+    """
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        *,
+        failure_on: tuple = (Exception,),
+        eject_after=3,
+        eject_s=30.0,
+        ewma_alpha=0.3,
+        clock=time.monotonic,
+    ):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+        self.failure_on = failure_on
+        self.eject_after = eject_after
+        self.eject_s = eject_s
+        self.ewma_alpha = ewma_alpha
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._health_task = None
+
+    def _is_ejected(self, backend: Backend) -> bool:
+        return backend.ejected_until > self._clock()
+
+    def _pick(self) -> Backend:
+        with_room = [b for b in self.backends if b.outstanding < b.config.max_concurrency]
+        if not with_room:
+            raise NoBackendAvailable("all backends are at their concurrency limit")
+        healthy = [b for b in with_room if not self._is_ejected(b)] or with_room
+        best = min(healthy, key=Backend.score)
+        best.outstanding += 1
+        best.requests += 1
+        return best
+
+    def _record(self, backend: Backend, elapsed_s: float | None) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            if elapsed_s is None:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.eject_after:
+                    self._eject(backend)
+                return
+            backend.consecutive_failures = 0
+            a = self.ewma_alpha
+            backend.ewma_s = a * elapsed_s + (1 - a) * backend.ewma_s
+
+    def _eject(self, backend: Backend) -> None:
+        if not self._is_ejected(backend):
+            backend.ejections += 1
+        backend.ejected_until = self._clock() + self.eject_s
+
+    @contextmanager
+    def lease(self):
+        """
+        Pick a backend for one call and record how the call went:
+            with pool.lease() as backend:
+                backend.client.chat.completions.create(model=backend.model, ...)
+
+        Works in async code too (the bookkeeping never awaits).
+        """
+        with self._lock:
+            backend = self._pick()
+        started = time.perf_counter()
+        try:
+            yield backend
+        except self.failure_on:
+            self._record(backend, None)
+            raise
+        except BaseException:
+            # cancelled / non-upstream error: no verdict on the backend
+            with self._lock:
+                backend.outstanding -= 1
+            raise
+        self._record(backend, time.perf_counter() - started)
+
+    def is_warm(self) -> bool:
+        """
+        True once some backend has its clients built and is not ejected.
+        """
+        return any(b.connected and not self._is_ejected(b) for b in self.backends)
+
+    # ---------------------------
+    # Health checks
+    # ---------------------------
+    async def check(self, backend: Backend, timeout_s=5.0) -> bool:
+        """
+        GET /models on one backend; restores it on success, ejects it on failure.
+        """
+        try:
+            await backend.async_client.models.list(timeout=timeout_s)
+        except Exception:
+            with self._lock:
+                self._eject(backend)
+            return False
+        with self._lock:
+            backend.consecutive_failures = 0
+            backend.ejected_until = 0.0
+        return True
+
+    async def check_all(self, timeout_s=5.0) -> dict:
+        results = await asyncio.gather(*(self.check(b, timeout_s) for b in self.backends))
+        return {b.name: ok for b, ok in zip(self.backends, results)}
+
+    def start_health_checks(self, interval_s: float, timeout_s=5.0) -> None:
+        async def loop():
+            while True:
+                await self.check_all(timeout_s)
+                await asyncio.sleep(interval_s)
+
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(loop())
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def aclose(self) -> None:
+        await self.stop_health_checks()
+        for b in self.backends:
+            if b._async_client is not None:
+                await b._async_client.close()
+            if b._client is not None:
+                b._client.close()
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "name": b.name,
+                "model": b.model,
+                "weight": b.config.weight,
+                "max_concurrency": b.config.max_concurrency,
+                "outstanding": b.outstanding,
+                "ewma_ms": round(b.ewma_s * 1000, 1),
+                "ejected": self._is_ejected(b),
+                "requests": b.requests,
+                "failures": b.failures,
+                "ejections": b.ejections,
+            }
+            for b in self.backends
+        ]
@@ -0,0 +1,238 @@
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import anyio
+
+
+# -------------------------------------------------------------------
+# In-memory tier: LRU with TTL and size-based eviction
+# -------------------------------------------------------------------
+class LRUCache:
+    """
+    Thread-safe LRU cache with a TTL and two size limits:
+    - max_entries: number of keys
+    - max_bytes: total size of the values (str values are measured as UTF-8)
+
+    Expired entries are dropped lazily when they are read or reach the LRU end.
+    """
+
+    def __init__(
+        self,
+        max_entries=1024,
+        max_bytes=8 * 1024 * 1024,
+        ttl_s=3600.0,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return 64  # small fixed cost for other objects (tuples of labels, etc.)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = item
+            if expires_at <= self._clock():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return  # never worth evicting everything for one value
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._data[key] = (self._clock() + self.ttl_s, size, value)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# -------------------------------------------------------------------
+# On-disk tier: SQLite (survives restarts)
+# -------------------------------------------------------------------
+class SQLiteCache:
+    """
+    Small key/value table with a TTL. Keys are opaque hashes; values are
+    the cached answers.
+    """
+
+    def __init__(self, path: str, ttl_s=86400.0):
+        self.path = path
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl_s),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+
+# -------------------------------------------------------------------
+# Response cache for query_huggingface
+# -------------------------------------------------------------------
+def _normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt or "").strip().lower()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of final answers (memory, then optional SQLite).
+
+    Keys are HMAC-SHA256(salt, model id + prompt version + normalized prompt),
+    so no prompt text (PHI) is ever stored as a key. Set a fixed salt if the
+    disk tier should be reused across restarts; with the default random salt
+    every process starts with a fresh key space.
+    """
+
+    def __init__(
+        self,
+        *,
+        model_id: str,
+        prompt_version: str,
+        salt: bytes | None = None,
+        memory: LRUCache | None = None,
+        disk: SQLiteCache | None = None,
+    ):
+        self.model_id = model_id
+        self.prompt_version = prompt_version
+        self._salt = salt or os.urandom(32)
+        self.memory = memory or LRUCache()
+        self.disk = disk
+
+    def make_key(self, prompt: str) -> str:
+        material = f"{self.model_id}\x00{self.prompt_version}\x00{_normalize_prompt(prompt)}"
+        return hmac.new(self._salt, material.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def get(self, prompt: str):
+        key = self.make_key(prompt)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, prompt: str, answer: str) -> None:
+        key = self.make_key(prompt)
+        self.memory.set(key, answer)
+        if self.disk is not None:
+            self.disk.set(key, answer)
+
+    async def aget(self, prompt: str):
+        """
+        Like get(), but the SQLite lookup runs in a worker thread.
+        """
+        key = self.make_key(prompt)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await anyio.to_thread.run_sync(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def aset(self, prompt: str, answer: str) -> None:
+        key = self.make_key(prompt)
+        self.memory.set(key, answer)
+        if self.disk is not None:
+            await anyio.to_thread.run_sync(self.disk.set, key, answer)
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
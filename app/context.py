@@ -0,0 +1,140 @@
+import os
+import re
+from dataclasses import dataclass
+
+from app.schemas import QuestionRequest
+
+# Input budget for the prompt built from one request (before system prompts)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Hard ceiling on prior chat turns, whatever their size
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "8"))
+
+# Words and single punctuation marks. Close to BPE token counts for English
+# prose, and cheap enough to run on every request without a tokenizer.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+_ELLIPSIS = " …"
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text or ""))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep the first `max_tokens` tokens, preferring to cut at a sentence end.
+    """
+    if max_tokens <= 0:
+        return ""
+
+    ends = [m.end() for m in _TOKEN_RE.finditer(text)]
+    if len(ends) <= max_tokens:
+        return text
+
+    cut = ends[max_tokens - 1]
+    sentence_end = max(text.rfind(". ", 0, cut), text.rfind("\n", 0, cut))
+    if sentence_end > cut // 2:
+        cut = sentence_end + 1
+    return text[:cut].rstrip() + _ELLIPSIS
+
+
+@dataclass
+class ContextReport:
+    budget: int
+    tokens_used: int
+    tokens_trimmed: int
+    turns_kept: int
+    turns_dropped: int
+    history_truncated: bool
+
+
+def _entities_block(request: QuestionRequest, conditions, symptoms_found) -> str:
+    return (
+        f"- Known diagnoses: {request.diagnoses or []}\n"
+        f"- Symptoms list (form): {request.symptoms or []}\n"
+        f"- Extracted conditions (NLP): {conditions or []}\n"
+        f"- Extracted symptoms (NLP): {symptoms_found or []}\n"
+    )
+
+
+def build_context(
+    request: QuestionRequest,
+    conditions: list[str],
+    symptoms_found: list[str],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> tuple[list[dict], ContextReport]:
+    """
+    Build chat-style context (for this request only, not persisted) within a
+    token budget, filled in priority order:
+    1. the question
+    2. diagnoses/symptoms from the form and the NLP-extracted entities
+    3. prior chat turns, newest first (whole turns only, at most CONTEXT_MAX_TURNS)
+    4. the medical history, truncated to whatever budget is left
+
+    Returns the messages for the query_huggingface_chat variants and a report
+    of what was trimmed.
+    """
+    header = "User-provided context (do not diagnose; explain educationally only):\n"
+    history_label = "- Medical history: "
+    history = (request.medical_history or "").strip()
+    incoming = getattr(request, "messages", []) or []
+
+    question = request.question.strip()
+    entities = _entities_block(request, conditions, symptoms_found)
+
+    full_tokens = (
+        count_tokens(question)
+        + count_tokens(header)
+        + count_tokens(entities)
+        + count_tokens(history_label + (history or "(none)"))
+        + sum(count_tokens(m.content) for m in incoming)
+    )
+
+    # 1) question (truncated only if it alone exceeds the budget)
+    question = truncate_to_tokens(question, budget)
+    remaining = budget - count_tokens(question)
+
+    # 2) entities (always kept; small and the most useful facts)
+    remaining -= count_tokens(header) + count_tokens(entities)
+
+    # 3) recent turns first, then older ones, while they fit
+    kept = []
+    for m in reversed(incoming[-CONTEXT_MAX_TURNS:]):
+        cost = count_tokens(m.content)
+        if cost > remaining:
+            break
+        kept.append(m)
+        remaining -= cost
+    kept.reverse()
+
+    # 4) medical history gets what is left (minus its label and the "…" marker)
+    remaining -= count_tokens(history_label) + count_tokens(_ELLIPSIS)
+    history_text = truncate_to_tokens(history, remaining) if history else ""
+    history_truncated = history_text != history
+    if history and not history_text:
+        history_text = "(omitted: over context budget)"
+    elif not history:
+        history_text = "(none)"
+
+    context_block = header + f"{history_label}{history_text}\n" + entities
+
+    # This list is passed to the query_huggingface_chat variants,
+    # which will add their own system prompt
+    chat_messages = [{"role": "user", "content": context_block}]
+    for m in kept:
+        # m is a Pydantic model; use its fields
+        chat_messages.append({"role": m.role, "content": m.content})
+
+    # Final user question (always last)
+    chat_messages.append({"role": "user", "content": question})
+
+    used = sum(count_tokens(m["content"]) for m in chat_messages)
+    report = ContextReport(
+        budget=budget,
+        tokens_used=used,
+        tokens_trimmed=max(0, full_tokens - used),
+        turns_kept=len(kept),
+        turns_dropped=len(incoming) - len(kept),
+        history_truncated=history_truncated,
+    )
+    return chat_messages, report
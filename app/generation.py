@@ -0,0 +1,65 @@
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PassSettings:
+    """
+    Generation limits for one pass of the pipeline.
+
+    - max_tokens: hard ceiling (also used until enough answers were seen)
+    - min_tokens: floor for the adaptive limit
+    - headroom: multiplier over the observed p95 answer length
+    """
+
+    name: str
+    max_tokens: int
+    min_tokens: int
+    headroom: float = 1.25
+
+
+class AdaptiveMaxTokens:
+    """
+    Derives max_tokens for a pass from how long its answers actually are.
+
+    Answers that ended naturally contribute their length. Answers cut off by
+    the limit contribute twice the limit, so a too-tight limit grows back
+    quickly instead of truncating every answer.
+    """
+
+    def __init__(self, settings: PassSettings, window=200, min_samples=20, adaptive=True):
+        self.settings = settings
+        self.min_samples = min_samples
+        self.adaptive = adaptive
+        self._lengths = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        self.truncated = 0
+        self.completed = 0
+
+    def max_tokens(self) -> int:
+        s = self.settings
+        with self._lock:
+            if not self.adaptive or len(self._lengths) < self.min_samples:
+                return s.max_tokens
+            ordered = sorted(self._lengths)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return max(s.min_tokens, min(s.max_tokens, math.ceil(p95 * s.headroom)))
+
+    def observe(self, completion_tokens: int, finish_reason: str | None, limit: int) -> None:
+        with self._lock:
+            if finish_reason == "length":
+                self.truncated += 1
+                self._lengths.append(2 * limit)
+            else:
+                self.completed += 1
+                self._lengths.append(completion_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "max_tokens": self.max_tokens(),
+            "completed": self.completed,
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+
+class LatencyWindow:
+    """
+    Rolling window of the most recent latencies (seconds).
+    """
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class Hedger:
+    """
+    Hedged requests: if a call has not answered after `delay`, send a second
+    identical call; the first successful answer wins and the other is
+    cancelled.
+
+    - delay: fixed (delay_ms) or the rolling `percentile` of recent latencies
+      (no hedging until `min_samples` latencies have been seen)
+    - max_rate: cap on hedges as a fraction of calls (token bucket: every
+      call earns max_rate tokens, every hedge spends one)
+
+    Async calls cancel the losing request. A sync call cannot interrupt a
+    request running in another thread, so the loser finishes in the
+    background and its result is dropped.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled=True,
+        delay_ms=None,
+        percentile=0.9,
+        min_samples=20,
+        max_rate=0.1,
+        window=200,
+        max_workers=32,
+    ):
+        self.enabled = enabled
+        self.delay_ms = delay_ms
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.latencies = LatencyWindow(window)
+
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._max_tokens = max(1.0, max_rate * 10)
+        self._executor = None
+        self._max_workers = max_workers
+
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.skipped_by_budget = 0
+
+    # ---------------------------
+    # Policy
+    # ---------------------------
+    def hedge_delay(self) -> float | None:
+        """
+        Seconds to wait before hedging, or None if hedging is off for now.
+        """
+        if not self.enabled:
+            return None
+        if self.delay_ms is not None:
+            return self.delay_ms / 1000
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._max_tokens, self._tokens + self.max_rate)
+
+    def _take_token(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.hedges_fired += 1
+                return True
+            self.skipped_by_budget += 1
+            return False
+
+    def _record_win(self, hedged: bool, started: float) -> None:
+        self.latencies.add(time.perf_counter() - started)
+        if hedged:
+            with self._lock:
+                self.hedge_wins += 1
+        elif self.enabled:
+            with self._lock:
+                self.primary_wins += 1
+
+    # ---------------------------
+    # Sync
+    # ---------------------------
+    def call(self, fn):
+        self._start_call()
+        started = time.perf_counter()
+        delay = self.hedge_delay()
+        if delay is None:
+            result = fn()
+            self.latencies.add(time.perf_counter() - started)
+            return result
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers, thread_name_prefix="hedge"
+                    )
+
+        primary = self._executor.submit(fn)
+        try:
+            result = primary.result(timeout=delay)
+            self._record_win(False, started)
+            return result
+        except FuturesTimeout:
+            pass
+
+        if not self._take_token():
+            result = primary.result()
+            self._record_win(False, started)
+            return result
+
+        hedge = self._executor.submit(fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    for p in pending:
+                        p.cancel()
+                    self._record_win(f is hedge, started)
+                    return f.result()
+
+        # both failed: surface the primary's error
+        raise primary.exception()
+
+    # ---------------------------
+    # Async
+    # ---------------------------
+    async def acall(self, coro_fn):
+        self._start_call()
+        started = time.perf_counter()
+        delay = self.hedge_delay()
+        if delay is None:
+            result = await coro_fn()
+            self.latencies.add(time.perf_counter() - started)
+            return result
+
+        primary = asyncio.ensure_future(coro_fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take_token():
+                result = await primary
+                self._record_win(False, started)
+                return result
+
+            hedge = asyncio.ensure_future(coro_fn())
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        self._record_win(t is hedge, started)
+                        return t.result()
+
+            raise primary.exception()
+        finally:
+            # cancels the losing (or abandoned) upstream request
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        p90 = self.latencies.percentile(0.9)
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges_fired": self.hedges_fired,
+            "hedge_rate": round(self.hedges_fired / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "skipped_by_budget": self.skipped_by_budget,
+            "current_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "p90_ms": round(p90 * 1000, 1) if p90 is not None else None,
+        }
@@ -0,0 +1,248 @@
+"""
+Local question-intent classifier: hashed word/char n-grams + a linear
+(softmax) model, scored with NumPy in tens of microseconds per question.
+
+Runs after the regex safety gate to catch paraphrases of unsafe requests
+("is this diabetes in my case") before any upstream tokens are spent.
+
+Train / evaluate (from the repo root):
+    python -m app.intent --data data/intent_examples.jsonl --out data/intent_model.npz
+"""
+import argparse
+import json
+import math
+import re
+import time
+import zlib
+
+import numpy as np
+
+SAFE = "safe"
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashedNgrams:
+    """
+    Text -> feature bucket ids: word n-grams and character n-grams of each
+    word, hashed (crc32, stable across processes) into `n_features` buckets.
+    """
+
+    def __init__(self, n_features=4096, word_ngrams=(1, 2), char_ngrams=(3, 4), max_cached_words=50_000):
+        self.n_features = n_features
+        self.word_ngrams = tuple(word_ngrams)
+        self.char_ngrams = tuple(char_ngrams)
+        self.max_cached_words = max_cached_words
+        self._word_cache: dict[str, list[int]] = {}
+
+    def config(self) -> dict:
+        return {
+            "n_features": self.n_features,
+            "word_ngrams": list(self.word_ngrams),
+            "char_ngrams": list(self.char_ngrams),
+        }
+
+    def _hash(self, gram: str) -> int:
+        return zlib.crc32(gram.encode()) % self.n_features
+
+    def _word_indices(self, word: str) -> list[int]:
+        # unigram + char n-grams depend on the word alone: cached per word
+        idx = self._word_cache.get(word)
+        if idx is None:
+            idx = [self._hash("w:" + word)] if self.word_ngrams[0] <= 1 else []
+            padded = f" {word} "
+            lo, hi = self.char_ngrams
+            for n in range(lo, hi + 1):
+                idx.extend(self._hash("c:" + padded[i:i + n]) for i in range(len(padded) - n + 1))
+            if len(self._word_cache) < self.max_cached_words:
+                self._word_cache[word] = idx
+        return idx
+
+    def indices(self, text: str) -> list[int]:
+        words = _WORD_RE.findall((text or "").lower())
+        idx = []
+        for word in words:
+            idx.extend(self._word_indices(word))
+        lo, hi = self.word_ngrams
+        for n in range(max(lo, 2), hi + 1):
+            idx.extend(self._hash("w:" + " ".join(words[i:i + n])) for i in range(len(words) - n + 1))
+        return idx
+
+    def matrix(self, texts) -> np.ndarray:
+        """
+        Dense (len(texts), n_features) counts scaled by 1/sqrt(n_grams), the
+        same scaling IntentModel applies when scoring.
+        """
+        X = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            idx = self.indices(text)
+            if idx:
+                np.add.at(X[row], idx, 1.0 / math.sqrt(len(idx)))
+        return X
+
+
+class IntentModel:
+    """
+    Softmax regression over HashedNgrams features.
+
+    classify() returns (category, p_unsafe): the most likely unsafe class when
+    1 - p(safe) >= threshold, else (None, p_unsafe).
+    """
+
+    def __init__(self, features: HashedNgrams, classes, weights, bias, threshold=0.8):
+        self.features = features
+        self.classes = list(classes)
+        self.threshold = threshold
+        self._safe = self.classes.index(SAFE)
+        # extra all-zero row: every question starts with it as a padding
+        # feature, so reduceat never sees an empty slice
+        self._pad = features.n_features
+        self.weights = np.vstack([weights, np.zeros((1, len(self.classes)))]).astype(np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+
+    def _probabilities(self, texts) -> np.ndarray:
+        flat = []
+        starts = []
+        scale = np.empty(len(texts), dtype=np.float32)
+        for i, text in enumerate(texts):
+            idx = self.features.indices(text)
+            starts.append(len(flat))
+            flat.append(self._pad)
+            flat.extend(idx)
+            scale[i] = 1.0 / math.sqrt(max(1, len(idx)))
+        logits = np.add.reduceat(self.weights[flat], starts, axis=0) * scale[:, None] + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        p = np.exp(logits)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def score_batch(self, texts) -> np.ndarray:
+        """
+        p(unsafe) per question, as one vectorized pass.
+        """
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        return 1.0 - self._probabilities(texts)[:, self._safe]
+
+    def classify_batch(self, texts) -> list[tuple[str | None, float]]:
+        if not texts:
+            return []
+        p = self._probabilities(texts)
+        unsafe = 1.0 - p[:, self._safe]
+        p[:, self._safe] = -1.0
+        best = p.argmax(axis=1)
+        return [
+            (self.classes[b] if u >= self.threshold else None, float(u))
+            for b, u in zip(best, unsafe)
+        ]
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        return self.classify_batch([text])[0]
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def save(self, path) -> None:
+        meta = {"classes": self.classes, "threshold": self.threshold, **self.features.config()}
+        np.savez_compressed(
+            path, weights=self.weights[:-1], bias=self.bias, meta=np.array(json.dumps(meta))
+        )
+
+    @classmethod
+    def load(cls, path, threshold: float | None = None) -> "IntentModel":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            features = HashedNgrams(meta["n_features"], meta["word_ngrams"], meta["char_ngrams"])
+            return cls(
+                features,
+                meta["classes"],
+                data["weights"],
+                data["bias"],
+                meta["threshold"] if threshold is None else threshold,
+            )
+
+
+# ---------------------------
+# Training / evaluation
+# ---------------------------
+def load_examples(path) -> list[tuple[str, str]]:
+    """
+    JSON lines: {"text": ..., "label": "safe" | "<category>"}
+    """
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(r["text"], r["label"]) for r in rows]
+
+
+def train(examples, features=None, epochs=300, lr=2.0, l2=1e-4, threshold=0.8) -> IntentModel:
+    """
+    Full-batch gradient descent on the softmax cross-entropy (L2-regularized).
+    """
+    features = features or HashedNgrams()
+    classes = sorted({label for _, label in examples} | {SAFE})
+    X = features.matrix([text for text, _ in examples])
+    Y = np.zeros((len(examples), len(classes)), dtype=np.float32)
+    Y[np.arange(len(examples)), [classes.index(label) for _, label in examples]] = 1.0
+
+    W = np.zeros((features.n_features, len(classes)), dtype=np.float32)
+    b = np.zeros(len(classes), dtype=np.float32)
+    for _ in range(epochs):
+        logits = X @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        P = np.exp(logits)
+        P /= P.sum(axis=1, keepdims=True)
+        G = (P - Y) / len(examples)
+        W -= lr * (X.T @ G + l2 * W)
+        b -= lr * G.sum(axis=0)
+    return IntentModel(features, classes, W, b, threshold)
+
+
+def evaluate(model: IntentModel, examples) -> dict:
+    texts = [text for text, _ in examples]
+    t0 = time.perf_counter()
+    for text in texts:
+        model.classify(text)
+    per_question_us = (time.perf_counter() - t0) / max(1, len(texts)) * 1e6
+
+    predicted = model.classify_batch(texts)
+    blocked = [category is not None for category, _ in predicted]
+    unsafe = [label != SAFE for _, label in examples]
+    tp = sum(b and u for b, u in zip(blocked, unsafe))
+    return {
+        "examples": len(examples),
+        "unsafe_precision": round(tp / max(1, sum(blocked)), 3),
+        "unsafe_recall": round(tp / max(1, sum(unsafe)), 3),
+        "false_refusals": sum(b and not u for b, u in zip(blocked, unsafe)),
+        "category_accuracy": round(
+            sum((c or SAFE) == label for (c, _), (_, label) in zip(predicted, examples))
+            / max(1, len(examples)),
+            3,
+        ),
+        "us_per_question": round(per_question_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate the intent classifier.")
+    parser.add_argument("--data", default="data/intent_examples.jsonl")
+    parser.add_argument("--out", default="data/intent_model.npz")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for evaluation")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = load_examples(args.data)
+    order = np.random.default_rng(args.seed).permutation(len(examples))
+    n_test = int(len(examples) * args.holdout)
+    test = [examples[i] for i in order[:n_test]]
+    train_set = [examples[i] for i in order[n_test:]]
+
+    if test:
+        print("holdout:", evaluate(train(train_set, threshold=args.threshold), test))
+    model = train(examples, threshold=args.threshold)
+    print("train (all):", evaluate(model, examples))
+    model.save(args.out)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
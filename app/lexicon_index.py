@@ -0,0 +1,282 @@
+"""
+Compiled, memory-mapped lexicon index for app.terminology.
+
+The CSV lexicon (kind,canonical,term) is compiled offline into one binary
+file; workers mmap it read-only, so every uvicorn worker shares one
+page-cache copy and opening it costs a few header reads, however many
+terms it holds.
+
+Compile (from the repo root):
+    python -m app.lexicon_index data/lexicon.csv data/lexicon.idx
+
+Layout (little-endian, every section 4-byte aligned):
+    header      magic, counts and section offsets (_HEADER)
+    buckets     u32[n_buckets]: open-addressing hash table of entry offsets
+                (0 = empty), keyed by crc32 of the space-joined term tokens
+    entries     u16 key_len, u8 flags, u8 0, u32 n_values, key bytes
+                (padded), u32 name ids[n_values]; one entry per term and
+                per proper prefix of a multi-word term
+    names       u32 offsets[n_names + 1] + UTF-8 blob, canonical names in
+                lexicon order
+    name_kinds  u8[n_names]: index into the kinds list
+    kinds       newline-separated "kind<TAB>number of terms" lines
+    vocabulary  newline-separated words used by the terms
+"""
+import argparse
+import mmap
+import struct
+import sys
+import zlib
+
+from app.terminology import load_lexicon, term_tokens
+
+MAGIC = b"LEXIDX2\0"
+_HEADER = struct.Struct("<8s12I")
+_ENTRY = struct.Struct("<HBxI")
+
+TERMINAL = 1  # a term ends here
+PREFIX = 2  # a longer term continues from here
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _u32(values) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def _string_table(strings) -> tuple[bytes, bytes]:
+    offsets, blob = [0], bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return _u32(offsets), bytes(blob)
+
+
+# -------------------------------------------------------------------
+# Compiler
+# -------------------------------------------------------------------
+def compile_lexicon(lexicon: dict[str, dict[str, list[str]]], out_path) -> dict:
+    """
+    Writes the index for kind -> canonical -> terms (load_lexicon's shape).
+    Returns a few counts for the CLI.
+    """
+    kinds = list(lexicon)
+    names, name_kinds = [], []
+    entries: dict[str, list] = {}  # key -> [flags, set of name ids]
+    vocabulary = set()
+    term_counts = [0] * len(kinds)
+    for kind_id, kind in enumerate(kinds):
+        for canonical, terms in lexicon[kind].items():
+            name_id = len(names)
+            names.append(canonical)
+            name_kinds.append(kind_id)
+            for term in terms:
+                tokens = term_tokens(term)
+                if not tokens:
+                    continue
+                vocabulary.update(tokens)
+                term_counts[kind_id] += 1
+                for n in range(1, len(tokens)):
+                    entries.setdefault(" ".join(tokens[:n]), [0, set()])[0] |= PREFIX
+                entry = entries.setdefault(" ".join(tokens), [0, set()])
+                entry[0] |= TERMINAL
+                entry[1].add(name_id)
+
+    n_buckets = 1
+    while n_buckets < 2 * max(1, len(entries)):
+        n_buckets *= 2
+    buckets = [0] * n_buckets
+
+    buckets_off = _HEADER.size
+    entries_off = buckets_off + 4 * n_buckets
+    blob = bytearray()
+    for key, (flags, ids) in entries.items():
+        raw = key.encode("utf-8")
+        offset = entries_off + len(blob)
+        slot = zlib.crc32(raw) & (n_buckets - 1)
+        while buckets[slot]:
+            slot = (slot + 1) & (n_buckets - 1)
+        buckets[slot] = offset
+
+        blob += _ENTRY.pack(len(raw), flags, len(ids))
+        blob += raw + b"\0" * (_align(len(raw)) - len(raw))
+        blob += _u32(sorted(ids))
+
+    name_offsets, name_blob = _string_table(names)
+    sections = [
+        name_offsets + name_blob,
+        bytes(name_kinds),
+        "\n".join(f"{kind}\t{n}" for kind, n in zip(kinds, term_counts)).encode("utf-8"),
+        "\n".join(sorted(vocabulary)).encode("utf-8"),
+    ]
+    pos = entries_off + len(blob)
+    body = bytearray(blob)
+    offsets = []
+    for section in sections:
+        offsets.append((pos, len(section)))
+        padded = section + b"\0" * (_align(len(section)) - len(section))
+        body += padded
+        pos += len(padded)
+
+    (names_off, _), (name_kinds_off, _), (kinds_off, kinds_len), (vocab_off, vocab_len) = offsets
+    header = _HEADER.pack(
+        MAGIC,
+        n_buckets,
+        len(entries),
+        len(names),
+        buckets_off,
+        entries_off,
+        names_off,
+        name_kinds_off,
+        kinds_off,
+        kinds_len,
+        vocab_off,
+        vocab_len,
+        0,
+    )
+    with open(out_path, "wb") as f:
+        f.write(header + _u32(buckets) + body)
+    return {"names": len(names), "entries": len(entries), "bytes": pos}
+
+
+# -------------------------------------------------------------------
+# Reader
+# -------------------------------------------------------------------
+class MappedLexicon:
+    """
+    Read-only view of a compiled index; nothing is decoded up front.
+    """
+
+    def __init__(self, path, max_cached_keys=50_000):
+        if sys.byteorder != "little":  # pragma: no cover
+            raise RuntimeError("compiled lexicons are little-endian")
+        self.path = str(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            self.n_buckets,
+            self.n_entries,
+            self.n_names,
+            buckets_off,
+            self._entries_off,
+            names_off,
+            name_kinds_off,
+            kinds_off,
+            kinds_len,
+            self._vocab_off,
+            self._vocab_len,
+            _,
+        ) = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a compiled lexicon")
+
+        view = memoryview(self._mm)
+        self._buckets = view[buckets_off:buckets_off + 4 * self.n_buckets].cast("I")
+        self._name_offsets = view[names_off:names_off + 4 * (self.n_names + 1)].cast("I")
+        self._names_blob = names_off + 4 * (self.n_names + 1)
+        self._name_kinds = view[name_kinds_off:name_kinds_off + self.n_names]
+        raw_kinds = bytes(view[kinds_off:kinds_off + kinds_len]).decode("utf-8")
+        lines = raw_kinds.split("\n") if raw_kinds else []
+        self.kinds = [line.rsplit("\t", 1)[0] for line in lines]
+        # terms (synonyms) per kind, as TermMatcher counts them
+        self.term_counts = [int(line.rsplit("\t", 1)[1]) for line in lines]
+        self._view = view
+        self._mask = self.n_buckets - 1
+        # histories keep using the same few thousand words: probes for them
+        # (hits and misses) are memoized per process, bounded
+        self.max_cached_keys = max_cached_keys
+        self._memo: dict = {}
+
+    def lookup(self, key: str):
+        """
+        (flags, name ids) for a space-joined token sequence, or None.
+        """
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        hit = self._probe(key)
+        if len(self._memo) < self.max_cached_keys:
+            self._memo[key] = hit
+        return hit
+
+    def _probe(self, key: str):
+        raw = key.encode("utf-8")
+        mm, buckets, mask = self._mm, self._buckets, self._mask
+        slot = zlib.crc32(raw) & mask
+        while True:
+            offset = buckets[slot]
+            if not offset:
+                return None
+            key_len, flags, n_values = _ENTRY.unpack_from(mm, offset)
+            start = offset + _ENTRY.size
+            if key_len == len(raw) and mm[start:start + key_len] == raw:
+                values = start + _align(key_len)
+                return flags, self._view[values:values + 4 * n_values].cast("I")
+            slot = (slot + 1) & mask
+
+    def name(self, name_id: int) -> str:
+        a, b = self._name_offsets[name_id], self._name_offsets[name_id + 1]
+        return self._mm[self._names_blob + a:self._names_blob + b].decode("utf-8")
+
+    def vocabulary(self) -> set[str]:
+        raw = self._mm[self._vocab_off:self._vocab_off + self._vocab_len]
+        return set(raw.decode("utf-8").split("\n")) if raw else set()
+
+    def matcher(self, kind: str) -> "MappedTermMatcher":
+        return MappedTermMatcher(self, self.kinds.index(kind) if kind in self.kinds else None)
+
+
+class MappedTermMatcher:
+    """
+    TermMatcher.match() over a MappedLexicon, restricted to one kind.
+    """
+
+    def __init__(self, lexicon: MappedLexicon, kind_id: int | None):
+        self.lexicon = lexicon
+        self.kind_id = kind_id
+
+    def __len__(self) -> int:
+        return 0 if self.kind_id is None else self.lexicon.term_counts[self.kind_id]
+
+    @property
+    def vocabulary(self) -> set[str]:
+        return self.lexicon.vocabulary()
+
+    def match(self, tokens: list[str]) -> list[str]:
+        if self.kind_id is None:
+            return []
+        lookup, kinds, kind_id = self.lexicon.lookup, self.lexicon._name_kinds, self.kind_id
+        found = set()
+        n = len(tokens)
+        for i in range(n):
+            key = tokens[i]
+            j = i + 1
+            while True:
+                hit = lookup(key)
+                if hit is None:
+                    break
+                flags, ids = hit
+                if flags & TERMINAL:
+                    found.update(name_id for name_id in ids if kinds[name_id] == kind_id)
+                if not flags & PREFIX or j == n:
+                    break
+                key = f"{key} {tokens[j]}"
+                j += 1
+        return [self.lexicon.name(name_id) for name_id in sorted(found)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a lexicon CSV into a memory-mapped index.")
+    parser.add_argument("csv", help="kind,canonical,term CSV")
+    parser.add_argument("out", help="output index path, e.g. data/lexicon.idx")
+    args = parser.parse_args()
+    counts = compile_lexicon(load_lexicon(args.csv), args.out)
+    print(f"{args.out}: {counts['names']} names, {counts['entries']} entries, {counts['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
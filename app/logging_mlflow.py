@@ -1,13 +1,578 @@
+import asyncio
+import bisect
+import logging
+import math
 import os
+import queue
+import re
+import threading
 import time
-import mlflow
+from collections import Counter
+
+logger = logging.getLogger("uvicorn.error")
 
 # Where to store runs locally (safe + simple)
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "file:./mlruns")
-mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-
 EXPERIMENT_NAME = os.getenv("MLFLOW_EXPERIMENT_NAME", "patient-qa-agent")
-mlflow.set_experiment(EXPERIMENT_NAME)
+
+# per_request: write the run inside the request (old behaviour)
+# batched: queue the record; a background thread writes each flush of
+#          queued records as ONE run (one step per record)
+# aggregate: no run per request; one run per MLFLOW_AGGREGATE_WINDOW_S window
+MLFLOW_LOG_MODE = os.getenv("MLFLOW_LOG_MODE", "batched")
+MLFLOW_AGGREGATE_WINDOW_S = float(os.getenv("MLFLOW_AGGREGATE_WINDOW_S", "60"))
+MLFLOW_QUEUE_SIZE = int(os.getenv("MLFLOW_QUEUE_SIZE", "10000"))
+MLFLOW_FLUSH_MAX = int(os.getenv("MLFLOW_FLUSH_MAX", "100"))  # records per flush
+MLFLOW_FLUSH_INTERVAL_S = float(os.getenv("MLFLOW_FLUSH_INTERVAL_S", "2"))
+# Fraction of routine runs kept once the queue is half full (blocked and
+# error runs are always kept until it is full)
+MLFLOW_OVERLOAD_SAMPLE = float(os.getenv("MLFLOW_OVERLOAD_SAMPLE", "0.1"))
+
+# mlflow is imported (and the experiment set up) on first use: importing it
+# takes over a second and set_experiment touches the tracking store.
+_mlflow = None
+_mlflow_lock = threading.Lock()
+
+
+def get_mlflow():
+    global _mlflow
+    if _mlflow is None:
+        with _mlflow_lock:
+            if _mlflow is None:
+                import mlflow
+
+                mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+                mlflow.set_experiment(EXPERIMENT_NAME)
+                _mlflow = mlflow
+    return _mlflow
+
+
+def is_loaded() -> bool:
+    return _mlflow is not None
+
+
+# -------------------------------------------------------------------
+# Run records
+# -------------------------------------------------------------------
+class RunRecord:
+    """
+    One request's (or window's) params and metrics, captured at request time.
+
+    - `keep` marks records that survive overload sampling (blocked / errors)
+    - `own_run` records (aggregate windows) get a run of their own instead
+      of a step in the flush run
+    """
+
+    __slots__ = ("params", "metrics", "timestamp_ms", "keep", "own_run")
+
+    def __init__(
+        self,
+        params: dict,
+        metrics: dict,
+        keep: bool = False,
+        timestamp_ms: int | None = None,
+        own_run: bool = False,
+    ):
+        self.params = params
+        self.metrics = metrics
+        self.timestamp_ms = int(time.time() * 1000) if timestamp_ms is None else timestamp_ms
+        self.keep = keep
+        self.own_run = own_run
+
+
+def _write_run(client, experiment_id: str, record: RunRecord) -> None:
+    # create + one log_batch + terminate: 3 store calls instead of one per value
+    from mlflow.entities import Metric, Param
+
+    ts = record.timestamp_ms
+    run = client.create_run(experiment_id, start_time=ts)
+    client.log_batch(
+        run.info.run_id,
+        metrics=[Metric(key, value, ts, 0) for key, value in record.metrics.items()],
+        params=[Param(key, str(value)) for key, value in record.params.items()],
+    )
+    client.set_terminated(run.info.run_id, end_time=ts)
+
+
+# MLflow caps one log_batch call at 1000 metrics and 100 params + tags
+_BATCH_MAX_METRICS = 1000
+_BATCH_MAX_TAGS = 100
+_KEY_UNSAFE_RE = re.compile(r"[^\w\-./ ]")
+
+
+def _step_values(record: RunRecord, step: int) -> tuple[dict, dict]:
+    """
+    (metrics, tags) of one record as step `step` of a flush run. A run
+    param holds one value, so per-request params become metrics:
+    booleans 0/1, categories `<param>_<value>` = 1; error text goes to a
+    per-step tag and model_id to a run tag.
+    """
+    metrics = dict(record.metrics)
+    tags = {}
+    for key, value in record.params.items():
+        if key == "model_id":
+            continue
+        if key == "error":
+            metrics["error"] = 1
+            tags[f"error.{step}"] = str(value)
+        elif isinstance(value, (bool, int, float)):
+            metrics[key] = float(value)
+        else:
+            metrics[_KEY_UNSAFE_RE.sub("_", f"{key}_{value}")] = 1
+    return metrics, tags
+
+
+def _default_client():
+    mlflow = get_mlflow()
+    experiment = mlflow.get_experiment_by_name(EXPERIMENT_NAME)
+    return mlflow.MlflowClient(), experiment.experiment_id
+
+
+# -------------------------------------------------------------------
+# Background writer
+# -------------------------------------------------------------------
+class MlflowWriter:
+    """
+    Bounded queue of RunRecords drained by one daemon thread, so a slow
+    tracking store never sits on the request path.
+
+    - a flush takes up to `batch_size` records, as soon as that many are
+      queued or `flush_interval_s` after the first one arrived, and writes
+      them as ONE run: record i is step i of its metrics. That is
+      create_run + one log_batch (more only past MLflow's per-call limits)
+      + set_terminated per flush, not per request
+    - past half full, routine records are sampled down to `overload_sample`;
+      once full, new records are dropped; both are counted
+    - a failed write loses the records not yet written (counted and logged);
+      the next flush reconnects
+    - stop() writes everything still queued (bounded by `timeout`)
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        *,
+        max_queue=10000,
+        batch_size=100,
+        flush_interval_s=2.0,
+        overload_sample=0.1,
+        connect=_default_client,
+    ):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.overload_sample = overload_sample
+        self._connect = connect
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._sample_credit = 0.0
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.write_errors = 0
+        self.lost = 0
+        self.flushes = 0
+        self.runs = 0
+        self.last_flush_ms: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="mlflow-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("MLflow writer queue still full at shutdown; %d records lost", self._queue.qsize())
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def submit(self, record: RunRecord) -> bool:
+        """
+        Never blocks. False when the record was sampled out or dropped.
+        """
+        self.submitted += 1
+        if not record.keep and self._queue.qsize() >= self.max_queue // 2:
+            # deterministic 1-in-N keep, no RNG on the request path
+            self._sample_credit += self.overload_sample
+            if self._sample_credit < 1.0:
+                self.sampled_out += 1
+                return False
+            self._sample_credit -= 1.0
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self) -> None:
+        client = experiment_id = None
+        stopping = False
+        while not stopping:
+            batch = []
+            first = self._queue.get()
+            if first is self._STOP:
+                break
+            batch.append(first)
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            start = time.perf_counter()
+            written_before = self.written
+            try:
+                if client is None:
+                    client, experiment_id = self._connect()
+                self._flush(client, experiment_id, batch)
+            except Exception as e:
+                lost = len(batch) - (self.written - written_before)
+                self.write_errors += 1
+                self.lost += lost
+                client = None
+                logger.warning("MLflow flush failed, %d of %d records lost: %s", lost, len(batch), e)
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    def _flush(self, client, experiment_id: str, batch: list[RunRecord]) -> None:
+        from mlflow.entities import Metric, Param, RunTag
+
+        steps = [r for r in batch if not r.own_run]
+        for record in batch:
+            if record.own_run:
+                _write_run(client, experiment_id, record)
+                self.runs += 1
+                self.written += 1
+        if not steps:
+            return
+
+        model_ids = sorted({str(r.params["model_id"]) for r in steps if "model_id" in r.params})
+        run = client.create_run(
+            experiment_id,
+            start_time=steps[0].timestamp_ms,
+            tags={"log_mode": "batched", "model_id": ",".join(model_ids)},
+        )
+        run_id = run.info.run_id
+        self.runs += 1
+
+        # whole records per log_batch call, so a failure loses a known number
+        metrics, tags, pending = [], [], 0
+        params = [Param("records", str(len(steps)))]
+        for step, record in enumerate(steps):
+            values, step_tags = _step_values(record, step)
+            if pending and (
+                len(metrics) + len(values) > _BATCH_MAX_METRICS
+                or len(params) + len(tags) + len(step_tags) > _BATCH_MAX_TAGS
+            ):
+                client.log_batch(run_id, metrics=metrics, params=params, tags=tags)
+                self.written += pending
+                metrics, tags, params, pending = [], [], [], 0
+            ts = record.timestamp_ms
+            metrics.extend(Metric(key, value, ts, step) for key, value in values.items())
+            tags.extend(RunTag(key, value[:200]) for key, value in step_tags.items())
+            pending += 1
+        client.log_batch(run_id, metrics=metrics, params=params, tags=tags)
+        self.written += pending
+        client.set_terminated(run_id, end_time=steps[-1].timestamp_ms)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "write_errors": self.write_errors,
+            "lost": self.lost,
+            "flushes": self.flushes,
+            "runs": self.runs,
+            "last_flush_ms": round(self.last_flush_ms, 1) if self.last_flush_ms is not None else None,
+        }
+
+
+mlflow_writer = MlflowWriter(
+    max_queue=MLFLOW_QUEUE_SIZE,
+    batch_size=MLFLOW_FLUSH_MAX,
+    flush_interval_s=MLFLOW_FLUSH_INTERVAL_S,
+    overload_sample=MLFLOW_OVERLOAD_SAMPLE,
+)
+
+
+def _submit(record: RunRecord) -> None:
+    # normally started by the app lifespan; scripts and tests get it on first use
+    mlflow_writer.start()
+    mlflow_writer.submit(record)
+
+
+def _log(record: RunRecord) -> None:
+    if MLFLOW_LOG_MODE == "per_request":
+        client, experiment_id = _default_client()
+        _write_run(client, experiment_id, record)
+        return
+    _submit(record)
+
+
+# -------------------------------------------------------------------
+# Windowed aggregation
+# -------------------------------------------------------------------
+# Latency buckets (ms), 12% apart from 1 ms to ~2 min: a percentile read
+# back from the histogram is within 12% of the exact one
+_LATENCY_BOUNDS_MS = tuple(round(1.12**k, 1) for k in range(104))
+
+# Count distributions: 0, 1, ... and one open bucket from _COUNT_CAP up
+_COUNT_CAP = 5
+_COUNT_FIELDS = ("symptoms", "conditions", "diagnoses")
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram: constant memory whatever the traffic.
+    """
+
+    def __init__(self, bounds=_LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.n += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float | None:
+        """
+        Upper bound of the bucket holding the q-th sample (capped at the max).
+        """
+        if not self.n:
+            return None
+        rank = max(1, math.ceil(q * self.n))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(upper, self.max)
+        return self.max
+
+
+class MetricsWindow:
+    """
+    Counters and histograms for one time window. Rates are per question
+    (an /ask call or one /ask/batch item); the count distributions are per
+    /ask call, since a batch only reports totals.
+    """
+
+    def __init__(self, start_s: float):
+        self.start_s = start_s
+        self.model_ids: set[str] = set()
+        self.asks = 0
+        self.batches = 0
+        self.items = 0
+        self.blocked = 0
+        self.errors = 0
+        self.blocked_categories: Counter = Counter()
+        self.latency = LatencyHistogram()
+        self.counts = {field: Counter() for field in _COUNT_FIELDS}
+
+    def metrics(self) -> dict:
+        items = max(1, self.items)
+        out = {
+            "asks": self.asks,
+            "batches": self.batches,
+            "items": self.items,
+            "blocked_count": self.blocked,
+            "blocked_rate": round(self.blocked / items, 4),
+            "error_count": self.errors,
+            "error_rate": round(self.errors / items, 4),
+        }
+        for category, count in sorted(self.blocked_categories.items()):
+            out[f"blocked_{category}_count"] = count
+        if self.latency.n:
+            for q in (50, 90, 99):
+                out[f"latency_ms_p{q}"] = self.latency.percentile(q / 100)
+            out["latency_ms_max"] = self.latency.max
+            out["latency_ms_mean"] = round(self.latency.total / self.latency.n, 1)
+        for field, dist in self.counts.items():
+            if not dist:
+                continue
+            for k in range(_COUNT_CAP):
+                out[f"{field}_count_{k}"] = dist[k]
+            out[f"{field}_count_{_COUNT_CAP}plus"] = dist[_COUNT_CAP]
+        return out
+
+
+class WindowAggregator:
+    """
+    Folds log_ask_run / log_batch_run calls into per-window counters and
+    histograms and hands each closed window to `sink` as ONE run, so the
+    tracking store grows with time, not with traffic.
+
+    Windows are aligned to the wall clock (window_s apart). A window closes
+    when a call lands in the next one, on the start_flushing() timer, or on
+    flush(); windows without any call log nothing.
+    """
+
+    def __init__(self, window_s=60.0, sink=None, clock=time.time):
+        self.window_s = window_s
+        self._sink = sink or _submit
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window: MetricsWindow | None = None
+        self._flush_task = None
+        self.windows_logged = 0
+
+    def _record(self, window: MetricsWindow) -> RunRecord:
+        params = {
+            "mode": "aggregate",
+            "window_s": self.window_s,
+            "window_start": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(window.start_s)),
+            "model_id": ",".join(sorted(window.model_ids)),
+        }
+        return RunRecord(
+            params, window.metrics(), keep=True, timestamp_ms=int(window.start_s * 1000), own_run=True
+        )
+
+    def _current(self, model_id: str) -> tuple[MetricsWindow, MetricsWindow | None]:
+        # caller holds the lock
+        now = self._clock()
+        start = now - now % self.window_s
+        closed = None
+        if self._window is not None and self._window.start_s != start:
+            closed, self._window = self._window, None
+        if self._window is None:
+            self._window = MetricsWindow(start)
+        self._window.model_ids.add(model_id)
+        return self._window, closed
+
+    def _emit(self, closed: MetricsWindow | None) -> None:
+        if closed is not None:
+            self.windows_logged += 1
+            self._sink(self._record(closed))
+
+    def add_ask(
+        self,
+        *,
+        model_id: str,
+        is_blocked: bool,
+        latency_ms: float,
+        symptoms_count: int,
+        conditions_count: int,
+        diagnoses_count: int,
+        error: str | None = None,
+        blocked_category: str | None = None,
+    ) -> None:
+        with self._lock:
+            window, closed = self._current(model_id)
+            window.asks += 1
+            window.items += 1
+            window.blocked += bool(is_blocked)
+            window.errors += bool(error)
+            if is_blocked and blocked_category:
+                window.blocked_categories[blocked_category] += 1
+            window.latency.add(latency_ms)
+            for field, count in zip(_COUNT_FIELDS, (symptoms_count, conditions_count, diagnoses_count)):
+                window.counts[field][min(count, _COUNT_CAP)] += 1
+        self._emit(closed)
+
+    def add_batch(
+        self,
+        *,
+        model_id: str,
+        batch_size: int,
+        blocked_count: int,
+        error_count: int,
+        item_latencies_ms: list[int],
+        blocked_categories: dict[str, int] | None = None,
+    ) -> None:
+        with self._lock:
+            window, closed = self._current(model_id)
+            window.batches += 1
+            window.items += batch_size
+            window.blocked += blocked_count
+            window.errors += error_count
+            window.blocked_categories.update(blocked_categories or {})
+            for ms in item_latencies_ms:
+                window.latency.add(ms)
+        self._emit(closed)
+
+    def roll(self) -> bool:
+        """
+        Closes the current window if its time is up. True if one was logged.
+        """
+        now = self._clock()
+        with self._lock:
+            window = self._window
+            if window is None or now < window.start_s + self.window_s:
+                return False
+            self._window = None
+        self._emit(window)
+        return True
+
+    def flush(self) -> None:
+        """
+        Logs the current (partial) window, e.g. at shutdown.
+        """
+        with self._lock:
+            window, self._window = self._window, None
+        self._emit(window)
+
+    def start_flushing(self) -> None:
+        async def loop():
+            while True:
+                await asyncio.sleep(self.window_s)
+                self.roll()
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(loop())
+
+    async def stop_flushing(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.flush()
+
+    def stats(self) -> dict:
+        window = self._window
+        return {
+            "window_s": self.window_s,
+            "windows_logged": self.windows_logged,
+            "current_items": window.items if window is not None else 0,
+        }
+
+
+window_aggregator = WindowAggregator(MLFLOW_AGGREGATE_WINDOW_S)
 
 
 def log_ask_run(
@@ -19,18 +584,94 @@ def log_ask_run(
     conditions_count: int,
     diagnoses_count: int,
     error: str | None = None,
+    context_tokens: int | None = None,
+    context_tokens_trimmed: int | None = None,
+    blocked_category: str | None = None,
+    blocked_by: str | None = None,
 ):
     """
     Logs ONLY safe metadata. Do NOT log raw medical history, symptoms text, or user questions.
     """
-    with mlflow.start_run():
-        mlflow.log_param("model_id", model_id)
-        mlflow.log_param("is_blocked", is_blocked)
+    if MLFLOW_LOG_MODE == "aggregate":
+        window_aggregator.add_ask(
+            model_id=model_id,
+            is_blocked=is_blocked,
+            latency_ms=latency_ms,
+            symptoms_count=symptoms_count,
+            conditions_count=conditions_count,
+            diagnoses_count=diagnoses_count,
+            error=error,
+            blocked_category=blocked_category,
+        )
+        return
+
+    params = {"model_id": model_id, "is_blocked": is_blocked}
+    if blocked_category:
+        params["blocked_category"] = blocked_category
+    if blocked_by:
+        params["blocked_by"] = blocked_by
+    if error:
+        params["error"] = error[:200]  # keep short
+
+    metrics = {
+        "latency_ms": latency_ms,
+        "symptoms_count": symptoms_count,
+        "conditions_count": conditions_count,
+        "diagnoses_count": diagnoses_count,
+    }
+    if context_tokens is not None:
+        metrics["context_tokens"] = context_tokens
+        metrics["context_tokens_trimmed"] = context_tokens_trimmed or 0
+
+    _log(RunRecord(params, metrics, keep=is_blocked or bool(error)))
+
+
+def log_batch_run(
+    *,
+    model_id: str,
+    batch_size: int,
+    blocked_count: int,
+    invalid_count: int,
+    error_count: int,
+    latency_ms: int,
+    item_latencies_ms: list[int],
+    symptoms_count: int,
+    conditions_count: int,
+    blocked_categories: dict[str, int] | None = None,
+):
+    """
+    One run per /ask/batch call (not per item). Same rule: safe metadata only.
+    """
+    if MLFLOW_LOG_MODE == "aggregate":
+        window_aggregator.add_batch(
+            model_id=model_id,
+            batch_size=batch_size,
+            blocked_count=blocked_count,
+            error_count=error_count,
+            item_latencies_ms=item_latencies_ms,
+            blocked_categories=blocked_categories,
+        )
+        return
 
-        mlflow.log_metric("latency_ms", latency_ms)
-        mlflow.log_metric("symptoms_count", symptoms_count)
-        mlflow.log_metric("conditions_count", conditions_count)
-        mlflow.log_metric("diagnoses_count", diagnoses_count)
+    ordered = sorted(item_latencies_ms)
+    metrics = {"batch_size": batch_size, "blocked_count": blocked_count}
+    for category, count in (blocked_categories or {}).items():
+        metrics[f"blocked_{category}_count"] = count
+    metrics.update(
+        invalid_count=invalid_count,
+        error_count=error_count,
+        latency_ms=latency_ms,
+        symptoms_count=symptoms_count,
+        conditions_count=conditions_count,
+    )
+    if ordered:
+        metrics["item_latency_ms_p50"] = ordered[len(ordered) // 2]
+        metrics["item_latency_ms_max"] = ordered[-1]
 
-        if error:
-            mlflow.log_param("error", error[:200])  # keep short
+    _log(
+        RunRecord(
+            {"model_id": model_id, "endpoint": "ask_batch"},
+            metrics,
+            keep=bool(blocked_count or error_count),
+        )
+    )
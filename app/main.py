@@ -1,23 +1,129 @@
 # app/main.py
+from app.startup import StartupTracker
+
+# Created first so the startup breakdown includes the imports below
+startup = StartupTracker()
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
+import json
 import os
 import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.ui import router as ui_router
-from app.schemas import QuestionRequest, AnswerResponse
-from app.nlp import extract_conditions, extract_symptoms
-from app.safety import check_safety
-from app.logging_mlflow import log_ask_run
-from app.models import query_huggingface_chat, MODEL_ID
+from app.schemas import (
+    QuestionRequest,
+    AnswerResponse,
+    BatchQuestionRequest,
+    BatchAnswerItem,
+    BatchAnswerResponse,
+)
+from app.context import build_context
+from app import logging_mlflow, nlp
+from app.nlp import extract_entities_batch
+from app.nlp_pool import nlp_pool
+from app.safety import (
+    INTENT_MODEL_PATH,
+    SAFETY_RULES_RELOAD_S,
+    classify_safety,
+    classify_safety_batch,
+    get_intent_model,
+    is_intent_model_loaded,
+    rules as safety_rules,
+)
+from app.logging_mlflow import (
+    MLFLOW_LOG_MODE,
+    log_ask_run,
+    log_batch_run,
+    mlflow_writer,
+    window_aggregator,
+)
+from app.models import (
+    aquery_huggingface_chat,
+    astream_huggingface_chat,
+    aclose_clients,
+    backend_pool,
+    BACKEND_HEALTH_CHECK_S,
+    breaker,
+    generation,
+    hedger,
+    inflight,
+    limiter,
+    Overloaded,
+    response_cache,
+    retry_policy,
+    MODEL_ID,
+)
+
+startup.record("import", time.perf_counter() - startup.started)
+
+# Load spaCy/mlflow and open upstream connections in the background after
+# startup (0 = load everything lazily on first use)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+
+def _warm_nlp() -> None:
+    extract_entities_batch(["warm-up: diabetic with headaches"])
+
+
+async def warm_up() -> None:
+    """
+    Background warm-up; /health answers meanwhile, /ready reports progress.
+    """
+    with startup.phase("nlp"):
+        await run_in_threadpool(_warm_nlp)
+    with startup.phase("mlflow"):
+        await run_in_threadpool(logging_mlflow.get_mlflow)
+    if nlp_pool.enabled:
+        with startup.phase("nlp_pool"):
+            await nlp_pool.warm_up()
+    if INTENT_MODEL_PATH:
+        with startup.phase("intent_model"):
+            await run_in_threadpool(get_intent_model)
+    with startup.phase("upstream"):
+        # Builds the clients and opens a pooled connection to every backend
+        results = await backend_pool.check_all()
+        if not any(results.values()):
+            raise RuntimeError("no backend answered GET /models")
+    startup.log_breakdown()
+
 
 # ---------------------------------------------------------
 # FastAPI app (this is what uvicorn looks for)
 # ---------------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_task = asyncio.create_task(warm_up()) if WARMUP else None
+    if not WARMUP:
+        startup.log_breakdown()
+    if BACKEND_HEALTH_CHECK_S > 0:
+        backend_pool.start_health_checks(BACKEND_HEALTH_CHECK_S)
+    nlp_pool.start()
+    mlflow_writer.start()
+    if MLFLOW_LOG_MODE == "aggregate":
+        window_aggregator.start_flushing()
+    if SAFETY_RULES_RELOAD_S > 0:
+        safety_rules.start_watching(SAFETY_RULES_RELOAD_S)
+    yield
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+    await safety_rules.stop_watching()
+    nlp_pool.shutdown()
+    # Log the open window, then write the runs still queued before the process exits
+    await window_aggregator.stop_flushing()
+    await run_in_threadpool(mlflow_writer.stop)
+    # Release pooled upstream connections on shutdown
+    await aclose_clients()
+
+
 app = FastAPI(
     title="Patient Medical History Q&A Assistant (Non-Clinical)",
     description=(
@@ -25,6 +131,7 @@ app = FastAPI(
         "based on user-provided medical history and diagnoses."
     ),
     version="0.2.0",
+    lifespan=lifespan,
 )
 
 # UI demo page (/demo)
@@ -39,22 +146,152 @@ def health_check():
     return {"status": "ok", "message": "Server is running!"}
 
 
+# Warm-up phases /ready waits for (when WARMUP is on)
+READY_REQUIRES = ("nlp", "mlflow", "nlp_pool", "intent_model")
+
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness probe: 200 once the warm-up has loaded spaCy, mlflow and, when
+    configured, the NLP pool and the intent model (a first request loading
+    them counts too), else 503. With WARMUP=0 nothing is preloaded, so it
+    is ready at once. Upstream state is reported, not required (the circuit
+    breaker serves the fallback answer without it).
+    """
+    components = {
+        "nlp": startup.component("nlp", nlp.is_loaded()),
+        "mlflow": startup.component("mlflow", logging_mlflow.is_loaded()),
+        "nlp_pool": startup.component("nlp_pool", enabled=nlp_pool.enabled),
+        "intent_model": startup.component(
+            "intent_model", is_intent_model_loaded(), enabled=bool(INTENT_MODEL_PATH)
+        ),
+        "upstream": startup.component("upstream", backend_pool.is_warm()),
+    }
+    ready = not WARMUP or all(
+        components[c]["state"] in (StartupTracker.READY, StartupTracker.OFF) for c in READY_REQUIRES
+    )
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "components": components,
+            "import_s": round(startup.seconds.get("import", 0.0), 3),
+        },
+    )
+
+
 @app.get("/debug/token")
 def debug_token():
     t = os.getenv("HUGGINGFACE_API_TOKEN")
     return {"token_loaded": bool(t), "token_prefix": (t[:6] if t else None)}
 
 
+@app.get("/debug/stats")
+def debug_stats():
+    """
+    Performance counters (no request content).
+    """
+    return {
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+        "single_flight": inflight.stats(),
+        "hedging": hedger.stats(),
+        "retries": retry_policy.stats(),
+        "circuit_breaker": breaker.stats(),
+        "backends": backend_pool.stats(),
+        "admission": limiter.stats(),
+        "generation": {name: tuner.stats() for name, tuner in generation.items()},
+        "safety_rules": safety_rules.stats(),
+        "nlp_cache": nlp.entity_cache.stats() if nlp.entity_cache is not None else None,
+        "nlp_pool": nlp_pool.stats(),
+        "mlflow_writer": mlflow_writer.stats(),
+        "mlflow_window": window_aggregator.stats() if MLFLOW_LOG_MODE == "aggregate" else None,
+    }
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "service": "patient-qa-agent"}
 
 
+NOTE = "This explanation is for educational purposes only and not medical advice."
+
+BUSY_ANSWER = (
+    "The assistant is busy right now. Please try again in a few seconds. "
+    "This is for educational purposes only and not medical advice."
+)
+
+
+def _overloaded_response(retry_after_s: int) -> JSONResponse:
+    """
+    503 for shed requests. Deliberately cheap: no NLP, no MLflow run
+    (the limiter counts rejections; see /debug/stats).
+    """
+    return JSONResponse(
+        status_code=503,
+        content=AnswerResponse(answer=BUSY_ANSWER, note=NOTE).model_dump(),
+        headers={"Retry-After": str(retry_after_s)},
+    )
+
+
+# Safety rules and the intent model run on the event loop, on the question
+# text: its length bounds their cost
+QUESTION_MAX_CHARS = int(os.getenv("QUESTION_MAX_CHARS", "1000"))
+
+# /ask/batch limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # LLM calls in flight per batch
+
+
+# ---------------------------------------------------------
+# Shared request helpers (/ask and /ask/stream)
+# ---------------------------------------------------------
+def _validate_request(request: QuestionRequest) -> str | None:
+    """
+    Returns the 400 answer text if the request is invalid, else None.
+    """
+    # 1) HARD GUARD: require a question
+    if not request.question or not request.question.strip():
+        return (
+            "Please provide a question. The system only responds when a question is provided. "
+            "This is for educational purposes only and not medical advice."
+        )
+    if len(request.question) > QUESTION_MAX_CHARS:
+        return (
+            f"Please keep the question under {QUESTION_MAX_CHARS} characters. "
+            "This is for educational purposes only and not medical advice."
+        )
+
+    # 2) HARD GUARD: require medical context
+    #    (at least one of history / diagnoses / symptoms),
+    #    unless allow_no_context=True is set (for generic tests)
+    has_context = any(
+        [
+            bool((request.medical_history or "").strip()),
+            bool(request.diagnoses),
+            bool(request.symptoms),
+        ]
+    )
+
+    if not has_context and not getattr(request, "allow_no_context", False):
+        return (
+            "Please provide at least one of the following before asking a question:\n"
+            "• medical history\n"
+            "• diagnoses\n"
+            "• symptoms\n\n"
+            "This assistant can only explain questions in the context of "
+            "user-provided medical information. "
+            "This is for educational purposes only and not medical advice."
+        )
+
+    return None
+
+
 # ---------------------------------------------------------
 # Main /ask endpoint (chat-style, with context)
 # ---------------------------------------------------------
 @app.post("/ask", response_model=AnswerResponse)
-def ask_question(request: QuestionRequest, response: Response):
+async def ask_question(request: QuestionRequest, response: Response):
     """
     Main educational Q&A endpoint.
     - Enforces question presence
@@ -62,58 +299,33 @@ def ask_question(request: QuestionRequest, response: Response):
     - Runs safety gate
     - Builds chat-style context for the model
     - Logs only safe metadata to MLflow
+
+    The endpoint is async: the LLM calls are awaited on the event loop,
+    while spaCy and MLflow (blocking, CPU/disk) run in the threadpool.
     """
     start = time.perf_counter()
     error_msg = None
 
     try:
-        # 1) HARD GUARD: require a question
-        if not request.question or not request.question.strip():
+        # 1-2) HARD GUARDS: question + medical context
+        invalid = _validate_request(request)
+        if invalid:
             response.status_code = 400
-            return AnswerResponse(
-                answer=(
-                    "Please provide a question. The system only responds when a question is provided. "
-                    "This is for educational purposes only and not medical advice."
-                ),
-                note="This explanation is for educational purposes only and not medical advice.",
-            )
-
-        # 2) HARD GUARD: require medical context
-        #    (at least one of history / diagnoses / symptoms),
-        #    unless allow_no_context=True is set (for generic tests)
-        has_context = any(
-            [
-                bool((request.medical_history or "").strip()),
-                bool(request.diagnoses),
-                bool(request.symptoms),
-            ]
-        )
-
-        if not has_context and not getattr(request, "allow_no_context", False):
-            response.status_code = 400
-            return AnswerResponse(
-                answer=(
-                    "Please provide at least one of the following before asking a question:\n"
-                    "• medical history\n"
-                    "• diagnoses\n"
-                    "• symptoms\n\n"
-                    "This assistant can only explain questions in the context of "
-                    "user-provided medical information. "
-                    "This is for educational purposes only and not medical advice."
-                ),
-                note="This explanation is for educational purposes only and not medical advice.",
-            )
+            return AnswerResponse(answer=invalid, note=NOTE)
 
         # 3) Safety gate (blocks diagnosis / treatment advice / medication changes)
-        refusal = check_safety(request.question)
-        if refusal:
+        safety = classify_safety(request.question)
+        if safety.blocked:
             latency_ms = int((time.perf_counter() - start) * 1000)
             response.headers["x-latency-ms"] = str(latency_ms)
 
-            # Log safe metadata only (no PHI)
-            log_ask_run(
+            # Log safe metadata only (no PHI): the category, never the text
+            await run_in_threadpool(
+                log_ask_run,
                 model_id=MODEL_ID,
                 is_blocked=True,
+                blocked_category=safety.category,
+                blocked_by=safety.source,
                 latency_ms=latency_ms,
                 symptoms_count=0,
                 conditions_count=0,
@@ -121,50 +333,27 @@ def ask_question(request: QuestionRequest, response: Response):
                 error=None,
             )
 
-            return AnswerResponse(
-                answer=refusal,
-                note="This explanation is for educational purposes only and not medical advice.",
-            )
+            return AnswerResponse(answer=safety.refusal, note=NOTE)
 
         # 4) NLP extraction (simple keyword-based from medical_history)
-        conditions = extract_conditions(request.medical_history or "")
-        symptoms_found = extract_symptoms(request.medical_history or "")
-
-        # 5) Build chat-style context (for this request only, not persisted)
-        context_block = (
-            "User-provided context (do not diagnose; explain educationally only):\n"
-            f"- Medical history: {request.medical_history or '(none)'}\n"
-            f"- Known diagnoses: {request.diagnoses or []}\n"
-            f"- Symptoms list (form): {request.symptoms or []}\n"
-            f"- Extracted conditions (NLP): {conditions or []}\n"
-            f"- Extracted symptoms (NLP): {symptoms_found or []}\n"
+        conditions, symptoms_found = await nlp_pool.extract_entities(
+            request.medical_history or ""
         )
 
-        # Frontend chat messages (already trimmed to short history, but we enforce again)
-        incoming = getattr(request, "messages", []) or []
-        incoming = incoming[-8:]  # keep last 8 messages max
-
-        # This list is passed to query_huggingface_chat, which will add its own system prompt
-        chat_messages = [
-            {"role": "user", "content": context_block},
-        ]
-
-        # Add prior conversation turns
-        for m in incoming:
-            # m is a Pydantic model; use its fields
-            chat_messages.append({"role": m.role, "content": m.content})
-
-        # Final user question (always last)
-        chat_messages.append({"role": "user", "content": request.question.strip()})
+        # 5) Build chat-style context within the input token budget
+        chat_messages, context = build_context(request, conditions, symptoms_found)
+        response.headers["x-context-tokens"] = str(context.tokens_used)
+        response.headers["x-context-tokens-trimmed"] = str(context.tokens_trimmed)
 
         # 6) LLM call (chat-based with multi-turn context)
-        answer_text = query_huggingface_chat(chat_messages)
+        answer_text = await aquery_huggingface_chat(chat_messages)
 
         latency_ms = int((time.perf_counter() - start) * 1000)
         response.headers["x-latency-ms"] = str(latency_ms)
 
         # 7) Log safe metadata only (no raw text)
-        log_ask_run(
+        await run_in_threadpool(
+            log_ask_run,
             model_id=MODEL_ID,
             is_blocked=False,
             latency_ms=latency_ms,
@@ -172,12 +361,15 @@ def ask_question(request: QuestionRequest, response: Response):
             conditions_count=len(conditions) if conditions else 0,
             diagnoses_count=len(request.diagnoses or []),
             error=None,
+            context_tokens=context.tokens_used,
+            context_tokens_trimmed=context.tokens_trimmed,
         )
 
-        return AnswerResponse(
-            answer=answer_text,
-            note="This explanation is for educational purposes only and not medical advice.",
-        )
+        return AnswerResponse(answer=answer_text, note=NOTE)
+
+    except Overloaded as e:
+        # Shed by admission control: fail fast so the client can retry
+        return _overloaded_response(e.retry_after_s)
 
     except Exception as e:
         # 8) Error handling + logging (no PHI)
@@ -185,7 +377,8 @@ def ask_question(request: QuestionRequest, response: Response):
         latency_ms = int((time.perf_counter() - start) * 1000)
         response.headers["x-latency-ms"] = str(latency_ms)
 
-        log_ask_run(
+        await run_in_threadpool(
+            log_ask_run,
             model_id=MODEL_ID,
             is_blocked=False,
             latency_ms=latency_ms,
@@ -196,7 +389,204 @@ def ask_question(request: QuestionRequest, response: Response):
         )
 
         response.status_code = 500
-        return AnswerResponse(
-            answer=f"Internal error: {error_msg}",
-            note="This explanation is for educational purposes only and not medical advice.",
+        return AnswerResponse(answer=f"Internal error: {error_msg}", note=NOTE)
+
+
+# ---------------------------------------------------------
+# Streaming /ask/stream endpoint (server-sent events)
+# ---------------------------------------------------------
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Same contract as /ask, but streams the answer as server-sent events:
+    - event "token": {"text": ...} pass-1 text as it is generated
+    - event "reset": {"reason": ...} the output guard tripped; discard tokens
+    - event "final": {"answer", "note", "latency_ms"} the complete answer
+    - event "error": {"error": ...} (plus "retry_after_s" when shed)
+
+    Invalid requests get the same 400 JSON body as /ask, and requests shed
+    by admission control the same 503.
+    """
+    start = time.perf_counter()
+
+    invalid = _validate_request(request)
+    if invalid:
+        return JSONResponse(
+            status_code=400,
+            content=AnswerResponse(answer=invalid, note=NOTE).model_dump(),
         )
+
+    diagnoses_count = len(request.diagnoses or [])
+    safety = classify_safety(request.question)
+    refusal = safety.refusal
+
+    # Shed before the 200 + event stream starts when the queue is already full
+    if not refusal:
+        try:
+            limiter.check_queue()
+        except Overloaded as e:
+            return _overloaded_response(e.retry_after_s)
+
+    async def events():
+        conditions, symptoms_found = [], []
+        context = None
+        error_msg = None
+        try:
+            if refusal:
+                answer = refusal
+            else:
+                conditions, symptoms_found = await nlp_pool.extract_entities(
+                    request.medical_history or ""
+                )
+                chat_messages, context = build_context(
+                    request, conditions, symptoms_found
+                )
+
+                answer = ""
+                async for event, text in astream_huggingface_chat(chat_messages):
+                    if event == "token":
+                        yield _sse("token", {"text": text})
+                    elif event == "reset":
+                        yield _sse("reset", {"reason": text})
+                    else:
+                        answer = text
+
+            latency_ms = int((time.perf_counter() - start) * 1000)
+            yield _sse(
+                "final", {"answer": answer, "note": NOTE, "latency_ms": latency_ms}
+            )
+
+        except Overloaded as e:
+            # Shed after the stream started (queue wait timed out)
+            error_msg = repr(e)
+            latency_ms = int((time.perf_counter() - start) * 1000)
+            yield _sse("error", {"error": BUSY_ANSWER, "retry_after_s": e.retry_after_s})
+
+        except Exception as e:
+            error_msg = repr(e)
+            latency_ms = int((time.perf_counter() - start) * 1000)
+            yield _sse("error", {"error": f"Internal error: {error_msg}"})
+
+        # Log safe metadata only (no raw text)
+        await run_in_threadpool(
+            log_ask_run,
+            model_id=MODEL_ID,
+            is_blocked=safety.blocked,
+            blocked_category=safety.category,
+            blocked_by=safety.source if safety.blocked else None,
+            latency_ms=latency_ms,
+            symptoms_count=len(symptoms_found),
+            conditions_count=len(conditions),
+            diagnoses_count=diagnoses_count,
+            error=error_msg,
+            context_tokens=context.tokens_used if context else None,
+            context_tokens_trimmed=context.tokens_trimmed if context else None,
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------------------------------------------------
+# Bulk /ask/batch endpoint
+# ---------------------------------------------------------
+@app.post("/ask/batch", response_model=BatchAnswerResponse)
+async def ask_batch(batch: BatchQuestionRequest, response: Response):
+    """
+    Answers many /ask requests in one call, in order.
+    - Same guards and safety gate as /ask, per item
+    - NLP extraction for all items in one nlp.pipe pass
+    - At most BATCH_CONCURRENCY LLM calls in flight
+    - One MLflow run for the whole batch
+
+    Each item carries the status /ask would have returned for it; a batch
+    over BATCH_MAX_ITEMS is rejected as a whole with 413.
+    """
+    start = time.perf_counter()
+
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch can hold at most {BATCH_MAX_ITEMS} questions.",
+        )
+
+    results: list[BatchAnswerItem | None] = [None] * len(batch.items)
+
+    # 1-3) Guards + safety gate (cheap, inline)
+    valid = []
+    for i, request in enumerate(batch.items):
+        invalid = _validate_request(request)
+        if invalid:
+            results[i] = BatchAnswerItem(index=i, status=400, answer=invalid, latency_ms=0)
+        else:
+            valid.append(i)
+
+    pending = []
+    blocked_categories: dict[str, int] = {}
+    checks = classify_safety_batch([batch.items[i].question for i in valid])
+    for i, safety in zip(valid, checks):
+        if safety.blocked:
+            results[i] = BatchAnswerItem(
+                index=i, status=200, answer=safety.refusal, blocked=True, latency_ms=0
+            )
+            blocked_categories[safety.category] = blocked_categories.get(safety.category, 0) + 1
+            continue
+        pending.append(i)
+
+    # 4) NLP extraction for every remaining item in one pass
+    entities = await run_in_threadpool(
+        extract_entities_batch,
+        [batch.items[i].medical_history or "" for i in pending],
+    )
+
+    # 5-6) Context + LLM calls, bounded
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer(i: int, conditions, symptoms_found) -> BatchAnswerItem:
+        async with semaphore:
+            item_start = time.perf_counter()
+            try:
+                chat_messages, _ = build_context(batch.items[i], conditions, symptoms_found)
+                text = await aquery_huggingface_chat(chat_messages)
+                status = 200
+            except Overloaded:
+                text = BUSY_ANSWER
+                status = 503
+            except Exception as e:
+                text = f"Internal error: {repr(e)}"
+                status = 500
+            latency_ms = int((time.perf_counter() - item_start) * 1000)
+        return BatchAnswerItem(index=i, status=status, answer=text, latency_ms=latency_ms)
+
+    answered = await asyncio.gather(
+        *(answer(i, c, s) for i, (c, s) in zip(pending, entities))
+    )
+    for item in answered:
+        results[item.index] = item
+
+    latency_ms = int((time.perf_counter() - start) * 1000)
+    response.headers["x-latency-ms"] = str(latency_ms)
+
+    # 7) One run for the batch, safe metadata only
+    await run_in_threadpool(
+        log_batch_run,
+        model_id=MODEL_ID,
+        batch_size=len(results),
+        blocked_count=sum(r.blocked for r in results),
+        blocked_categories=blocked_categories,
+        invalid_count=sum(r.status == 400 for r in results),
+        error_count=sum(r.status >= 500 for r in results),
+        latency_ms=latency_ms,
+        item_latencies_ms=[r.latency_ms for r in answered],
+        symptoms_count=sum(len(s) for _, s in entities),
+        conditions_count=sum(len(c) for c, _ in entities),
+    )
+
+    return BatchAnswerResponse(items=results, note=NOTE, latency_ms=latency_ms)
@@ -0,0 +1,304 @@
+"""
+Local stand-in for the Hugging Face router (OpenAI-compatible chat completions).
+
+Lets /ask be load-tested offline, with configurable latency, token rate,
+failures and canned answers that trip the reasoning/advice filters.
+
+Run:
+    uvicorn app.mock_router:app --port 9000
+    # or: python -m app.mock_router --port 9000 --latency lognormal:400,0.6 --error-rate 0.02
+
+Then start the API against it:
+    HF_BASE_URL=http://127.0.0.1:9000/v1 uvicorn app.main:app
+
+Settings come from MOCK_* env vars (see MockConfig) and can be changed at
+runtime with POST /_config; counters are at GET /_stats.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DISCLAIMER = "This is for educational purposes only and not medical advice."
+
+CLEAN_ANSWER = (
+    "Type 2 diabetes is a long-term condition that affects how the body uses glucose for energy. "
+    "In this condition the body either resists the effects of insulin or does not produce enough "
+    "of it to keep blood glucose in a typical range. Higher glucose levels can draw water from "
+    "tissues, which is one reason increased thirst and tiredness are commonly described. "
+    "Healthcare professionals look at the full clinical picture when they discuss these symptoms. "
+    + DISCLAIMER
+)
+
+# Trips REASONING_MARKERS (pass 2 gets exercised)
+REASONING_ANSWER = (
+    "We need to explain type 2 diabetes without giving advice. Reasoning: the user mentions "
+    "fatigue and thirst, so we must connect these to glucose regulation. "
+    + CLEAN_ANSWER
+)
+
+# Trips ADVICE_MARKERS (pass 3 gets exercised)
+ADVICE_ANSWER = (
+    "Type 2 diabetes affects how the body uses glucose. You should talk to your doctor about "
+    "your symptoms, try to stay hydrated and exercise regularly to manage blood sugar. "
+    + DISCLAIMER
+)
+
+
+@dataclass
+class MockConfig:
+    # Time to first token. One of:
+    #   fixed:MS | uniform:MIN_MS,MAX_MS | lognormal:MEDIAN_MS,SIGMA | exp:MEAN_MS
+    latency: str = "lognormal:300,0.5"
+    tokens_per_s: float = 60.0
+    error_rate: float = 0.0  # HTTP 500/503
+    rate_limit_rate: float = 0.0  # HTTP 429
+    timeout_rate: float = 0.0  # hang for timeout_s before answering
+    timeout_s: float = 120.0
+    reasoning_rate: float = 0.0  # pass-1 answers with reasoning leakage
+    advice_rate: float = 0.0  # pass-1/pass-2 answers with advice
+    seed: int | None = None
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        cfg = cls()
+        for f in fields(cls):
+            raw = os.getenv(f"MOCK_{f.name.upper()}")
+            if raw is not None:
+                cfg.update({f.name: raw})
+        return cfg
+
+    def update(self, values: dict) -> None:
+        for f in fields(self):
+            if f.name not in values:
+                continue
+            raw = values[f.name]
+            if f.name == "latency":
+                setattr(self, f.name, str(raw))
+            elif f.name == "seed":
+                setattr(self, f.name, None if raw in (None, "") else int(raw))
+            else:
+                setattr(self, f.name, float(raw))
+
+
+def sample_latency_ms(spec: str, rng: random.Random) -> float:
+    kind, _, args = spec.partition(":")
+    params = [float(a) for a in args.split(",") if a]
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return rng.uniform(params[0], params[1])
+    if kind == "lognormal":
+        return rng.lognormvariate(math.log(params[0]), params[1])
+    if kind == "exp":
+        return rng.expovariate(1.0 / params[0])
+    raise ValueError(f"unknown latency distribution: {spec!r}")
+
+
+def _tokenize(text: str) -> list[str]:
+    # Word-level "tokens" (keep the separating space with each word)
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def _apply_limits(text: str, max_tokens: int | None, stop) -> tuple[str, str]:
+    """
+    Truncate like a real server: at the first stop sequence, then at max_tokens.
+    Returns (text, finish_reason).
+    """
+    for s in [stop] if isinstance(stop, str) else (stop or []):
+        idx = text.find(s)
+        if idx >= 0:
+            text = text[:idx]
+
+    tokens = _tokenize(text)
+    if max_tokens is not None and len(tokens) > max_tokens:
+        return "".join(tokens[:max_tokens]), "length"
+    return text, "stop"
+
+
+class MockRouter:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats = {
+            "requests": 0,
+            "streams": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "timeouts": 0,
+            "reasoning_answers": 0,
+            "advice_answers": 0,
+            "completion_tokens": 0,
+        }
+
+    def pick_answer(self, messages: list[dict]) -> str:
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        roll = self.rng.random()
+
+        if system.startswith("Rewrite to remove ALL advice"):
+            return CLEAN_ANSWER  # pass 3
+        if system.startswith("Rewrite"):
+            # pass 2
+            if roll < self.config.advice_rate:
+                self.stats["advice_answers"] += 1
+                return ADVICE_ANSWER
+            return CLEAN_ANSWER
+
+        if roll < self.config.reasoning_rate:
+            self.stats["reasoning_answers"] += 1
+            return REASONING_ANSWER
+        if roll < self.config.reasoning_rate + self.config.advice_rate:
+            self.stats["advice_answers"] += 1
+            return ADVICE_ANSWER
+        return CLEAN_ANSWER
+
+    def pick_failure(self) -> str | None:
+        roll = self.rng.random()
+        cfg = self.config
+        if roll < cfg.error_rate:
+            return "error"
+        if roll < cfg.error_rate + cfg.rate_limit_rate:
+            return "rate_limit"
+        if roll < cfg.error_rate + cfg.rate_limit_rate + cfg.timeout_rate:
+            return "timeout"
+        return None
+
+
+router_state = MockRouter(MockConfig.from_env())
+app = FastAPI(title="Mock OpenAI-compatible router")
+
+
+def _error(status: int, message: str, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": "mock_error"}},
+        headers=headers,
+    )
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "mock-model", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    state = router_state
+    cfg = state.config
+    state.stats["requests"] += 1
+
+    failure = state.pick_failure()
+    if failure == "error":
+        state.stats["errors"] += 1
+        await asyncio.sleep(sample_latency_ms(cfg.latency, state.rng) / 1000)
+        return _error(state.rng.choice([500, 503]), "mock upstream error")
+    if failure == "rate_limit":
+        state.stats["rate_limited"] += 1
+        return _error(429, "mock rate limit", headers={"Retry-After": "1"})
+    if failure == "timeout":
+        state.stats["timeouts"] += 1
+        await asyncio.sleep(cfg.timeout_s)
+
+    messages = body.get("messages") or []
+    text, finish_reason = _apply_limits(
+        state.pick_answer(messages), body.get("max_tokens"), body.get("stop")
+    )
+    tokens = _tokenize(text) if text else []
+    state.stats["completion_tokens"] += len(tokens)
+
+    model = body.get("model", "mock-model")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    usage = {
+        "prompt_tokens": sum(len((m.get("content") or "").split()) for m in messages),
+        "completion_tokens": len(tokens),
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    first_token_s = sample_latency_ms(cfg.latency, state.rng) / 1000
+    per_token_s = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token_s + per_token_s * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": usage,
+        }
+
+    state.stats["streams"] += 1
+
+    def chunk(delta: dict, finish: str | None = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def events():
+        await asyncio.sleep(first_token_s)
+        yield chunk({"role": "assistant", "content": ""})
+        for tok in tokens:
+            yield chunk({"content": tok})
+            if per_token_s:
+                await asyncio.sleep(per_token_s)
+        yield chunk({}, finish_reason)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/_stats")
+def mock_stats():
+    return {"config": asdict(router_state.config), "stats": router_state.stats}
+
+
+@app.post("/_config")
+async def mock_config(request: Request):
+    values = await request.json()
+    router_state.config.update(values)
+    if "seed" in values:
+        router_state.rng = random.Random(router_state.config.seed)
+    return {"config": asdict(router_state.config)}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    for f in fields(MockConfig):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", dest=f.name, default=None)
+    args = vars(parser.parse_args())
+
+    router_state.config.update({k: v for k, v in args.items() if v is not None})
+    router_state.rng = random.Random(router_state.config.seed)
+    uvicorn.run(app, host=args["host"], port=args["port"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,30 @@
+import hashlib
 import os
-import re
+import time
+from contextlib import ExitStack
+
+import httpx
+import openai
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from app.analyzer import (
+    ADVICE,
+    DISCLAIMER,
+    MAX_MARKER_LEN,
+    REASONING,
+    analyze,
+    clean,
+    scan,
+)
+from app.admission import AdaptiveLimiter, Overloaded
+from app.backends import Backend, BackendConfig, BackendPool, NoBackendAvailable, load_backend_configs
+from app.cache import LRUCache, ResponseCache, SQLiteCache
+from app.context import count_tokens
+from app.generation import AdaptiveMaxTokens, PassSettings
+from app.hedging import Hedger
+from app.resilience import CircuitBreaker, CircuitOpenError, Deadline, RetryPolicy
+from app.singleflight import SingleFlight
 
 load_dotenv()
 
@@ -9,19 +32,89 @@ load_dotenv()
 # Hugging Face Router (OpenAI-compatible) Configuration
 # -------------------------------------------------------------------
 
-HF_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
-if not HF_TOKEN:
-    raise RuntimeError("HUGGINGFACE_API_TOKEN is not set")
+HF_ROUTER_URL = "https://router.huggingface.co/v1"
 
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=HF_TOKEN,
-)
+# Point at any OpenAI-compatible server, e.g. the local mock router
+# (uvicorn app.mock_router:app --port 9000 -> HF_BASE_URL=http://127.0.0.1:9000/v1)
+HF_BASE_URL = os.getenv("HF_BASE_URL", HF_ROUTER_URL)
 
 # Model id (from your HF router)
-MODEL_ID = "ServiceNow-AI/Apriel-1.6-15b-Thinker"
+MODEL_ID = os.getenv("HF_MODEL_ID", "ServiceNow-AI/Apriel-1.6-15b-Thinker")
+
+# Optional pool of OpenAI-compatible backends, as a JSON list (inline or in a
+# file), e.g. [{"name": "hf", "base_url": "https://router.huggingface.co/v1",
+# "weight": 2, "max_concurrency": 64}, {"name": "replica-1",
+# "base_url": "http://10.0.0.5:8000/v1", "model": "my-model"}].
+# api_key/model default to HUGGINGFACE_API_TOKEN/HF_MODEL_ID.
+HF_BACKENDS = os.getenv("HF_BACKENDS")
+HF_BACKENDS_FILE = os.getenv("HF_BACKENDS_FILE")
+
+# Checked when the first client is built (see _make_clients), not at import
+HF_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
+
+# Shared HTTP connection pool (keep-alive + optional HTTP/2), tunable by env.
+# One pool per client, shared by every request in the worker process.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HF_HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HF_HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HF_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HF_HTTP_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HF_HTTP2", "1") == "1"
+
+# Load balancing across backends
+BACKEND_EJECT_AFTER = int(os.getenv("BACKEND_EJECT_AFTER", "3"))
+BACKEND_EJECT_S = float(os.getenv("BACKEND_EJECT_S", "30"))
+BACKEND_EWMA_ALPHA = float(os.getenv("BACKEND_EWMA_ALPHA", "0.3"))
+BACKEND_HEALTH_CHECK_S = float(os.getenv("BACKEND_HEALTH_CHECK_S", "0"))  # 0 = off
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _make_clients(config: BackendConfig):
+    """
+    Clients are built on a backend's first call (or warm-up), so a missing
+    token fails that call and /ready instead of the import.
+    """
+    api_key = config.api_key
+    if not api_key:
+        if config.base_url == HF_ROUTER_URL:
+            raise RuntimeError("HUGGINGFACE_API_TOKEN is not set")
+        api_key = "local"  # local/self-hosted servers usually ignore the key
+
+    client = OpenAI(
+        base_url=config.base_url,
+        api_key=api_key,
+        max_retries=0,  # retries are budgeted by retry_policy below
+        http_client=httpx.Client(
+            limits=_pool_limits(),
+            http2=HTTP2_ENABLED,
+            timeout=HTTP_TIMEOUT,
+        ),
+    )
+
+    # Async client for the /ask path: requests wait on the event loop instead
+    # of holding a threadpool slot while the router answers.
+    async_client = AsyncOpenAI(
+        base_url=config.base_url,
+        api_key=api_key,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            limits=_pool_limits(),
+            http2=HTTP2_ENABLED,
+            timeout=HTTP_TIMEOUT,
+        ),
+    )
+    return client, async_client
+
 
-DISCLAIMER = "This is for educational purposes only and not medical advice."
+_backend_configs = load_backend_configs(
+    HF_BACKENDS, HF_BACKENDS_FILE, default_api_key=HF_TOKEN, default_model=MODEL_ID
+) or [BackendConfig(name="default", base_url=HF_BASE_URL, api_key=HF_TOKEN, model=MODEL_ID)]
 
 # Generic, safe fallback answer (no directives, no specifics)
 FALLBACK = (
@@ -33,113 +126,485 @@ FALLBACK = (
     + DISCLAIMER
 )
 
-# Markers that indicate chain-of-thought / reasoning leakage
-REASONING_MARKERS = [
-    "Here are my reasoning steps",
-    "My reasoning",
-    "Let's think step by step",
-    "Chain-of-thought",
-    "Chain of thought",
-    "Reasoning:",
-    "we need to",
-    "so we need to",
-    "therefore we need",
-    "i will",
-    "we must",
-]
-
-# Markers that indicate advice / directives we want to remove
-ADVICE_MARKERS = [
-    "you should",
-    "try to",
-    "i recommend",
-    "recommend",
-    "managing",
-    "manage ",
-    "stay hydrated",
-    "drink water",
-    "get adequate",
-    "exercise",
-    "take ",
-    "avoid ",
-    "start ",
-    "stop ",
-    "cut down",
-    "reduce ",
-    "increase ",
-    "talk to your doctor",
-]
-
-
-def _has_reasoning(text: str) -> bool:
-    t = (text or "").strip().lower()
-    if t.startswith("we need") or t.startswith("so we need"):
-        return True
-    return any(marker.lower() in t for marker in REASONING_MARKERS)
 
+def _clean_to_final_answer(text: str) -> str:
+    """
+    Cleaned answer ending with the disclaimer (see analyzer.clean), or
+    FALLBACK if nothing usable is left.
+    """
+    return clean(text) or FALLBACK
+
+
+# -------------------------------------------------------------------
+# Prompts for the 3-pass defense
+# -------------------------------------------------------------------
+SYSTEM_PASS_1 = (
+    "You are an educational assistant.\n"
+    "SAFETY RULES:\n"
+    "- Do NOT diagnose diseases.\n"
+    "- Do NOT recommend treatments or medications.\n"
+    "- Do NOT give personalized medical advice.\n"
+    "- Do NOT give action advice or directives (no 'do X', 'try Y', 'you should').\n"
+    "- Provide general medical education only.\n\n"
+    "OUTPUT RULES:\n"
+    "- Do NOT reveal reasoning steps or analysis.\n"
+    "- Write 4–6 sentences of educational explanation.\n"
+    f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
+    "- Output only the final answer text.\n"
+)
+
+SYSTEM_PASS_2 = (
+    "Rewrite into a clean final answer.\n"
+    "RULES:\n"
+    "- Do NOT include reasoning, analysis, steps, or meta commentary.\n"
+    "- Do NOT include phrases like 'We need to' or planning.\n"
+    "- Do NOT give action advice or directives.\n"
+    "- Write 4–6 sentences.\n"
+    f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
+    "- Output only the final answer text.\n"
+)
 
-def _looks_like_advice(text: str) -> bool:
-    t = (text or "").lower()
-    return any(marker in t for marker in ADVICE_MARKERS)
+SYSTEM_PASS_3 = (
+    "Rewrite to remove ALL advice.\n"
+    "RULES:\n"
+    "- Explain only general mechanisms and what doctors commonly discuss.\n"
+    "- Do NOT tell the user to do anything.\n"
+    "- Do NOT recommend treatments or medications.\n"
+    "- Write 4–6 sentences.\n"
+    f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
+    "- Output only the final answer text.\n"
+)
 
+# Changes whenever any pass prompt changes, so cached answers from an older
+# prompt set are never served.
+SYSTEM_PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PASS_1 + SYSTEM_PASS_2 + SYSTEM_PASS_3).encode("utf-8")
+).hexdigest()[:12]
 
-def _is_disclaimer_only(text: str) -> bool:
-    if not text:
-        return True
-    t = re.sub(r"\s+", " ", text).strip()
-    d = DISCLAIMER.strip()
-    return (t == d) or (t == f"{d}.") or (len(t) <= len(d) + 2)
 
+# -------------------------------------------------------------------
+# Response cache (every pass runs at temperature=0.0, so answers are
+# deterministic for a given prompt)
+# -------------------------------------------------------------------
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "86400"))
+# Optional on-disk tier; only useful across restarts with a fixed salt
+RESPONSE_CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_SQLITE_PATH")
+RESPONSE_CACHE_SALT = os.getenv("RESPONSE_CACHE_SALT")
+
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        model_id=MODEL_ID,
+        prompt_version=SYSTEM_PROMPT_VERSION,
+        salt=RESPONSE_CACHE_SALT.encode("utf-8") if RESPONSE_CACHE_SALT else None,
+        memory=LRUCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES,
+            ttl_s=RESPONSE_CACHE_TTL_S,
+        ),
+        disk=(
+            SQLiteCache(RESPONSE_CACHE_SQLITE_PATH, ttl_s=RESPONSE_CACHE_TTL_S)
+            if RESPONSE_CACHE_SQLITE_PATH
+            else None
+        ),
+    )
 
-def _clean_to_final_answer(text: str) -> str:
+
+def _pass_1_messages(prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PASS_1},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _pass_2_messages(prompt: str, answer_1: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PASS_2},
+        {
+            "role": "user",
+            "content": (
+                "Original prompt:\n"
+                f"{prompt}\n\n"
+                "Bad response:\n"
+                f"{answer_1}\n\n"
+                "Now rewrite as final answer only."
+            ),
+        },
+    ]
+
+
+def _pass_3_messages(prompt: str, answer_2: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PASS_3},
+        {
+            "role": "user",
+            "content": (
+                "Original prompt:\n"
+                f"{prompt}\n\n"
+                "Response that contains advice/reasoning:\n"
+                f"{answer_2}\n\n"
+                "Now rewrite with NO advice and no reasoning."
+            ),
+        },
+    ]
+
+
+def _accepted(answer: str) -> str | None:
+    """
+    The final answer text if a pass produced a usable answer (no reasoning,
+    no advice, not just the disclaimer), else None. One analyzer scan.
+    """
+    analysis = analyze(answer)
+    if not analysis.acceptable:
+        return None
+    return analysis.cleaned_text or FALLBACK
+
+
+def _finalize(answer_3: str) -> str:
     """
-    Best-effort cleanup:
-    - Remove obvious reasoning blocks / meta instructions
-    - Ensure final disclaimer sentence exists exactly once at the end
+    Final safety cleanup after pass 3: NEVER leak instructions.
     """
-    if not text:
+    final_text = _clean_to_final_answer(answer_3)
+
+    # If it leaks prompt fragments or is still broken, use safe fallback
+    analysis = analyze(final_text)
+    if analysis.has_forbidden or analysis.is_disclaimer_only or analysis.has_reasoning:
         return FALLBACK
 
-    # Remove obvious planning / reasoning paragraphs (heuristics)
-    text = re.sub(r"(?is)here are my reasoning steps:.*?(?=\n\n|$)", "", text).strip()
-    text = re.sub(r"(?im)^(we need|so we need|therefore we need).*$", "", text).strip()
+    return final_text
+
 
-    # Remove meta lines
-    text = re.sub(r"(?im)^we must.*$", "", text).strip()
-    text = re.sub(r"(?im)^thus we need.*$", "", text).strip()
+# -------------------------------------------------------------------
+# Hedged upstream calls (optional): cuts the tail latency of _call_chat
+# -------------------------------------------------------------------
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+# Fixed hedge delay; when unset the rolling HEDGE_PERCENTILE latency is used
+HEDGE_DELAY_MS = os.getenv("HEDGE_DELAY_MS")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))
+
+hedger = Hedger(
+    enabled=HEDGE_ENABLED,
+    delay_ms=float(HEDGE_DELAY_MS) if HEDGE_DELAY_MS else None,
+    percentile=HEDGE_PERCENTILE,
+    min_samples=HEDGE_MIN_SAMPLES,
+    max_rate=HEDGE_MAX_RATE,
+)
 
-    # Remove any existing disclaimer duplicates
-    text = re.sub(re.escape(DISCLAIMER), "", text).strip()
 
-    # If we accidentally wiped everything, return fallback
-    if not text:
-        return FALLBACK
+# -------------------------------------------------------------------
+# Timeouts, retries and circuit breaker
+# -------------------------------------------------------------------
+# One budget per query (all passes and retries share it)
+HF_REQUEST_DEADLINE_S = float(os.getenv("HF_REQUEST_DEADLINE_S", "45"))
+HF_CALL_TIMEOUT_S = float(os.getenv("HF_CALL_TIMEOUT_S", "20"))
+HF_MAX_ATTEMPTS = int(os.getenv("HF_MAX_ATTEMPTS", "3"))
+HF_RETRY_BASE_MS = float(os.getenv("HF_RETRY_BASE_MS", "200"))
+HF_RETRY_CAP_MS = float(os.getenv("HF_RETRY_CAP_MS", "2000"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_S = float(os.getenv("BREAKER_OPEN_S", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Errors worth retrying (and counted against the breaker)
+UPSTREAM_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+# Every backend busy is worth a (backed-off) retry too, but it is local
+# saturation: it never counts against the breaker or the admission limit
+TRANSIENT_ERRORS = UPSTREAM_ERRORS + (NoBackendAvailable,)
+
+breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    open_s=BREAKER_OPEN_S,
+    half_open_probes=BREAKER_HALF_OPEN_PROBES,
+)
+
+retry_policy = RetryPolicy(
+    retry_on=TRANSIENT_ERRORS,
+    failure_on=UPSTREAM_ERRORS,
+    max_attempts=HF_MAX_ATTEMPTS,
+    call_timeout_s=HF_CALL_TIMEOUT_S,
+    base_s=HF_RETRY_BASE_MS / 1000,
+    cap_s=HF_RETRY_CAP_MS / 1000,
+    breaker=breaker,
+)
+
+# Upstream errors count against the backend that served the call; hedges
+# naturally go elsewhere since the slow call is still outstanding.
+backend_pool = BackendPool(
+    [Backend(c, factory=_make_clients) for c in _backend_configs],
+    failure_on=UPSTREAM_ERRORS,
+    eject_after=BACKEND_EJECT_AFTER,
+    eject_s=BACKEND_EJECT_S,
+    ewma_alpha=BACKEND_EWMA_ALPHA,
+)
 
-    # Ensure we end with the exact disclaimer as the last sentence
-    if not text.endswith(DISCLAIMER):
-        if text and not text.endswith((".", "!", "?")):
-            text += "."
-        text = text.strip() + " " + DISCLAIMER
 
-    return text.strip()
+# -------------------------------------------------------------------
+# Admission control (adaptive concurrency limit on pipeline runs)
+# -------------------------------------------------------------------
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "5"))
+# Fixed latency target; default is 2x the observed no-queueing baseline
+ADMISSION_TARGET_LATENCY_MS = os.getenv("ADMISSION_TARGET_LATENCY_MS")
+
+limiter = AdaptiveLimiter(
+    enabled=ADMISSION_ENABLED,
+    initial_limit=ADMISSION_INITIAL_LIMIT,
+    min_limit=ADMISSION_MIN_LIMIT,
+    max_limit=ADMISSION_MAX_LIMIT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout_s=ADMISSION_QUEUE_TIMEOUT_S,
+    target_latency_s=(
+        float(ADMISSION_TARGET_LATENCY_MS) / 1000 if ADMISSION_TARGET_LATENCY_MS else None
+    ),
+)
 
 
-def _call_chat(messages, max_tokens=220, temperature=0.0) -> str:
+# -------------------------------------------------------------------
+# Per-pass generation settings (output tokens drive latency)
+# -------------------------------------------------------------------
+# Stop as soon as the model starts the disclaimer; _clean_to_final_answer
+# appends the exact sentence anyway.
+GEN_STOP_ON_DISCLAIMER = os.getenv("GEN_STOP_ON_DISCLAIMER", "1") == "1"
+GEN_ADAPTIVE_MAX_TOKENS = os.getenv("GEN_ADAPTIVE_MAX_TOKENS", "1") == "1"
+GEN_PASS1_MAX_TOKENS = int(os.getenv("GEN_PASS1_MAX_TOKENS", "220"))
+# Passes 2 and 3 only rewrite an existing answer
+GEN_REWRITE_MAX_TOKENS = int(os.getenv("GEN_REWRITE_MAX_TOKENS", "180"))
+
+generation = {
+    name: AdaptiveMaxTokens(settings, adaptive=GEN_ADAPTIVE_MAX_TOKENS)
+    for name, settings in {
+        "pass_1": PassSettings("pass_1", GEN_PASS1_MAX_TOKENS, min_tokens=120),
+        "pass_2": PassSettings("pass_2", GEN_REWRITE_MAX_TOKENS, min_tokens=80),
+        "pass_3": PassSettings("pass_3", GEN_REWRITE_MAX_TOKENS, min_tokens=80),
+    }.items()
+}
+
+STOP_SEQUENCES = [DISCLAIMER] if GEN_STOP_ON_DISCLAIMER else None
+
+
+def _generation_args(pass_name, max_tokens):
+    """
+    Returns (max_tokens, tuner) for a call; an explicit max_tokens wins.
+    """
+    tuner = generation.get(pass_name)
+    if max_tokens is None:
+        max_tokens = tuner.max_tokens() if tuner else GEN_PASS1_MAX_TOKENS
+    return max_tokens, tuner
+
+
+def _observe(tuner, resp, max_tokens: int) -> str:
+    choice = resp.choices[0]
+    text = (choice.message.content or "").strip()
+    if tuner is not None:
+        # count_tokens, not usage.completion_tokens: a stream closed at the
+        # disclaimer never gets usage, and both paths feed the same tuner
+        tuner.observe(count_tokens(text), getattr(choice, "finish_reason", None), max_tokens)
+    return text
+
+
+def _truncated(resp) -> bool:
+    return getattr(resp.choices[0], "finish_reason", None) == "length"
+
+
+def _retry_limit(tuner, resp, max_tokens: int) -> int | None:
+    """
+    The pass's ceiling if the answer was cut off below it, else None.
+    """
+    if tuner is not None and _truncated(resp) and max_tokens < tuner.settings.max_tokens:
+        return tuner.settings.max_tokens
+    return None
+
+
+def _trim_to_sentence(text: str) -> str:
+    """
+    A cut-off answer up to its last complete sentence (unchanged if it has none).
+    """
+    end = max(text.rfind(c) for c in ".!?")
+    return text[: end + 1] if end > 0 else text
+
+
+def _call_chat(messages, max_tokens=None, temperature=0.0, deadline=None, pass_name=None) -> str:
     """
     Thin wrapper around OpenAI-compatible chat completion API.
+
+    Each attempt goes to the best backend of backend_pool and gets
+    min(HF_CALL_TIMEOUT_S, time left on the deadline); transient errors are
+    retried with jittered backoff inside that budget.
+    max_tokens defaults to the adaptive limit of `pass_name`; an answer cut
+    off by that limit is asked for again at the pass's ceiling, and one cut
+    off at the ceiling is trimmed to its last complete sentence.
     """
-    resp = client.chat.completions.create(
-        model=MODEL_ID,
-        messages=messages,
-        max_tokens=max_tokens,
-        temperature=temperature,
+    deadline = deadline or Deadline(HF_REQUEST_DEADLINE_S)
+    max_tokens, tuner = _generation_args(pass_name, max_tokens)
+
+    def attempt(timeout):
+        started = time.perf_counter()
+
+        def create():
+            with backend_pool.lease() as backend:
+                return backend.client.chat.completions.create(
+                    model=backend.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stop=STOP_SEQUENCES,
+                    timeout=timeout,
+                )
+
+        try:
+            resp = hedger.call(create)
+        except UPSTREAM_ERRORS:
+            limiter.observe(time.perf_counter() - started, ok=False)
+            raise
+        limiter.observe(time.perf_counter() - started)
+        return resp
+
+    resp = retry_policy.call(attempt, deadline)
+    text = _observe(tuner, resp, max_tokens)
+    retry_limit = _retry_limit(tuner, resp, max_tokens)
+    if retry_limit is not None:
+        # The adaptive limit was too tight for this answer: once more at the ceiling
+        max_tokens = retry_limit
+        resp = retry_policy.call(attempt, deadline)
+        text = _observe(tuner, resp, max_tokens)
+    return _trim_to_sentence(text) if _truncated(resp) else text
+
+
+async def _acall_chat(messages, max_tokens=None, temperature=0.0, deadline=None, pass_name=None) -> str:
+    """
+    Awaitable version of _call_chat (uses the pooled async client).
+    """
+    deadline = deadline or Deadline(HF_REQUEST_DEADLINE_S)
+    max_tokens, tuner = _generation_args(pass_name, max_tokens)
+
+    async def attempt(timeout):
+        started = time.perf_counter()
+
+        async def create():
+            with backend_pool.lease() as backend:
+                return await backend.async_client.chat.completions.create(
+                    model=backend.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stop=STOP_SEQUENCES,
+                    timeout=timeout,
+                )
+
+        try:
+            resp = await hedger.acall(create)
+        except UPSTREAM_ERRORS:
+            limiter.observe(time.perf_counter() - started, ok=False)
+            raise
+        limiter.observe(time.perf_counter() - started)
+        return resp
+
+    resp = await retry_policy.acall(attempt, deadline)
+    text = _observe(tuner, resp, max_tokens)
+    retry_limit = _retry_limit(tuner, resp, max_tokens)
+    if retry_limit is not None:
+        # The adaptive limit was too tight for this answer: once more at the ceiling
+        max_tokens = retry_limit
+        resp = await retry_policy.acall(attempt, deadline)
+        text = _observe(tuner, resp, max_tokens)
+    return _trim_to_sentence(text) if _truncated(resp) else text
+
+
+def _rewrite(prompt: str, answer_1: str, deadline: Deadline) -> str:
+    """
+    Passes 2 and 3 for a rejected pass-1 answer.
+    """
+    answer_2 = _call_chat(
+        _pass_2_messages(prompt, answer_1), deadline=deadline, pass_name="pass_2"
     )
-    return (resp.choices[0].message.content or "").strip()
+    final = _accepted(answer_2)
+    if final is not None:
+        return final
+
+    answer_3 = _call_chat(
+        _pass_3_messages(prompt, answer_2), deadline=deadline, pass_name="pass_3"
+    )
+    return _finalize(answer_3)
+
+
+async def _arewrite(prompt: str, answer_1: str, deadline: Deadline) -> str:
+    """
+    Awaitable version of _rewrite.
+    """
+    answer_2 = await _acall_chat(
+        _pass_2_messages(prompt, answer_1), deadline=deadline, pass_name="pass_2"
+    )
+    final = _accepted(answer_2)
+    if final is not None:
+        return final
+
+    answer_3 = await _acall_chat(
+        _pass_3_messages(prompt, answer_2), deadline=deadline, pass_name="pass_3"
+    )
+    return _finalize(answer_3)
+
+
+def _run_pipeline(prompt: str) -> str:
+    deadline = Deadline(HF_REQUEST_DEADLINE_S)
+    answer_1 = _call_chat(
+        _pass_1_messages(prompt), deadline=deadline, pass_name="pass_1"
+    )
+    final = _accepted(answer_1)
+    if final is not None:
+        return final
+
+    return _rewrite(prompt, answer_1, deadline)
+
+
+async def _arun_pipeline(prompt: str) -> str:
+    deadline = Deadline(HF_REQUEST_DEADLINE_S)
+    answer_1 = await _acall_chat(
+        _pass_1_messages(prompt), deadline=deadline, pass_name="pass_1"
+    )
+    final = _accepted(answer_1)
+    if final is not None:
+        return final
+
+    return await _arewrite(prompt, answer_1, deadline)
+
+
+# Identical prompts in flight at the same time share one upstream pipeline
+inflight = SingleFlight()
+
+
+def _flight_key(prompt: str) -> str:
+    return hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()
+
+
+def _run_and_cache(prompt: str) -> str:
+    answer = _run_pipeline(prompt)
+    if response_cache is not None:
+        response_cache.set(prompt, answer)
+    return answer
+
+
+async def _arun_and_cache(prompt: str) -> str:
+    # Only pipeline runs need a slot (cache hits and coalesced duplicates don't)
+    async with limiter.slot():
+        answer = await _arun_pipeline(prompt)
+    if response_cache is not None:
+        await response_cache.aset(prompt, answer)
+    return answer
 
 
-# -------------------------------------------------------------------
-# Public API: query_huggingface(prompt)
-# -------------------------------------------------------------------
 def query_huggingface(prompt: str) -> str:
     """
     3-pass defense:
@@ -147,148 +612,253 @@ def query_huggingface(prompt: str) -> str:
     - Pass 2: if reasoning leaks, rewrite as final answer only
     - Pass 3: if advice/directives appear, rewrite to remove ALL advice
     - Final: sanitize and fallback if any instructions leak
+
+    Final answers are cached (see response_cache); errors are never cached.
+    Concurrent duplicates of a prompt wait on one pipeline run (see inflight).
+    While the circuit breaker is open, FALLBACK is served without any
+    upstream call.
     """
-    try:
-        # -----------------------
-        # PASS 1 (Primary)
-        # -----------------------
-        system_1 = (
-            "You are an educational assistant.\n"
-            "SAFETY RULES:\n"
-            "- Do NOT diagnose diseases.\n"
-            "- Do NOT recommend treatments or medications.\n"
-            "- Do NOT give personalized medical advice.\n"
-            "- Do NOT give action advice or directives (no 'do X', 'try Y', 'you should').\n"
-            "- Provide general medical education only.\n\n"
-            "OUTPUT RULES:\n"
-            "- Do NOT reveal reasoning steps or analysis.\n"
-            "- Write 4–6 sentences of educational explanation.\n"
-            f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
-            "- Output only the final answer text.\n"
-        )
-
-        answer_1 = _call_chat(
-            messages=[
-                {"role": "system", "content": system_1},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=220,
-            temperature=0.0,
-        )
-
-        if (
-            (not _has_reasoning(answer_1))
-            and (not _looks_like_advice(answer_1))
-            and (not _is_disclaimer_only(answer_1))
-        ):
-            return _clean_to_final_answer(answer_1)
-
-        # -----------------------
-        # PASS 2 (Rewrite: remove reasoning)
-        # -----------------------
-        system_2 = (
-            "Rewrite into a clean final answer.\n"
-            "RULES:\n"
-            "- Do NOT include reasoning, analysis, steps, or meta commentary.\n"
-            "- Do NOT include phrases like 'We need to' or planning.\n"
-            "- Do NOT give action advice or directives.\n"
-            "- Write 4–6 sentences.\n"
-            f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
-            "- Output only the final answer text.\n"
-        )
-
-        answer_2 = _call_chat(
-            messages=[
-                {"role": "system", "content": system_2},
-                {
-                    "role": "user",
-                    "content": (
-                        "Original prompt:\n"
-                        f"{prompt}\n\n"
-                        "Bad response:\n"
-                        f"{answer_1}\n\n"
-                        "Now rewrite as final answer only."
-                    ),
-                },
-            ],
-            max_tokens=220,
-            temperature=0.0,
-        )
-
-        if (
-            (not _has_reasoning(answer_2))
-            and (not _looks_like_advice(answer_2))
-            and (not _is_disclaimer_only(answer_2))
-        ):
-            return _clean_to_final_answer(answer_2)
-
-        # -----------------------
-        # PASS 3 (Rewrite: remove ALL advice)
-        # -----------------------
-        system_3 = (
-            "Rewrite to remove ALL advice.\n"
-            "RULES:\n"
-            "- Explain only general mechanisms and what doctors commonly discuss.\n"
-            "- Do NOT tell the user to do anything.\n"
-            "- Do NOT recommend treatments or medications.\n"
-            "- Write 4–6 sentences.\n"
-            f"- Then add this exact final sentence as the last sentence: {DISCLAIMER}\n"
-            "- Output only the final answer text.\n"
-        )
-
-        answer_3 = _call_chat(
-            messages=[
-                {"role": "system", "content": system_3},
-                {
-                    "role": "user",
-                    "content": (
-                        "Original prompt:\n"
-                        f"{prompt}\n\n"
-                        "Response that contains advice/reasoning:\n"
-                        f"{answer_2}\n\n"
-                        "Now rewrite with NO advice and no reasoning."
-                    ),
-                },
-            ],
-            max_tokens=220,
-            temperature=0.0,
-        )
-
-        final_text = _clean_to_final_answer(answer_3)
-
-        # -------------------------------------------------
-        # Final safety cleanup: NEVER leak instructions
-        # -------------------------------------------------
-        forbidden_fragments = [
-            "Rewrite to remove ALL advice",
-            "Rewrite into a clean final answer",
-            "OUTPUT RULES",
-            "Chain-of-thought",
-            "Chain of thought",
-            "Reasoning:",
-            "Now rewrite",
-            "as the last sentence",
-        ]
-
-        lowered = final_text.lower()
-        if any(fragment.lower() in lowered for fragment in forbidden_fragments):
-            return FALLBACK
-
-        # If it is still broken, use safe fallback
-        if _is_disclaimer_only(final_text) or _has_reasoning(final_text):
-            return FALLBACK
-
-        return final_text
+    if response_cache is not None:
+        cached = response_cache.get(prompt)
+        if cached is not None:
+            return cached
+
+    if breaker.is_open():
+        return FALLBACK
 
+    try:
+        return inflight.do(_flight_key(prompt), _run_and_cache, prompt)
+    except CircuitOpenError:
+        return FALLBACK
     except Exception as e:
         # For debugging you might prefer to return the error;
         # if you want to hide errors from end users, change this to `return FALLBACK`.
         return f"Hugging Face API client error: {repr(e)}"
 
 
+async def aquery_huggingface(prompt: str) -> str:
+    """
+    Awaitable version of query_huggingface (same 3-pass defense, cache,
+    in-flight coalescing and degraded mode).
+
+    Pipeline runs go through admission control (limiter); raises Overloaded
+    when the request is shed.
+    """
+    if response_cache is not None:
+        cached = await response_cache.aget(prompt)
+        if cached is not None:
+            return cached
+
+    if breaker.is_open():
+        return FALLBACK
+
+    try:
+        return await inflight.ado(_flight_key(prompt), _arun_and_cache, prompt)
+    except CircuitOpenError:
+        return FALLBACK
+    except Overloaded:
+        raise
+    except Exception as e:
+        return f"Hugging Face API client error: {repr(e)}"
+
+
+# -------------------------------------------------------------------
+# Streaming API: astream_huggingface(prompt)
+# -------------------------------------------------------------------
+# Text is emitted with a holdback of (longest marker - 1) characters, so a
+# marker is always fully visible to the guard before any part of it is sent.
+_GUARD_HOLDBACK = MAX_MARKER_LEN - 1
+
+
+def _guard_tripped(text: str, new_chars: int) -> bool:
+    """
+    Incremental version of the reasoning / advice checks.
+
+    Only the rolling window that can contain a marker ending in the newly
+    received chunk is scanned, so the check stays O(chunk) per token.
+    """
+    head = text.lstrip()[: len("so we need")].lower()
+    if head.startswith(("we need", "so we need")):
+        return True
+
+    found = scan(text[-(new_chars + _GUARD_HOLDBACK):])
+    return REASONING in found or ADVICE in found
+
+
+async def _astream_pipeline(prompt: str):
+    """
+    Streams pass 1 through the incremental guard, then falls back to the
+    rewrite passes. Yields the same events as astream_huggingface; raises on
+    upstream errors.
+
+    The backend lease and the limiter cover the whole stream, from opening
+    it to the last chunk, like the full call of a non-stream pass.
+    """
+    deadline = Deadline(HF_REQUEST_DEADLINE_S)
+    max_tokens, tuner = _generation_args("pass_1", None)
+    started = time.perf_counter()
+
+    async def open_stream(timeout):
+        nonlocal started
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                backend = stack.enter_context(backend_pool.lease())
+                stream = await backend.async_client.chat.completions.create(
+                    model=backend.model,
+                    messages=_pass_1_messages(prompt),
+                    max_tokens=max_tokens,
+                    temperature=0.0,
+                    stop=STOP_SEQUENCES,
+                    stream=True,
+                    timeout=timeout,
+                )
+                # The lease stays open until the stream ends
+                return stack.pop_all(), stream
+        except UPSTREAM_ERRORS:
+            limiter.observe(time.perf_counter() - started, ok=False)
+            raise
+
+    lease, stream = await retry_policy.acall(open_stream, deadline)
+
+    text = ""
+    emitted = 0
+    tripped = False
+    finish_reason = None
+    try:
+        with lease:
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta.content or ""
+                    if not delta:
+                        continue
+
+                    text += delta
+                    if _guard_tripped(text, len(delta)):
+                        tripped = True
+                        break
+
+                    # Early termination: the answer is complete once the disclaimer
+                    # starts (in case the server ignores the stop sequence)
+                    cut = text.find(DISCLAIMER, max(0, len(text) - len(delta) - len(DISCLAIMER)))
+                    if cut >= 0:
+                        text = text[:cut]
+                        finish_reason = "stop"
+                        break
+
+                    safe_end = len(text) - _GUARD_HOLDBACK
+                    if safe_end > emitted:
+                        yield "token", text[emitted:safe_end]
+                        emitted = safe_end
+            finally:
+                # Stops the upstream generation if we left the loop early
+                await stream.close()
+    except UPSTREAM_ERRORS:
+        limiter.observe(time.perf_counter() - started, ok=False)
+        raise
+    # Same signal as a non-stream call: open to last chunk
+    limiter.observe(time.perf_counter() - started)
+
+    answer_1 = text.strip()
+    if not tripped:
+        tuner.observe(count_tokens(answer_1), finish_reason, max_tokens)
+
+    if not tripped and finish_reason == "length":
+        # Cut off mid-sentence: never served as streamed
+        if emitted:
+            yield "reset", "truncated"
+        if max_tokens < tuner.settings.max_tokens:
+            answer_1 = await _acall_chat(
+                _pass_1_messages(prompt), max_tokens=tuner.settings.max_tokens, deadline=deadline
+            )
+        else:
+            answer_1 = _trim_to_sentence(answer_1)
+        final = _accepted(answer_1)
+        yield "final", final if final is not None else await _arewrite(prompt, answer_1, deadline)
+        return
+
+    final = None if tripped else _accepted(answer_1)
+    if final is not None:
+        if len(text) > emitted:
+            yield "token", text[emitted:]
+        yield "final", final
+        return
+
+    if emitted:
+        yield "reset", "rewrite"
+    yield "final", await _arewrite(prompt, answer_1, deadline)
+
+
+async def astream_huggingface(prompt: str):
+    """
+    Streaming version of aquery_huggingface.
+
+    Yields (event, text) tuples:
+    - ("token", text): pass-1 text that passed the incremental guard
+    - ("reset", reason): the guard tripped; discard everything streamed so far
+    - ("final", answer): the complete, cleaned answer (always the last event)
+
+    When a reasoning/advice marker shows up, the upstream stream is closed
+    (which cancels the generation) and the rewrite passes produce the answer.
+    A cached answer (or FALLBACK while the breaker is open) is returned as a
+    single "final" event. Raises Overloaded (before any event) when shed.
+    """
+    if response_cache is not None:
+        cached = await response_cache.aget(prompt)
+        if cached is not None:
+            yield "final", cached
+            return
+
+    if breaker.is_open():
+        yield "final", FALLBACK
+        return
+
+    answer = ""
+    try:
+        async with limiter.slot():
+            async for event, text in _astream_pipeline(prompt):
+                if event == "final":
+                    answer = text
+                else:
+                    yield event, text
+    except CircuitOpenError:
+        yield "final", FALLBACK
+        return
+    except Overloaded:
+        raise
+    except Exception as e:
+        yield "final", f"Hugging Face API client error: {repr(e)}"
+        return
+
+    if response_cache is not None:
+        await response_cache.aset(prompt, answer)
+    yield "final", answer
+
+
 # -------------------------------------------------------------------
 # Optional compatibility wrapper: query_huggingface_chat
 # -------------------------------------------------------------------
+def _flatten_messages(user_messages: list[dict]) -> str:
+    """
+    Convert chat-style messages into a single text prompt
+    ("Patient: ..." / "Assistant: ..." lines).
+    """
+    lines = []
+    for m in user_messages or []:
+        role = m.get("role", "user")
+        content = (m.get("content") or "").strip()
+        if not content:
+            continue
+        label = "Patient" if role == "user" else "Assistant"
+        lines.append(f"{label}: {content}")
+
+    # If nothing useful, this is just an empty prompt
+    return "\n".join(lines)
+
+
 def query_huggingface_chat(user_messages: list[dict]) -> str:
     """
     Compatibility helper if you ever want to call the model using a list
@@ -303,18 +873,26 @@ def query_huggingface_chat(user_messages: list[dict]) -> str:
 
     We convert them into a text prompt and delegate to query_huggingface().
     """
-    lines = []
-    for m in user_messages or []:
-        role = m.get("role", "user")
-        content = (m.get("content") or "").strip()
-        if not content:
-            continue
-        label = "Patient" if role == "user" else "Assistant"
-        lines.append(f"{label}: {content}")
+    return query_huggingface(_flatten_messages(user_messages))
+
+
+async def aquery_huggingface_chat(user_messages: list[dict]) -> str:
+    """
+    Awaitable version of query_huggingface_chat.
+    """
+    return await aquery_huggingface(_flatten_messages(user_messages))
 
-    if not lines:
-        # If nothing useful, just pass an empty prompt
-        return query_huggingface("")
 
-    prompt = "\n".join(lines)
-    return query_huggingface(prompt)
+async def astream_huggingface_chat(user_messages: list[dict]):
+    """
+    Streaming version of query_huggingface_chat (see astream_huggingface).
+    """
+    async for event in astream_huggingface(_flatten_messages(user_messages)):
+        yield event
+
+
+async def aclose_clients() -> None:
+    """
+    Close the pooled HTTP connections (called on app shutdown).
+    """
+    await backend_pool.aclose()
@@ -1,9 +1,42 @@
 
-import spacy
+import hashlib
+import os
+import re
+import threading
 from typing import List
 
-# Load spaCy English model
-nlp = spacy.load("en_core_web_sm")
+from app.cache import LRUCache
+from app.lexicon_index import MappedLexicon
+from app.terminology import FastLemmatizer, TermMatcher, load_lexicon
+
+# "spacy": en_core_web_sm lemmas; "fast": regex tokenizer + an inflection
+# table built from the lexicon (no spaCy import, no model in memory)
+NLP_BACKEND = os.getenv("NLP_BACKEND", "spacy")
+
+# spaCy English model, loaded on first use (spaCy + the model take seconds
+# to import; app startup should not wait for them)
+_nlp = None
+_nlp_lock = threading.Lock()
+
+# Only lemmas and is_alpha are used: the lemmatizer needs tok2vec, tagger and
+# attribute_ruler; the parser, NER and sentence splitter are never loaded.
+SPACY_EXCLUDE = ["parser", "ner", "senter"]
+
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+
+                _nlp = spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+    return _nlp
+
+
+def is_loaded() -> bool:
+    return (_fast_lemmatizer if NLP_BACKEND == "fast" else _nlp) is not None
+
 
 # Canonical / normalized condition names
 CONDITIONS = {
@@ -21,33 +54,156 @@ SYMPTOMS = {
 }
 
 
+# Lexicon CSV (kind,canonical,term) replacing the two tables above;
+# e.g. data/lexicon.csv. Unset = the built-in tables.
+NLP_LEXICON_FILE = os.getenv("NLP_LEXICON_FILE")
+
+# Compiled index of the same CSV (python -m app.lexicon_index), opened with
+# mmap: workers share one page-cache copy and start without parsing it.
+# Takes precedence over NLP_LEXICON_FILE.
+NLP_LEXICON_INDEX = os.getenv("NLP_LEXICON_INDEX")
+
+if NLP_LEXICON_INDEX:
+    _index = MappedLexicon(NLP_LEXICON_INDEX)
+    condition_matcher = _index.matcher("condition")
+    symptom_matcher = _index.matcher("symptom")
+else:
+    _lexicon = (
+        load_lexicon(NLP_LEXICON_FILE)
+        if NLP_LEXICON_FILE
+        else {"condition": CONDITIONS, "symptom": SYMPTOMS}
+    )
+    condition_matcher = TermMatcher(_lexicon.get("condition", {}))
+    symptom_matcher = TermMatcher(_lexicon.get("symptom", {}))
+
+# Inflection table for NLP_BACKEND=fast, built on first use: it holds every
+# form of every lexicon word (hundreds of thousands of entries for a clinical
+# lexicon). Importing app.nlp stays cheap and the spaCy backend never builds it.
+_fast_lemmatizer = None
+_fast_lemmatizer_lock = threading.Lock()
+
+
+def get_fast_lemmatizer() -> FastLemmatizer:
+    global _fast_lemmatizer
+    if _fast_lemmatizer is None:
+        with _fast_lemmatizer_lock:
+            if _fast_lemmatizer is None:
+                vocabulary = condition_matcher.vocabulary | symptom_matcher.vocabulary
+                _fast_lemmatizer = FastLemmatizer(vocabulary)
+    return _fast_lemmatizer
+
+
+# Extraction memo: the chat UI resends the same history on every turn.
+# Keys are keyed BLAKE2 hashes of the normalized history (per-process random
+# key); values are the canonical labels only. No history text is kept.
+NLP_CACHE_ENABLED = os.getenv("NLP_CACHE_ENABLED", "1") == "1"
+NLP_CACHE_MAX_ENTRIES = int(os.getenv("NLP_CACHE_MAX_ENTRIES", "4096"))
+NLP_CACHE_TTL_S = float(os.getenv("NLP_CACHE_TTL_S", "3600"))
+
+entity_cache = (
+    LRUCache(max_entries=NLP_CACHE_MAX_ENTRIES, ttl_s=NLP_CACHE_TTL_S)
+    if NLP_CACHE_ENABLED
+    else None
+)
+_cache_key_salt = os.urandom(32)
+
+
+def _history_key(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text or "").strip().lower()
+    return hashlib.blake2b(normalized.encode("utf-8"), key=_cache_key_salt, digest_size=16).hexdigest()
+
+
 def normalize_words(text: str) -> List[str]:
     """
-    Convert text into a list of normalized lemmas using spaCy.
+    Convert text into a list of normalized lemmas (spaCy, or the fast backend).
     """
-    doc = nlp(text.lower())
+    return next(lemmatize_batch([text]))
+
+
+def _lemmas(doc) -> List[str]:
     return [token.lemma_ for token in doc if token.is_alpha]
 
 
-def extract_conditions(text: str) -> List[str]:
-    lemmas = normalize_words(text)
+def lemmatize_batch(texts, batch_size: int = 64):
+    """
+    Lemma list per text, lazily, from the configured backend.
+    """
+    if NLP_BACKEND == "fast":
+        lemmatizer = get_fast_lemmatizer()
+        return (lemmatizer.lemmas(t) for t in texts)
+    docs = get_nlp().pipe(((t or "").lower() for t in texts), batch_size=batch_size)
+    return (_lemmas(doc) for doc in docs)
+
+
+def _entities(lemmas: List[str]) -> tuple:
+    return condition_matcher.match(lemmas), symptom_matcher.match(lemmas)
+
+
+def cached_entities(text: str):
+    """
+    Memoized (conditions, symptoms) for the text, or None.
+    """
+    if entity_cache is None:
+        return None
+    cached = entity_cache.get(_history_key(text))
+    if cached is None:
+        return None
+    return list(cached[0]), list(cached[1])
+
+
+def remember_entities(text: str, entities: tuple) -> None:
+    if entity_cache is not None:
+        conditions, symptoms = entities
+        entity_cache.set(_history_key(text), (tuple(conditions), tuple(symptoms)))
+
+
+def extract_uncached(text: str) -> tuple:
+    return _entities(normalize_words(text))
 
-    found = []
-    for condition, variants in CONDITIONS.items():
-        for word in lemmas:
-            if word in variants:
-                found.append(condition)
-                break
-    return found
+
+def extract_entities(text: str) -> tuple:
+    """
+    (conditions, symptoms) from one lemmatizer pass over the text, memoized.
+    """
+    cached = cached_entities(text)
+    if cached is not None:
+        return cached
+    entities = extract_uncached(text)
+    remember_entities(text, entities)
+    return entities
+
+
+def extract_conditions(text: str) -> List[str]:
+    return condition_matcher.match(normalize_words(text))
 
 
 def extract_symptoms(text: str) -> List[str]:
-    lemmas = normalize_words(text)
-
-    found = []
-    for symptom, variants in SYMPTOMS.items():
-        for word in lemmas:
-            if word in variants:
-                found.append(symptom)
-                break
-    return found
+    return symptom_matcher.match(normalize_words(text))
+
+
+def extract_entities_batch(texts: List[str], batch_size: int = 64) -> List[tuple]:
+    """
+    (conditions, symptoms) for each text, from a single nlp.pipe pass
+    (one parse per text instead of one per extractor). Memoized texts and
+    repeats within the batch are parsed once.
+    """
+    if entity_cache is None:
+        return [_entities(lemmas) for lemmas in lemmatize_batch(texts, batch_size)]
+
+    keys = [_history_key(t) for t in texts]
+    found = {}
+    todo = {}  # key -> first text with that key
+    for key, text in zip(keys, texts):
+        if key in found or key in todo:
+            continue
+        cached = entity_cache.get(key)
+        if cached is not None:
+            found[key] = cached
+        else:
+            todo[key] = text
+
+    for key, lemmas in zip(todo, lemmatize_batch(todo.values(), batch_size)):
+        conditions, symptoms = _entities(lemmas)
+        found[key] = (tuple(conditions), tuple(symptoms))
+        entity_cache.set(key, found[key])
+    return [(list(found[k][0]), list(found[k][1])) for k in keys]
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from starlette.concurrency import run_in_threadpool
+
+from app import nlp
+from app.hedging import LatencyWindow
+
+logger = logging.getLogger("uvicorn.error")
+
+NLP_POOL_WORKERS = int(os.getenv("NLP_POOL_WORKERS", "0"))  # 0 = always inline
+NLP_POOL_MIN_CHARS = int(os.getenv("NLP_POOL_MIN_CHARS", "2000"))
+NLP_POOL_TIMEOUT_S = float(os.getenv("NLP_POOL_TIMEOUT_S", "10"))
+
+
+# -------------------------------------------------------------------
+# Child process side
+# -------------------------------------------------------------------
+def _preload() -> None:
+    # spaCy + en_core_web_sm load once per child, not per call
+    if nlp.NLP_BACKEND != "fast":
+        nlp.get_nlp()
+
+
+def _ping() -> bool:
+    return True
+
+
+# -------------------------------------------------------------------
+# Parent side
+# -------------------------------------------------------------------
+class NlpPool:
+    """
+    Runs entity extraction for long histories in worker processes, so a
+    long spaCy pass does not hold this worker's GIL while other requests
+    wait. Short texts stay inline (threadpool), where the round trip to a
+    child would cost more than the parse.
+
+    - memoized histories never reach the pool
+    - a call that takes longer than `timeout_s` returns no entities (the
+      answer is still generated, just without them) and is counted; the
+      child finishes the parse in the background
+    - if a child dies, the call runs inline and the pool is rebuilt
+    """
+
+    def __init__(
+        self,
+        *,
+        workers=0,
+        min_chars=2000,
+        timeout_s=10.0,
+        window=200,
+        executor: Executor | None = None,
+        extract=nlp.extract_uncached,
+    ):
+        self.workers = workers
+        self.min_chars = min_chars
+        self.timeout_s = timeout_s
+        self.latencies = LatencyWindow(window)
+        self._executor = executor
+        self._extract = extract
+        self._restart_lock = threading.Lock()
+
+        self.in_flight = 0
+        self.offloaded = 0
+        self.inline = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._executor is not None or self.workers > 0
+
+    def start(self) -> None:
+        if self._executor is None and self.workers > 0:
+            # spawn: forking a process that already runs threads and an event loop is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_preload,
+            )
+
+    def _restart(self, broken: Executor) -> None:
+        """
+        Replaces a pool whose child died (e.g. OOM-killed); the callers that
+        saw the same broken pool rebuild it once.
+        """
+        with self._restart_lock:
+            if self._executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.restarts += 1
+            self.start()
+
+    async def warm_up(self) -> None:
+        """
+        Starts every child (and its model load) before the first long history.
+        """
+        if self._executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers or 1))
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def extract_entities(self, text: str) -> tuple:
+        """
+        (conditions, symptoms), like nlp.extract_entities.
+        """
+        text = text or ""
+        cached = nlp.cached_entities(text)
+        if cached is not None:
+            return cached
+
+        if self._executor is None or len(text) < self.min_chars:
+            self.inline += 1
+            entities = await run_in_threadpool(self._extract, text)
+            nlp.remember_entities(text, entities)
+            return entities
+
+        self.offloaded += 1
+        self.in_flight += 1
+        start = time.perf_counter()
+        executor = self._executor
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, self._extract, text)
+            entities = await asyncio.wait_for(future, self.timeout_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("NLP pool call timed out after %.1fs (%d chars)", self.timeout_s, len(text))
+            return [], []
+        except BrokenProcessPool:
+            logger.warning("NLP pool worker died, restarting the pool; extracting inline")
+            await run_in_threadpool(self._restart, executor)
+            self.inline += 1
+            entities = await run_in_threadpool(self._extract, text)
+            nlp.remember_entities(text, entities)
+            return entities
+        finally:
+            self.in_flight -= 1
+        self.latencies.add(time.perf_counter() - start)
+        nlp.remember_entities(text, entities)
+        return entities
+
+    def stats(self) -> dict:
+        p50 = self.latencies.percentile(0.5)
+        p95 = self.latencies.percentile(0.95)
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "min_chars": self.min_chars,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "offloaded": self.offloaded,
+            "inline": self.inline,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+nlp_pool = NlpPool(
+    workers=NLP_POOL_WORKERS,
+    min_chars=NLP_POOL_MIN_CHARS,
+    timeout_s=NLP_POOL_TIMEOUT_S,
+)
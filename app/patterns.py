@@ -0,0 +1,25 @@
+import re
+
+
+def trie_pattern(words) -> str:
+    """
+    Alternation regex for literal words, factored by common prefixes
+    ("re(?:commend|duce )|..."): each position is rejected after a character
+    or two instead of being tried against every word, so the cost barely
+    grows with the number of words. Longer matches win.
+    """
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
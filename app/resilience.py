@@ -0,0 +1,250 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """The per-request time budget ran out before an answer arrived."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open; the upstream call was skipped."""
+
+
+# -------------------------------------------------------------------
+# Per-request deadline budget
+# -------------------------------------------------------------------
+class Deadline:
+    """
+    One time budget shared by every upstream call (and retry) of a request.
+    """
+
+    def __init__(self, budget_s: float, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+
+def backoff_delay(attempt: int, base_s: float, cap_s: float, rng=random.random) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2^attempt)].
+    """
+    return rng() * min(cap_s, base_s * (2 ** attempt))
+
+
+# -------------------------------------------------------------------
+# Circuit breaker
+# -------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open after `open_s` seconds.
+    half_open lets `half_open_probes` calls through: a success closes the
+    circuit, a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold=5,
+        open_s=30.0,
+        half_open_probes=1,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_s = open_s
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_s:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected (cheap check for fast degraded mode).
+        """
+        with self._lock:
+            state = self._current_state()
+            return state == self.OPEN or (
+                state == self.HALF_OPEN and self._probes_in_flight >= self.half_open_probes
+            )
+
+    def before_call(self) -> None:
+        """
+        Raises CircuitOpenError if the call must be skipped.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return
+            self.short_circuited += 1
+            raise CircuitOpenError(f"circuit {state}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probes_in_flight = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probes_in_flight = 0
+
+    def release_probe(self) -> None:
+        """
+        A call ended without telling us anything about upstream health
+        (cancelled, or a non-transient error): free its half-open slot.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+# -------------------------------------------------------------------
+# Retries within the deadline budget
+# -------------------------------------------------------------------
+class RetryPolicy:
+    """
+    Retries transient errors with jittered backoff, never past the deadline.
+
+    `fn(timeout)` is called with the per-attempt timeout: the smaller of
+    `call_timeout_s` and what is left of the deadline.
+
+    Only `failure_on` errors (default: all of `retry_on`) count against the
+    breaker; the others are retried without saying anything about upstream
+    health (e.g. every backend busy locally).
+    """
+
+    def __init__(
+        self,
+        *,
+        retry_on: tuple,
+        failure_on: tuple | None = None,
+        max_attempts=3,
+        call_timeout_s=20.0,
+        base_s=0.2,
+        cap_s=2.0,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.retry_on = retry_on
+        self.failure_on = retry_on if failure_on is None else failure_on
+        self.max_attempts = max_attempts
+        self.call_timeout_s = call_timeout_s
+        self.base_s = base_s
+        self.cap_s = cap_s
+        self.breaker = breaker
+
+        self.attempts = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    def _attempt_timeout(self, deadline: Deadline) -> float:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            self.deadline_exceeded += 1
+            raise DeadlineExceeded("request deadline exhausted")
+        if self.breaker is not None:
+            self.breaker.before_call()
+        self.attempts += 1
+        return min(self.call_timeout_s, remaining)
+
+    def _backoff_or_raise(self, attempt: int, deadline: Deadline, error: Exception) -> float:
+        if self.breaker is not None:
+            if isinstance(error, self.failure_on):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        delay = backoff_delay(attempt, self.base_s, self.cap_s)
+        if delay >= deadline.remaining():
+            raise error
+        self.retries += 1
+        return delay
+
+    def call(self, fn, deadline: Deadline):
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(deadline)
+            try:
+                result = fn(timeout)
+            except self.retry_on as e:
+                time.sleep(self._backoff_or_raise(attempt, deadline, e))
+                attempt += 1
+                continue
+            except BaseException:
+                if self.breaker is not None:
+                    self.breaker.release_probe()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def acall(self, coro_fn, deadline: Deadline):
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(deadline)
+            try:
+                result = await coro_fn(timeout)
+            except self.retry_on as e:
+                await asyncio.sleep(self._backoff_or_raise(attempt, deadline, e))
+                attempt += 1
+                continue
+            except BaseException:
+                if self.breaker is not None:
+                    self.breaker.release_probe()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
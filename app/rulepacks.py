@@ -0,0 +1,335 @@
+import json
+import re
+import string
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_constants
+    import sre_parse
+
+ANY_LOCALE = "*"
+MAX_PATTERN_LEN = 500
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+
+class RulePackError(ValueError):
+    """
+    The rule pack file is unreadable, malformed, or has a rejected pattern.
+    """
+
+
+@dataclass(frozen=True)
+class Rule:
+    category: str
+    pattern: str
+    locale: str = ANY_LOCALE
+
+
+@dataclass(frozen=True)
+class RulePack:
+    """
+    A versioned set of safety rules, each tagged with a category and locale.
+
+    File format (JSON, or YAML when PyYAML is installed):
+
+        {
+          "name": "default",
+          "version": "2024.06.1",
+          "locale": "en",                     # default for rules below
+          "rules": [
+            {"category": "diagnosis", "patterns": ["\\bdo i have\\b"]},
+            {"category": "diagnosis", "locale": "de", "patterns": ["\\bhabe ich\\b"]}
+          ]
+        }
+    """
+
+    name: str
+    version: str
+    rules: tuple[Rule, ...] = field(default_factory=tuple)
+
+    def for_locale(self, locale: str) -> dict[str, list[str]]:
+        """
+        category -> patterns for one locale (plus rules tagged "*").
+        """
+        out: dict[str, list[str]] = {}
+        for rule in self.rules:
+            if rule.locale in (locale, ANY_LOCALE):
+                out.setdefault(rule.category, []).append(rule.pattern)
+        return out
+
+    @property
+    def locales(self) -> list[str]:
+        return sorted({rule.locale for rule in self.rules})
+
+    @classmethod
+    def from_dict(cls, raw: dict, source: str = "<rule pack>") -> "RulePack":
+        if not isinstance(raw, dict) or not isinstance(raw.get("rules"), list):
+            raise RulePackError(f"{source}: expected an object with a 'rules' list")
+        if "version" not in raw:
+            raise RulePackError(f"{source}: missing 'version'")
+
+        default_locale = str(raw.get("locale", ANY_LOCALE))
+        rules = []
+        for i, entry in enumerate(raw["rules"]):
+            where = f"{source}: rules[{i}]"
+            if not isinstance(entry, dict) or not entry.get("category"):
+                raise RulePackError(f"{where}: needs a 'category'")
+            patterns = entry.get("patterns")
+            if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+                raise RulePackError(f"{where}: 'patterns' must be a list of strings")
+            for pattern in patterns:
+                try:
+                    check_pattern(pattern)
+                except RulePackError as e:
+                    raise RulePackError(f"{where}: {e}") from None
+                rules.append(
+                    Rule(str(entry["category"]), pattern, str(entry.get("locale", default_locale)))
+                )
+        return cls(str(raw.get("name", source)), str(raw["version"]), tuple(rules))
+
+
+def load_rule_pack(path: str | Path) -> RulePack:
+    path = Path(path)
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError as e:
+        raise RulePackError(f"{path}: {e}") from None
+
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RulePackError(f"{path}: YAML rule packs need PyYAML (pip install pyyaml)") from None
+        try:
+            raw = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise RulePackError(f"{path}: {e}") from None
+    else:
+        try:
+            raw = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RulePackError(f"{path}: {e}") from None
+    return RulePack.from_dict(raw, str(path))
+
+
+# -----------------------------
+# Pattern validation
+# -----------------------------
+
+def check_pattern(pattern: str) -> None:
+    """
+    Raises RulePackError for patterns that must not reach the request path:
+    - does not compile, or is longer than MAX_PATTERN_LEN
+    - backreferences
+    - shapes that backtrack catastrophically on a near miss:
+      - a variable repeat inside any repeat that can run more than once,
+        e.g. "(a+)+" or "(.*a){12}"
+      - alternatives inside such a repeat that can match the same text,
+        e.g. "(a|aa)*" or "(?:a|ab)+"
+      - adjacent variable repeats over overlapping characters, e.g. "\\s*\\s*"
+      Conservative: "(?:\\s+\\w+)*" is rejected too; use possessive
+      ("\\s++") or atomic groups, which never backtrack.
+    """
+    if len(pattern) > MAX_PATTERN_LEN:
+        raise RulePackError(f"pattern longer than {MAX_PATTERN_LEN} characters")
+    try:
+        re.compile(pattern)
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        raise RulePackError(f"invalid pattern {pattern!r}: {e}") from None
+
+    problem = _find_problem(parsed, in_repeat=False)
+    if problem:
+        raise RulePackError(f"rejected pattern {pattern!r}: {problem}")
+
+
+# Character sets for overlap checks: a frozenset of characters, or ANY.
+# Case-insensitive and approximate on purpose (ASCII classes): a false
+# overlap only rejects a rule, a missed one lets a slow rule through.
+ANY = None
+_CATEGORY_CHARS = {
+    sre_constants.CATEGORY_DIGIT: frozenset(string.digits),
+    sre_constants.CATEGORY_SPACE: frozenset(string.whitespace),
+    sre_constants.CATEGORY_WORD: frozenset(string.ascii_letters + string.digits + "_"),
+}
+_MAX_RANGE = 512
+
+
+def _union(a, b):
+    return ANY if a is ANY or b is ANY else a | b
+
+
+def _overlap(a, b) -> bool:
+    if a is ANY or b is ANY:
+        return bool(a is ANY and b is ANY or a or b)
+    return bool(a & b)
+
+
+def _literal(code: int) -> frozenset:
+    c = chr(code)
+    return frozenset((c.lower(), c.upper()))
+
+
+def _class_chars(items):
+    chars = frozenset()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars |= _literal(av)
+        elif op == sre_constants.RANGE and av[1] - av[0] <= _MAX_RANGE:
+            chars |= frozenset().union(*(_literal(c) for c in range(av[0], av[1] + 1)))
+        elif op == sre_constants.CATEGORY and av in _CATEGORY_CHARS:
+            chars |= _CATEGORY_CHARS[av]
+        else:  # NEGATE, wide ranges, other categories
+            return ANY
+    return chars
+
+
+def _chars(parsed):
+    """
+    Every character the (sub)pattern can consume.
+    """
+    chars = frozenset()
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            chars |= _literal(av)
+        elif op == sre_constants.IN:
+            chars = _union(chars, _class_chars(av))
+        elif op in _REPEATS or op == sre_constants.POSSESSIVE_REPEAT:
+            chars = _union(chars, _chars(av[2]))
+        elif op in (sre_constants.SUBPATTERN, sre_constants.ATOMIC_GROUP):
+            chars = _union(chars, _chars(av[-1] if op == sre_constants.SUBPATTERN else av))
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                chars = _union(chars, _chars(branch))
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue
+        else:  # ANY, NOT_LITERAL, ...
+            return ANY
+        if chars is ANY:
+            return ANY
+    return chars
+
+
+def _first(parsed):
+    """
+    (characters a match can start with, whether it can match "").
+    """
+    first = frozenset()
+    for op, av in parsed:
+        if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue
+        if op in _REPEATS or op == sre_constants.POSSESSIVE_REPEAT:
+            sub_first, sub_nullable = _first(av[2])
+            first = _union(first, sub_first)
+            if av[0] > 0 and not sub_nullable:
+                return first, False
+        elif op == sre_constants.SUBPATTERN or op == sre_constants.ATOMIC_GROUP:
+            sub_first, sub_nullable = _first(av[-1] if op == sre_constants.SUBPATTERN else av)
+            first = _union(first, sub_first)
+            if not sub_nullable:
+                return first, False
+        elif op == sre_constants.BRANCH:
+            nullable = False
+            for branch in av[1]:
+                sub_first, sub_nullable = _first(branch)
+                first = _union(first, sub_first)
+                nullable = nullable or sub_nullable
+            if not nullable:
+                return first, False
+        else:
+            return _union(first, _chars([(op, av)])), False
+    return first, True
+
+
+def _ambiguous_branch(branches) -> bool:
+    seen = frozenset()
+    for branch in branches:
+        first, nullable = _first(branch)
+        if nullable or _overlap(seen, first):
+            return True
+        seen = _union(seen, first)
+    return False
+
+
+_ZERO_WIDTH = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+
+
+def _edges(parsed):
+    """
+    (lead, trail, nullable) of a sequence: characters of the backtracking
+    repeats a match can start / end inside, and whether it can match "".
+    Nullable items are transparent: "a*b?a*" ends a* next to a*.
+    """
+    lead, trail, nullable = frozenset(), frozenset(), True
+    for op, av in parsed:
+        item_lead, item_trail, item_nullable = _item_edges(op, av)
+        if nullable:
+            lead = _union(lead, item_lead)
+        trail = _union(trail, item_trail) if item_nullable else item_trail
+        nullable = nullable and item_nullable
+    return lead, trail, nullable
+
+
+def _item_edges(op, av):
+    if op in _ZERO_WIDTH:
+        return frozenset(), frozenset(), True
+    if op in _REPEATS:
+        lo, hi, sub = av
+        sub_lead, sub_trail, sub_nullable = _edges(sub)
+        if lo != hi:
+            chars = _chars(sub)
+            return chars, chars, lo == 0 or sub_nullable
+        return sub_lead, sub_trail, lo == 0 or sub_nullable
+    if op == sre_constants.SUBPATTERN:  # capturing or not
+        return _edges(av[-1])
+    if op == sre_constants.BRANCH:
+        lead, trail, nullable = frozenset(), frozenset(), False
+        for branch in av[1]:
+            b_lead, b_trail, b_nullable = _edges(branch)
+            lead, trail = _union(lead, b_lead), _union(trail, b_trail)
+            nullable = nullable or b_nullable
+        return lead, trail, nullable
+    if op in (sre_constants.POSSESSIVE_REPEAT, sre_constants.ATOMIC_GROUP):
+        # never backtracked into
+        return frozenset(), frozenset(), _first([(op, av)])[1]
+    return frozenset(), frozenset(), False
+
+
+def _find_problem(parsed, in_repeat: bool) -> str | None:
+    """
+    in_repeat: inside a repeat that can run more than once.
+    """
+    open_chars = frozenset()  # repeats that can still be backtracking here
+    for op, av in parsed:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return "backreferences are not allowed"
+        lead, trail, nullable = _item_edges(op, av)
+        if _overlap(open_chars, lead):
+            return "adjacent repeats over the same characters (polynomial backtracking)"
+        if op in _REPEATS:
+            lo, hi, sub = av
+            if lo != hi and in_repeat:
+                return "variable repeat inside a repeat (catastrophic backtracking)"
+            problem = _find_problem(sub, in_repeat or hi > 1)
+        elif op == sre_constants.SUBPATTERN:
+            problem = _find_problem(av[-1], in_repeat)
+        elif op == sre_constants.BRANCH:
+            if in_repeat and _ambiguous_branch(av[1]):
+                return "alternatives inside a repeat can match the same text (catastrophic backtracking)"
+            problem = next(
+                (p for p in (_find_problem(b, in_repeat) for b in av[1]) if p), None
+            )
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            problem = _find_problem(av[1], in_repeat)
+        else:
+            # POSSESSIVE_REPEAT / ATOMIC_GROUP never backtrack; literals etc. are leaves
+            problem = None
+        if problem:
+            return problem
+        # a nullable item may match "", leaving the repeats before it adjacent
+        open_chars = _union(open_chars, trail) if nullable else trail
+    return None
@@ -1,70 +1,353 @@
+import asyncio
+import logging
+import os
 import re
+import threading
+from dataclasses import dataclass
 from typing import Optional
 
+from app.patterns import trie_pattern
+from app.rulepacks import RulePack, RulePackError, load_rule_pack
+
+logger = logging.getLogger("uvicorn.error")
+
+# Rule pack file (JSON/YAML); unset = the shipped pack (SHIPPED_RULES_FILE)
+SAFETY_RULES_FILE = os.getenv("SAFETY_RULES_FILE")
+SAFETY_LOCALE = os.getenv("SAFETY_LOCALE", "en")
+SAFETY_RULES_RELOAD_S = float(os.getenv("SAFETY_RULES_RELOAD_S", "5"))  # 0 = no hot reload
+
+# Optional local intent classifier (app/intent.py), run after the rules;
+# unset = rules only
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH")
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.8"))  # p(unsafe) to refuse
+
 DISCLAIMER = "This explanation is for educational purposes only and not medical advice."
 
 # -----------------------------
 # Unsafe intent patterns
 # -----------------------------
 
-DIAGNOSIS_PATTERNS = [
-    r"\bdo i have\b",
-    r"\bdo i suffer from\b",
-    r"\bam i diagnosed with\b",
-    r"\bwhat disease do i have\b",
-    r"\bwhat condition do i have\b",
-]
-
-TREATMENT_PATTERNS = [
-    r"\bwhat should i take\b",
-    r"\bwhat medicine\b",
-    r"\bwhat medication\b",
-    r"\btreatment for\b",
-    r"\bhow do i treat\b",
-    r"\bhow to cure\b",
-]
-
-MEDICATION_CHANGE_PATTERNS = [
-    r"\bshould i stop\b",
-    r"\bshould i start\b",
-    r"\bchange my medication\b",
-    r"\bincrease dosage\b",
-    r"\bdecrease dosage\b",
-]
-
-ACTION_ADVICE_PATTERNS = [
-    r"\bwhat should i do\b",
-    r"\bwhat can i do\b",
-    r"\bhow should i\b",
-]
-
-ALL_UNSAFE_PATTERNS = (
-    DIAGNOSIS_PATTERNS
-    + TREATMENT_PATTERNS
-    + MEDICATION_CHANGE_PATTERNS
-    + ACTION_ADVICE_PATTERNS
+DIAGNOSIS = "diagnosis"
+TREATMENT = "treatment"
+MEDICATION_CHANGE = "medication_change"
+ACTION_ADVICE = "action_advice"
+
+# The built-in rules live in one place, the shipped pack; the pattern lists
+# below are read from it
+SHIPPED_RULES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "safety_rules.json"
+)
+BUILTIN_PACK = load_rule_pack(SHIPPED_RULES_FILE)
+
+UNSAFE_PATTERNS = BUILTIN_PACK.for_locale("en")
+
+DIAGNOSIS_PATTERNS = UNSAFE_PATTERNS.get(DIAGNOSIS, [])
+TREATMENT_PATTERNS = UNSAFE_PATTERNS.get(TREATMENT, [])
+MEDICATION_CHANGE_PATTERNS = UNSAFE_PATTERNS.get(MEDICATION_CHANGE, [])
+ACTION_ADVICE_PATTERNS = UNSAFE_PATTERNS.get(ACTION_ADVICE, [])
+
+ALL_UNSAFE_PATTERNS = [pattern for patterns in UNSAFE_PATTERNS.values() for pattern in patterns]
+
+REFUSAL = (
+    "I can’t help with diagnosing conditions, recommending treatments, "
+    "or giving personalized medical advice. "
+    "I can explain general medical information or help you prepare questions "
+    "to discuss with a healthcare professional. "
+    + DISCLAIMER
 )
 
 
+# -----------------------------
+# Compiled engine
+# -----------------------------
+
+# r"\bsome phrase\b": matched through the shared phrase trie
+_PHRASE_RE = re.compile(r"\\b([a-z0-9' ]+)\\b")
+
+
+@dataclass(frozen=True)
+class SafetyResult:
+    """
+    categories: every category that matched, in order of first match
+    spans: (category, start, end) per match, over the lowercased question
+    source: "rules" or "intent_model"; score: the model's p(unsafe)
+    """
+
+    categories: tuple[str, ...] = ()
+    spans: tuple[tuple[str, int, int], ...] = ()
+    source: str = "rules"
+    score: Optional[float] = None
+
+    @property
+    def blocked(self) -> bool:
+        return bool(self.categories)
+
+    @property
+    def category(self) -> Optional[str]:
+        return self.categories[0] if self.categories else None
+
+    @property
+    def refusal(self) -> Optional[str]:
+        return REFUSAL if self.categories else None
+
+
+def _phrase_table(phrases: dict[str, list[str]]) -> dict[str, list[tuple[str, int]]]:
+    """
+    Phrase -> (category, length) hits. A phrase also carries the hits of every
+    phrase that is a word-bounded prefix of it: the trie reports the longest
+    phrase starting at a position, and the shorter ones matched there too.
+    """
+    table = {}
+    for phrase in phrases:
+        hits: dict[str, int] = {}
+        ends = sorted({b.start() for b in re.finditer(r"\b", phrase)}, reverse=True)
+        for end in ends:
+            for category in phrases.get(phrase[:end], ()):
+                hits.setdefault(category, end)
+        table[phrase] = list(hits.items())
+    return table
+
+
+class SafetyEngine:
+    """
+    All unsafe-intent rules compiled into one regex, scanned once per question.
+
+    - plain phrase rules (r"\\bdo i have\\b") share one prefix-factored
+      alternation, so thousands of them cost about as much as twenty
+    - any other regex becomes its own named branch
+    A match resumes the scan one character later, and every rule that also
+    matches where it starts is checked there, so overlapping rules of
+    different categories are all reported.
+    """
+
+    def __init__(self, rules: dict[str, list[str]]):
+        self.rules = {category: list(patterns) for category, patterns in rules.items()}
+        self._phrases: dict[str, list[str]] = {}
+        self._groups: dict[str, str] = {}
+        self._branches: list[tuple[str, re.Pattern]] = []
+
+        branches = []
+        for category, patterns in self.rules.items():
+            for pattern in patterns:
+                phrase = _PHRASE_RE.fullmatch(pattern)
+                if phrase:
+                    cats = self._phrases.setdefault(phrase.group(1), [])
+                    if category not in cats:
+                        cats.append(category)
+                else:
+                    group = f"r{len(self._groups)}"
+                    branch = f"(?P<{group}>{pattern})"
+                    # Compiled as it will sit in the combined regex, so a bad
+                    # rule fails here: inline global flags such as (?i) and
+                    # numbered backreferences are errors inside a group
+                    self._branches.append((category, re.compile(branch)))
+                    self._groups[group] = category
+                    branches.append(branch)
+        self._phrase_hits = _phrase_table(self._phrases)
+        if self._phrases:
+            branches.insert(0, rf"\b(?:{trie_pattern(self._phrases)})\b")
+
+        self._regex = re.compile("|".join(branches)) if branches else None
+
+    def __len__(self) -> int:
+        return sum(len(patterns) for patterns in self.rules.values())
+
+    def classify(self, question: str) -> SafetyResult:
+        if self._regex is None:
+            return SafetyResult()
+        q = (question or "").lower()
+
+        categories: list[str] = []
+        spans = []
+        m = self._regex.search(q)
+        while m is not None:
+            start = m.start()
+            # The alternation reports one branch per position; the phrase
+            # table and the other branches give the rest of the hits there
+            hits = [] if m.lastgroup else [(c, start + n) for c, n in self._phrase_hits[m.group()]]
+            for category, branch in self._branches:
+                hit = branch.match(q, start)
+                if hit is not None:
+                    hits.append((category, hit.end()))
+            for category, end in hits:
+                spans.append((category, start, end))
+                if category not in categories:
+                    categories.append(category)
+            m = self._regex.search(q, start + 1)
+        return SafetyResult(tuple(categories), tuple(spans))
+
+
+class SafetyRules:
+    """
+    The active rule pack and its compiled engine.
+
+    reload() parses, validates and compiles a new pack off the request path,
+    then swaps (pack, engine) in with one assignment: requests see either the
+    old engine or the new one, never a half-built one. A pack that fails to
+    load keeps the previous one active.
+    """
+
+    def __init__(self, path: Optional[str] = None, locale: str = "en", default: RulePack = BUILTIN_PACK):
+        self.path = path
+        self.locale = locale
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._watch_task = None
+
+        # At startup a broken pack is fatal: better no deploy than no rules
+        pack = load_rule_pack(path) if path else default
+        self._mtime = self._file_mtime()
+        self._active = (pack, SafetyEngine(pack.for_locale(locale)))
+
+    @property
+    def pack(self) -> RulePack:
+        return self._active[0]
+
+    @property
+    def engine(self) -> SafetyEngine:
+        return self._active[1]
+
+    def classify(self, question: str) -> SafetyResult:
+        return self._active[1].classify(question)
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Loads the file again if it changed (or `force`). True if swapped.
+        """
+        if not self.path:
+            return False
+        with self._lock:
+            mtime = self._file_mtime()
+            if not force and mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            try:
+                pack = load_rule_pack(self.path)
+                engine = SafetyEngine(pack.for_locale(self.locale))
+            except (RulePackError, re.error) as e:
+                self.reload_errors += 1
+                self.last_error = str(e)[:300]
+                logger.warning("safety rules not reloaded, keeping %s: %s", self.pack.version, e)
+                return False
+            self._active = (pack, engine)
+            self.reloads += 1
+            self.last_error = None
+        logger.info("safety rules reloaded: %s %s (%d rules)", pack.name, pack.version, len(engine))
+        return True
+
+    def start_watching(self, interval_s: float) -> None:
+        """
+        Polls the file's mtime; parsing and compiling run in a worker thread.
+        """
+        async def loop():
+            while True:
+                await asyncio.sleep(interval_s)
+                await asyncio.to_thread(self.reload)
+
+        if self.path and self._watch_task is None:
+            self._watch_task = asyncio.create_task(loop())
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def stats(self) -> dict:
+        pack, engine = self._active
+        return {
+            "source": self.path or "builtin",
+            "name": pack.name,
+            "version": pack.version,
+            "locale": self.locale,
+            "rules": len(engine),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+        }
+
+
+rules = SafetyRules(SAFETY_RULES_FILE, SAFETY_LOCALE)
+
+
+# -----------------------------
+# Intent classifier (loaded on first use: imports NumPy)
+# -----------------------------
+
+_intent_model = None
+_intent_lock = threading.Lock()
+
+
+def get_intent_model():
+    """
+    The IntentModel from INTENT_MODEL_PATH, or None when it is not configured.
+    """
+    global _intent_model
+    if _intent_model is None and INTENT_MODEL_PATH:
+        with _intent_lock:
+            if _intent_model is None:
+                from app.intent import IntentModel
+
+                _intent_model = IntentModel.load(INTENT_MODEL_PATH, INTENT_THRESHOLD)
+    return _intent_model
+
+
+def is_intent_model_loaded() -> bool:
+    return _intent_model is not None
+
+
+def _model_result(category: Optional[str], score: float) -> SafetyResult:
+    if category is None:
+        return SafetyResult(score=score)
+    return SafetyResult((category,), source="intent_model", score=score)
+
+
 # -----------------------------
 # Safety check function
 # -----------------------------
 
+def classify_safety(question: str) -> SafetyResult:
+    """
+    Which unsafe-intent categories the question matches (empty if allowed).
+    Rules first; questions they allow go to the intent model, if configured.
+    """
+    result = rules.classify(question)
+    model = get_intent_model()
+    if result.blocked or model is None:
+        return result
+    return _model_result(*model.classify(question))
+
+
+def classify_safety_batch(questions: list[str]) -> list[SafetyResult]:
+    """
+    classify_safety for many questions; the intent model scores all
+    rule-allowed questions in one vectorized pass.
+    """
+    results = [rules.classify(q) for q in questions]
+    model = get_intent_model()
+    if model is None:
+        return results
+    pending = [i for i, r in enumerate(results) if not r.blocked]
+    for i, scored in zip(pending, model.classify_batch([questions[i] for i in pending])):
+        results[i] = _model_result(*scored)
+    return results
+
+
 def check_safety(question: str) -> Optional[str]:
     """
     Returns a refusal message if the question is unsafe.
     Returns None if the question is allowed.
     """
-    q = question.lower()
-
-    for pattern in ALL_UNSAFE_PATTERNS:
-        if re.search(pattern, q):
-            return (
-                "I can’t help with diagnosing conditions, recommending treatments, "
-                "or giving personalized medical advice. "
-                "I can explain general medical information or help you prepare questions "
-                "to discuss with a healthcare professional. "
-                + DISCLAIMER
-            )
-
-    return None
+    return classify_safety(question).refusal
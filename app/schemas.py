@@ -39,3 +39,33 @@ class AnswerResponse(BaseModel):
     """
     answer: str
     note: str  # always includes educational disclaimer
+
+
+class BatchQuestionRequest(BaseModel):
+    """
+    Request body for /ask/batch: independent /ask requests, answered in order.
+    """
+    items: List[QuestionRequest]
+
+
+class BatchAnswerItem(BaseModel):
+    """
+    One answer of /ask/batch.
+
+    - status: HTTP status the same request would get from /ask (200/400/500/503)
+    - blocked: True when the safety gate refused the question
+    """
+    index: int
+    status: int
+    answer: str
+    blocked: bool = False
+    latency_ms: int
+
+
+class BatchAnswerResponse(BaseModel):
+    """
+    Response body from /ask/batch.
+    """
+    items: List[BatchAnswerItem]
+    note: str  # always includes educational disclaimer
+    latency_ms: int
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the
+    leader) runs the function, every duplicate that arrives while it is
+    still running waits for the same result (or exception).
+
+    Sync and async callers share one in-flight table, so a duplicate can
+    join a call started by either kind of caller:
+    - do(key, fn, ...): blocking; must not be called on the event loop thread
+    - ado(key, coro_fn, ...): awaitable
+
+    An async leader runs its coroutine as a separate task, so cancelling the
+    leader's request does not cancel the shared call for the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+
+        self.leaders = 0
+        self.shared = 0  # duplicate calls that did not go upstream
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.shared += 1
+                return fut, False
+
+            fut = Future()
+            self._inflight[key] = fut
+            self.leaders += 1
+            return fut, True
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def do(self, key: str, fn, *args, **kwargs):
+        fut, leader = self._join(key)
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._release(key)
+            fut.set_exception(e)
+            raise
+
+        self._release(key)
+        fut.set_result(result)
+        return result
+
+    async def ado(self, key: str, coro_fn, *args, **kwargs):
+        fut, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            task.add_done_callback(lambda t: self._settle(key, fut, t))
+
+        # shield: a cancelled waiter must not cancel the shared future
+        return await asyncio.shield(asyncio.wrap_future(fut))
+
+    def _settle(self, key: str, fut: Future, task: asyncio.Task) -> None:
+        self._release(key)
+        if task.cancelled():
+            fut.set_exception(asyncio.CancelledError())
+        elif task.exception() is not None:
+            fut.set_exception(task.exception())
+        else:
+            fut.set_result(task.result())
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "duplicates_saved": self.shared,
+        }
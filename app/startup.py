@@ -0,0 +1,72 @@
+import logging
+import time
+from contextlib import contextmanager
+
+# uvicorn's logger, so the breakdown shows up next to the server logs
+logger = logging.getLogger("uvicorn.error")
+
+
+class StartupTracker:
+    """
+    Per-component warm state and timings for /ready and the startup log.
+
+    Component states: cold -> warming -> ready | error; off when the
+    component is not configured
+    """
+
+    COLD = "cold"
+    WARMING = "warming"
+    READY = "ready"
+    ERROR = "error"
+    OFF = "off"
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self.states: dict[str, str] = {}
+        self.seconds: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self.states[name] = self.READY
+        self.seconds[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a warm-up step. Errors are recorded (and logged), not raised:
+        a failed warm-up leaves the component to load lazily on first use.
+        """
+        self.states[name] = self.WARMING
+        t0 = self._clock()
+        try:
+            yield
+        except Exception as e:
+            self.states[name] = self.ERROR
+            self.errors[name] = repr(e)[:200]
+            logger.warning("warm-up of %s failed: %s", name, self.errors[name])
+        else:
+            self.states[name] = self.READY
+        finally:
+            self.seconds[name] = self._clock() - t0
+
+    def state(self, name: str, loaded: bool = False, enabled: bool = True) -> str:
+        if not enabled:
+            return self.OFF
+        # Loaded lazily by a request counts as ready too
+        if loaded:
+            return self.READY
+        return self.states.get(name, self.COLD)
+
+    def component(self, name: str, loaded: bool = False, enabled: bool = True) -> dict:
+        seconds = self.seconds.get(name)
+        return {
+            "state": self.state(name, loaded, enabled),
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "error": self.errors.get(name),
+        }
+
+    def log_breakdown(self) -> None:
+        parts = ", ".join(f"{name}={s:.2f}s" for name, s in self.seconds.items())
+        total = self._clock() - self.started
+        logger.info("startup: %.2fs total (%s)", total, parts)
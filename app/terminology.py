@@ -0,0 +1,166 @@
+import csv
+import re
+from pathlib import Path
+
+# Lemma lists only keep alphabetic tokens (token.is_alpha), so terms are
+# split the same way: "type 2 diabetes" -> ("type", "diabetes")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+_END = ""  # trie key holding the canonical ids a path ends; never a real token
+
+
+def term_tokens(term: str) -> tuple[str, ...]:
+    return tuple(_WORD_RE.findall(term.lower()))
+
+
+class TermMatcher:
+    """
+    Maps single- and multi-word terms to canonical names with a token trie.
+
+    match() walks the trie from every token, so one pass costs
+    O(tokens x longest term) whatever the size of the lexicon.
+    Results are canonical names in lexicon order, each once.
+    """
+
+    def __init__(self, terms: dict[str, list[str]]):
+        self.names = list(terms)
+        self.size = 0
+        self._root: dict = {}
+        for rank, (canonical, variants) in enumerate(terms.items()):
+            for variant in variants:
+                tokens = term_tokens(variant)
+                if not tokens:
+                    continue
+                node = self._root
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(_END, set()).add(rank)
+                self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def vocabulary(self) -> set[str]:
+        """
+        Every word used by a term.
+        """
+        words = set()
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for token, child in node.items():
+                if token != _END:
+                    words.add(token)
+                    stack.append(child)
+        return words
+
+    def match(self, tokens: list[str]) -> list[str]:
+        root = self._root
+        n = len(tokens)
+        found = set()
+        for i in range(n):
+            node = root.get(tokens[i])
+            j = i + 1
+            while node is not None:
+                ranks = node.get(_END)
+                if ranks:
+                    found |= ranks
+                if j == n:
+                    break
+                node = node.get(tokens[j])
+                j += 1
+        return [self.names[rank] for rank in sorted(found)]
+
+
+def load_lexicon(path: str | Path) -> dict[str, dict[str, list[str]]]:
+    """
+    CSV with a header row: kind,canonical,term (one synonym per line), e.g.
+
+        kind,canonical,term
+        condition,hypertension,high blood pressure
+        symptom,fatigue,tiredness
+
+    Returns kind -> canonical -> terms, in file order. The canonical name
+    itself is not added as a term unless it has its own line.
+    """
+    lexicon: dict[str, dict[str, list[str]]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            kind, canonical, term = row["kind"].strip(), row["canonical"].strip(), row["term"].strip()
+            if kind and canonical and term:
+                lexicon.setdefault(kind, {}).setdefault(canonical, []).append(term)
+    return lexicon
+
+
+# -------------------------------------------------------------------
+# spaCy-free lemmas for the lexicon (NLP_BACKEND=fast)
+# -------------------------------------------------------------------
+_IRREGULAR = {
+    "feet": "foot",
+    "teeth": "tooth",
+    "children": "child",
+    "women": "woman",
+    "men": "man",
+    "mice": "mouse",
+    "lice": "louse",
+    "bled": "bleed",
+    "bleeding": "bleed",
+    "ate": "eat",
+    "slept": "sleep",
+    "felt": "feel",
+    "worse": "bad",
+    "worst": "bad",
+}
+_VOWELS = set("aeiou")
+
+
+def _inflections(lemma: str):
+    yield lemma + "s"
+    if lemma.endswith(("s", "x", "z", "ch", "sh")):
+        yield lemma + "es"
+    if lemma.endswith("y") and len(lemma) > 2 and lemma[-2] not in _VOWELS:
+        yield lemma[:-1] + "ies"
+        yield lemma[:-1] + "ied"
+    if lemma.endswith("e"):
+        yield lemma[:-1] + "ing"
+        yield lemma + "d"
+    else:
+        yield lemma + "ing"
+        yield lemma + "ed"
+    # stop -> stopping; not for w/x/y endings (snowing, fixing, playing)
+    if (
+        len(lemma) >= 3
+        and lemma[-1] not in _VOWELS | {"w", "x", "y"}
+        and lemma[-2] in _VOWELS
+        and lemma[-3] not in _VOWELS
+    ):
+        yield lemma + lemma[-1] + "ing"
+        yield lemma + lemma[-1] + "ed"
+
+
+class FastLemmatizer:
+    """
+    Regex tokenizer + inflection table, precomputed for the lexicon's words.
+
+    Only words that can complete a lexicon term need spaCy's lemma; every
+    other word is passed through lowercased (it cannot match either way).
+    For each term word the table maps its regular inflections (-s, -es,
+    -ies, -ing, -ed, doubled consonants) and a few irregular forms back to
+    it; a term word always maps to itself.
+    """
+
+    def __init__(self, vocabulary):
+        vocabulary = set(vocabulary)
+        self.table: dict[str, str] = {}
+        for lemma in sorted(vocabulary):
+            for form in _inflections(lemma):
+                if form not in vocabulary:
+                    self.table.setdefault(form, lemma)
+        for form, lemma in _IRREGULAR.items():
+            if lemma in vocabulary and form not in vocabulary:
+                self.table[form] = lemma
+
+    def lemmas(self, text: str) -> list[str]:
+        get = self.table.get
+        return [get(word, word) for word in _WORD_RE.findall((text or "").lower())]
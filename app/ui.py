@@ -279,7 +279,7 @@ HTML = """
       <div class="small" id="smallNote"></div>
       <div class="hint">
         Chat state & context are saved in this browser until you start a new chat or clear data.
-        Tip: open <code>/docs</code> to test <code>/ask</code> directly using Swagger.
+        Answers stream from <code>/ask/stream</code>. Tip: open <code>/docs</code> to test <code>/ask</code> directly using Swagger.
       </div>
     </div>
   </div>
@@ -538,6 +538,22 @@ function clearAll() {
   updateSendEnabled();
 }
 
+// Parse one SSE block ("event: x\ndata: {...}") into {event, data}
+function parseSse(block) {
+  let event = "message";
+  const dataLines = [];
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+  }
+  if (!dataLines.length) return null;
+  try {
+    return { event, data: JSON.parse(dataLines.join("\n")) };
+  } catch (_) {
+    return null;
+  }
+}
+
 async function sendChat() {
   const text = (inputEl().value || "").trim();
   if (!text) return;
@@ -571,30 +587,70 @@ async function sendChat() {
   const assistantBubble = addMsg("assistant", "…");
 
   try {
-    const res = await fetch("/ask", {
+    const res = await fetch("/ask/stream", {
       method: "POST",
       headers: {"Content-Type": "application/json"},
       body: JSON.stringify(payload),
     });
 
-    const latencyHeader = res.headers.get("x-latency-ms");
-    if (latencyHeader) latencyEl.textContent = latencyHeader;
-
-    const dataText = await res.text();
-    let obj = null;
-    try { obj = JSON.parse(dataText); } catch (_) {}
-
     if (!res.ok) {
+      const dataText = await res.text();
+      let obj = null;
+      try { obj = JSON.parse(dataText); } catch (_) {}
+
       setStatus(false, "error");
-      const errMsg = obj?.error ? ("Error: " + obj.error) : ("Error: HTTP " + res.status);
+      const errMsg = obj?.answer ?? (obj?.error ? ("Error: " + obj.error) : ("Error: HTTP " + res.status));
       assistantBubble.textContent = errMsg;
       small.textContent = "Server returned HTTP " + res.status + " " + res.statusText;
       saveState();
       return;
     }
 
+    // Read server-sent events: token* (reset token*)? final | error
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let streamed = "";
+    let answer = null;
+    let errorText = null;
+
+    setStatus(null, "streaming");
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let idx;
+      while ((idx = buffer.indexOf("\n\n")) >= 0) {
+        const evt = parseSse(buffer.slice(0, idx));
+        buffer = buffer.slice(idx + 2);
+        if (!evt) continue;
+
+        if (evt.event === "token") {
+          streamed += evt.data.text;
+          assistantBubble.textContent = streamed;
+          chatEl().scrollTop = chatEl().scrollHeight;
+        } else if (evt.event === "reset") {
+          streamed = "";
+          assistantBubble.textContent = "…";
+          setStatus(null, "rewriting");
+        } else if (evt.event === "final") {
+          answer = evt.data.answer;
+          if (evt.data.latency_ms != null) latencyEl.textContent = evt.data.latency_ms;
+        } else if (evt.event === "error") {
+          errorText = evt.data.error;
+        }
+      }
+    }
+
+    if (answer === null) {
+      setStatus(false, "error");
+      assistantBubble.textContent = errorText || "Error: stream ended without an answer";
+      saveState();
+      return;
+    }
+
     setStatus(true, "ok");
-    const answer = obj?.answer ?? dataText;
     assistantBubble.textContent = answer;
     chatHistory.push({ role: "assistant", content: answer });
     small.textContent = "Success.";
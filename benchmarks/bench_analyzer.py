@@ -0,0 +1,119 @@
+"""
+Compares app.analyzer with the per-check functions it replaced.
+
+Run from the repo root:
+    python -m benchmarks.bench_analyzer
+
+Checks that both give the same flags and cleaned text on the corpus, then
+times the checks the pipeline runs on one candidate answer:
+acceptable (reasoning + advice + disclaimer-only) + cleanup, and the
+forbidden-fragment check.
+"""
+import re
+import timeit
+
+from app.analyzer import (
+    ADVICE_MARKERS,
+    DISCLAIMER,
+    FORBIDDEN_FRAGMENTS,
+    REASONING_MARKERS,
+    analyze,
+)
+from app.mock_router import ADVICE_ANSWER, CLEAN_ANSWER, REASONING_ANSWER
+
+
+# -------------------------------------------------------------------
+# Previous implementation (app/models.py before the analyzer)
+# -------------------------------------------------------------------
+def legacy_has_reasoning(text: str) -> bool:
+    t = (text or "").strip().lower()
+    if t.startswith("we need") or t.startswith("so we need"):
+        return True
+    return any(marker.lower() in t for marker in REASONING_MARKERS)
+
+
+def legacy_looks_like_advice(text: str) -> bool:
+    t = (text or "").lower()
+    return any(marker in t for marker in ADVICE_MARKERS)
+
+
+def legacy_is_disclaimer_only(text: str) -> bool:
+    if not text:
+        return True
+    t = re.sub(r"\s+", " ", text).strip()
+    d = DISCLAIMER.strip()
+    return (t == d) or (t == f"{d}.") or (len(t) <= len(d) + 2)
+
+
+def legacy_has_forbidden(text: str) -> bool:
+    lowered = text.lower()
+    return any(fragment.lower() in lowered for fragment in FORBIDDEN_FRAGMENTS)
+
+
+def legacy_clean(text: str) -> str:
+    if not text:
+        return ""
+    text = re.sub(r"(?is)here are my reasoning steps:.*?(?=\n\n|$)", "", text).strip()
+    text = re.sub(r"(?im)^(we need|so we need|therefore we need).*$", "", text).strip()
+    text = re.sub(r"(?im)^we must.*$", "", text).strip()
+    text = re.sub(r"(?im)^thus we need.*$", "", text).strip()
+    text = re.sub(re.escape(DISCLAIMER), "", text).strip()
+    if not text:
+        return ""
+    if not text.endswith(DISCLAIMER):
+        if text and not text.endswith((".", "!", "?")):
+            text += "."
+        text = text.strip() + " " + DISCLAIMER
+    return text.strip()
+
+
+def legacy(text: str):
+    acceptable = (
+        not legacy_has_reasoning(text)
+        and not legacy_looks_like_advice(text)
+        and not legacy_is_disclaimer_only(text)
+    )
+    return acceptable, legacy_has_forbidden(text), legacy_clean(text)
+
+
+def compiled(text: str):
+    a = analyze(text)
+    return a.acceptable, a.has_forbidden, a.cleaned_text
+
+
+# -------------------------------------------------------------------
+# Corpus
+# -------------------------------------------------------------------
+def _long(answer: str, n: int) -> str:
+    body = answer.replace(DISCLAIMER, "").strip()
+    return "\n\n".join([body] * n) + " " + DISCLAIMER
+
+
+CORPUS = {
+    "short clean": CLEAN_ANSWER,
+    "short reasoning": REASONING_ANSWER,
+    "short advice": ADVICE_ANSWER,
+    "long clean (x20)": _long(CLEAN_ANSWER, 20),
+    "long clean (x100)": _long(CLEAN_ANSWER, 100),
+    "long advice (x100)": _long(ADVICE_ANSWER, 100),
+    "meta lines": "Here are my reasoning steps: a\n\nWe must x\nBody text\n" + DISCLAIMER,
+}
+
+
+def main():
+    for name, text in CORPUS.items():
+        assert legacy(text) == compiled(text), f"mismatch on {name!r}"
+
+    print(f"{'text':<22}{'chars':>8}{'legacy us':>12}{'analyzer us':>13}{'speedup':>9}")
+    for name, text in CORPUS.items():
+        n = 2000 if len(text) < 5000 else 200
+        t_legacy = min(timeit.repeat(lambda: legacy(text), number=n, repeat=5)) / n
+        t_new = min(timeit.repeat(lambda: compiled(text), number=n, repeat=5)) / n
+        print(
+            f"{name:<22}{len(text):>8}{t_legacy * 1e6:>12.1f}{t_new * 1e6:>13.1f}"
+            f"{t_legacy / t_new:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
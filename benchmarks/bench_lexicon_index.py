@@ -0,0 +1,104 @@
+"""
+Startup cost of the terminology index: parsing the CSV and building
+TermMatcher tries vs opening the compiled, memory-mapped index.
+
+Run from the repo root:
+    python -m benchmarks.bench_lexicon_index
+
+Also times one history's worth of lemmas through both matchers, since the
+mapped index trades dict lookups for hash probes into the file, and the
+real `import app.nlp` in a fresh interpreter (wall time and peak RSS) with
+NLP_LEXICON_FILE vs NLP_LEXICON_INDEX, plus building the fast backend's
+inflection table on top.
+"""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+from app.lexicon_index import MappedLexicon, compile_lexicon
+from app.terminology import TermMatcher, load_lexicon
+from benchmarks.bench_terminology import HISTORY, lexicon
+
+
+def write_csv(path: Path, terms: dict[str, list[str]]) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "canonical", "term"])
+        for canonical, variants in terms.items():
+            for variant in variants:
+                writer.writerow(["condition", canonical, variant])
+
+
+# Peak RSS from VmHWM (Linux): ru_maxrss keeps the forking parent's peak
+IMPORT_PROBE = """
+import time
+t0 = time.perf_counter()
+from app import nlp
+t_import = time.perf_counter() - t0
+if {build_lemmatizer}:
+    nlp.get_fast_lemmatizer()
+t_total = time.perf_counter() - t0
+with open("/proc/self/status") as f:
+    peak_kb = next(line.split()[1] for line in f if line.startswith("VmHWM"))
+print(t_import, t_total, peak_kb)
+"""
+
+
+def probe_import(env: dict, build_lemmatizer: bool) -> tuple[float, float, float]:
+    """
+    (import s, import + lemmatizer s, peak RSS MB) of `import app.nlp`.
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(build_lemmatizer=build_lemmatizer)],
+        env={**os.environ, **env},
+        cwd=Path(__file__).resolve().parents[1],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(out[0]), float(out[1]), float(out[2]) / 1024
+
+
+def main():
+    print(f"{'terms':>8}{'csv load ms':>13}{'mmap open ms':>14}{'trie us':>10}{'mmap us':>10}{'index KB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (1_000, 10_000, 100_000):
+            csv_path = Path(tmp) / f"lexicon-{n}.csv"
+            idx_path = Path(tmp) / f"lexicon-{n}.idx"
+            write_csv(csv_path, lexicon(n))
+            compile_lexicon(load_lexicon(csv_path), idx_path)
+
+            t0 = time.perf_counter()
+            trie = TermMatcher(load_lexicon(csv_path)["condition"])
+            t_csv = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            mapped = MappedLexicon(idx_path).matcher("condition")
+            t_open = time.perf_counter() - t0
+
+            assert mapped.match(HISTORY) == trie.match(HISTORY)
+            t_trie = min(timeit.repeat(lambda: trie.match(HISTORY), number=200, repeat=3)) / 200
+            t_mmap = min(timeit.repeat(lambda: mapped.match(HISTORY), number=200, repeat=3)) / 200
+            print(
+                f"{len(trie):>8}{t_csv * 1e3:>13.1f}{t_open * 1e3:>14.2f}"
+                f"{t_trie * 1e6:>10.1f}{t_mmap * 1e6:>10.1f}{idx_path.stat().st_size / 1024:>10.0f}"
+            )
+
+        print(f"\nimport app.nlp, {len(trie)} terms (fresh interpreter)")
+        print(f"{'source':>8}{'import ms':>11}{'+ fast table ms':>17}{'peak RSS MB':>13}")
+        for name, env in (
+            ("csv", {"NLP_LEXICON_FILE": str(csv_path)}),
+            ("index", {"NLP_LEXICON_INDEX": str(idx_path)}),
+        ):
+            t_import, t_total, rss = probe_import(env, build_lemmatizer=False)
+            _, t_fast, rss_fast = probe_import(env, build_lemmatizer=True)
+            print(f"{name:>8}{t_import * 1e3:>11.0f}{t_fast * 1e3:>17.0f}{rss:>8.0f} / {rss_fast:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the compiled safety engine with the per-pattern re.search loop it
+replaced, on the shipped rule set (~20 patterns) and on a generated one with
+a few thousand phrase rules.
+
+Run from the repo root:
+    python -m benchmarks.bench_safety
+
+Checks that both block the same questions, then times one check per question.
+"""
+import itertools
+import re
+import time
+import timeit
+
+from app.safety import UNSAFE_PATTERNS, SafetyEngine
+
+QUESTIONS = {
+    "allowed short": "What does HbA1c mean?",
+    "allowed long": (
+        "My report mentions type 2 diabetes, hypertension and mild kidney disease. "
+        "Can you explain in general terms what these conditions are, how they are "
+        "usually described in medical records, and what the lab values mean?"
+    ),
+    "blocked early": "Do I have diabetes based on this report?",
+    "blocked late": (
+        "I have read a lot about blood sugar, insulin resistance and the kidneys "
+        "over the last few weeks, so what should I do next?"
+    ),
+}
+
+
+def legacy_check(rules: dict[str, list[str]], question: str) -> bool:
+    # app/safety.py before the engine: one re.search per pattern
+    q = question.lower()
+    for patterns in rules.values():
+        for pattern in patterns:
+            if re.search(pattern, q):
+                return True
+    return False
+
+
+def large_rules(n: int = 3000) -> dict[str, list[str]]:
+    """
+    The shipped rules plus generated "should i <verb> <drug>" style phrases.
+    """
+    verbs = ["take", "stop", "start", "double", "skip", "halve", "switch", "mix"]
+    drugs = [f"{a}{b}{c}" for a, b, c in itertools.product(
+        ["meto", "lisi", "ator", "amlo", "sert", "gaba", "pred", "warf"],
+        ["pro", "no", "va", "di", "tra", "pen", "ni", "fa"],
+        ["lol", "pril", "statin", "pine", "line", "tin", "sone", "rin"],
+    )]
+    rules = {category: list(patterns) for category, patterns in UNSAFE_PATTERNS.items()}
+    generated = (rf"\bshould i {v} {d}\b" for v, d in itertools.product(verbs, drugs))
+    rules["medication_change"] += list(itertools.islice(generated, n))
+    return rules
+
+
+def main():
+    rule_sets = {"shipped": UNSAFE_PATTERNS, "large": large_rules()}
+
+    engines = {}
+    for name, rules in rule_sets.items():
+        t0 = time.perf_counter()
+        engine = SafetyEngine(rules)
+        print(f"{name}: {len(engine)} rules, compiled in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        for label, q in QUESTIONS.items():
+            assert legacy_check(rules, q) == engine.classify(q).blocked, (name, label)
+        # the generated rules themselves must be found
+        assert engine.classify("should i skip gabanitin?").blocked == (name == "large")
+        engines[name] = engine
+
+    print(f"\n{'rules':<10}{'question':<16}{'legacy us':>12}{'engine us':>12}{'speedup':>9}")
+    for name, rules in rule_sets.items():
+        engine = engines[name]
+        for label, q in QUESTIONS.items():
+            n = 2000 if name == "shipped" else 20
+            t_legacy = min(timeit.repeat(lambda: legacy_check(rules, q), number=n, repeat=5)) / n
+            t_new = min(timeit.repeat(lambda: engine.classify(q), number=n, repeat=5)) / n
+            print(
+                f"{name:<10}{label:<16}{t_legacy * 1e6:>12.1f}{t_new * 1e6:>12.1f}"
+                f"{t_legacy / t_new:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
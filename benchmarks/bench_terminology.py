@@ -0,0 +1,61 @@
+"""
+Compares the token-trie TermMatcher with the per-lemma, per-variant loop it
+replaced, as the lexicon grows.
+
+Run from the repo root:
+    python -m benchmarks.bench_terminology
+
+Checks that both find the same single-word terms, then times one
+history's worth of lemmas against lexicons of increasing size.
+"""
+import timeit
+
+from app.nlp import CONDITIONS
+from app.terminology import TermMatcher
+
+HISTORY = (
+    "diagnose with type diabetes in experience fatigue and increase thirst "
+    "mother have high blood pressure no known allergy take metformin daily "
+    "occasional headache and cough in winter"
+).split() * 4
+
+
+def legacy_match(lemmas, table):
+    # app/nlp.py before TermMatcher
+    found = []
+    for name, variants in table.items():
+        for word in lemmas:
+            if word in variants:
+                found.append(name)
+                break
+    return found
+
+
+def lexicon(n_terms: int) -> dict[str, list[str]]:
+    """
+    The built-in conditions plus generated canonical names with 3 synonyms
+    each (one single-word, two multi-word).
+    """
+    terms = {name: list(variants) for name, variants in CONDITIONS.items()}
+    for i in range((n_terms - len(terms)) // 3):
+        word = "".join(chr(97 + (i // 26 ** k) % 26) for k in range(4))
+        terms[f"cond-{i}"] = [f"{word}itis", f"chronic {word}itis", f"{word} syndrome type"]
+    return terms
+
+
+def main():
+    print(f"{'terms':>8}{'legacy us':>12}{'trie us':>10}{'speedup':>9}")
+    for n in (10, 1_000, 10_000, 50_000):
+        table = lexicon(n)
+        matcher = TermMatcher(table)
+        single_word = {name: [v for v in vs if " " not in v] for name, vs in table.items()}
+        assert legacy_match(HISTORY, single_word) == TermMatcher(single_word).match(HISTORY)
+
+        number = 200 if n <= 1_000 else 5
+        t_legacy = min(timeit.repeat(lambda: legacy_match(HISTORY, table), number=number, repeat=3)) / number
+        t_trie = min(timeit.repeat(lambda: matcher.match(HISTORY), number=200, repeat=3)) / 200
+        print(f"{len(matcher):>8}{t_legacy * 1e6:>12.1f}{t_trie * 1e6:>10.1f}{t_legacy / t_trie:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.admission import AdaptiveLimiter
+from app.backends import Backend, BackendConfig, BackendPool
+from app.resilience import CircuitBreaker
+
+from fakes import FakeChat, chat_client
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    One backend (8 slots) behind FakeChat; a fresh breaker and limiter, no
+    response cache, no backoff.
+    """
+    chat = FakeChat()
+    config = BackendConfig("only", "http://only/v1", "k", "m", 1.0, 8)
+    pool = BackendPool(
+        [Backend(config, chat_client(chat.create), chat_client(chat.acreate))],
+        failure_on=models.UPSTREAM_ERRORS,
+    )
+    breaker = CircuitBreaker(failure_threshold=2, open_s=30)
+    limiter = AdaptiveLimiter(min_samples=1)
+    monkeypatch.setattr(models, "backend_pool", pool)
+    monkeypatch.setattr(models, "breaker", breaker)
+    monkeypatch.setattr(models, "limiter", limiter)
+    monkeypatch.setattr(models, "response_cache", None)
+    monkeypatch.setattr(models.retry_policy, "breaker", breaker)
+    monkeypatch.setattr(models.retry_policy, "base_s", 0.0)
+    monkeypatch.setattr(models.retry_policy, "cap_s", 0.0)
+    return SimpleNamespace(chat=chat, pool=pool, breaker=breaker, limiter=limiter)
@@ -0,0 +1,93 @@
+"""
+Fake OpenAI-style chat clients shared by the tests (the `upstream` fixture
+in conftest.py wires them into app.models).
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from app.mock_router import CLEAN_ANSWER
+
+
+def chat_reply(text="ok", finish_reason="stop"):
+    choice = SimpleNamespace(message=SimpleNamespace(content=text), finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice], usage=None)
+
+
+def chat_chunk(text, finish_reason=None):
+    choice = SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice])
+
+
+class FakeStream:
+    """
+    Async chat stream over fixed text pieces; records what was read and close().
+    """
+
+    def __init__(self, pieces, error=None, finish_reason=None):
+        self.pieces = list(pieces)
+        self.error = error  # raised after the last piece
+        self.finish_reason = finish_reason  # on the last piece
+        self.received = ""
+        self.closed = False
+
+    async def _chunks(self):
+        for i, piece in enumerate(self.pieces):
+            self.received += piece
+            yield chat_chunk(piece, self.finish_reason if i == len(self.pieces) - 1 else None)
+        if self.error is not None:
+            raise self.error
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChat:
+    """
+    chat.completions for both clients of a Backend.
+
+    - stream=True calls stream `pieces` (ending with `finish_reason`)
+    - other calls answer `answer(messages)`: text, (text, finish_reason),
+      or an exception to raise
+    - `delay_s` is awaited by async calls; `peak` is the most calls in flight
+    """
+
+    def __init__(self):
+        self.pieces = [CLEAN_ANSWER]
+        self.finish_reason = None
+        self.answer = lambda messages: CLEAN_ANSWER
+        self.delay_s = lambda messages: 0.0
+        self.calls = []
+        self.streams = []
+        self.in_flight = 0
+        self.peak = 0
+
+    def _respond(self, kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            stream = FakeStream(self.pieces, finish_reason=self.finish_reason)
+            self.streams.append(stream)
+            return stream
+        text = self.answer(kwargs["messages"])
+        if isinstance(text, Exception):
+            raise text
+        return chat_reply(*text) if isinstance(text, tuple) else chat_reply(text)
+
+    def create(self, **kwargs):
+        return self._respond(kwargs)
+
+    async def acreate(self, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_s(kwargs["messages"]))
+            return self._respond(kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def chat_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
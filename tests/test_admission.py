@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdaptiveLimiter, Overloaded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_slow_calls_cut_limit_once_per_interval():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial_limit=10, target_latency_s=1.0, clock=clock)
+
+    limiter.observe(3.0)
+    limiter.observe(3.0)  # same interval: no second cut
+    assert limiter.limit == 8
+
+    clock.now = 2.0
+    limiter.observe(0.5, ok=False)
+    assert limiter.limit == 6
+    assert limiter.stats()["decreases"] == 2
+
+
+def test_limit_grows_only_while_in_use():
+    limiter = AdaptiveLimiter(initial_limit=4, target_latency_s=1.0)
+    for _ in range(20):
+        limiter.observe(0.1)
+    assert limiter.limit == 4  # idle: nothing to learn
+
+    limiter.in_flight = 4
+    for _ in range(20):
+        limiter.observe(0.1)
+    assert limiter.limit > 4
+
+
+def test_threshold_follows_baseline():
+    limiter = AdaptiveLimiter(min_samples=5, latency_tolerance=2.0)
+    assert limiter.threshold_s() is None
+    for latency in (0.4, 0.5, 0.5, 0.6, 0.7):
+        limiter.observe(latency)
+    assert limiter.threshold_s() == pytest.approx(0.8)
+
+
+def test_queue_then_shed():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=1, queue_timeout_s=1.0)
+        await limiter.acquire()
+
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 1
+
+        with pytest.raises(Overloaded) as exc:
+            await limiter.acquire()
+        assert exc.value.retry_after_s >= 1
+
+        limiter.release()  # hands the slot to the waiter
+        await waiter
+        assert limiter.in_flight == 1
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 1 and stats["admitted"] == 2 and stats["in_flight"] == 0
+
+
+def test_queue_wait_times_out():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, queue_timeout_s=0.01)
+        async with limiter.slot():
+            with pytest.raises(Overloaded):
+                await limiter.acquire()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["timed_out"] == 1 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def test_disabled_admits_everything():
+    async def scenario():
+        limiter = AdaptiveLimiter(enabled=False, initial_limit=1, max_queue=0)
+        for _ in range(5):
+            await limiter.acquire()
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+from app.analyzer import ADVICE, DISCLAIMER, FORBIDDEN, REASONING, analyze, clean, scan
+
+CLEAN = (
+    "Type 2 diabetes affects how the body uses glucose. Higher glucose levels can draw water "
+    "from tissues, which is one reason thirst is commonly described. " + DISCLAIMER
+)
+
+
+def test_clean_answer_is_acceptable():
+    a = analyze(CLEAN)
+    assert a.acceptable
+    assert not (a.has_reasoning or a.looks_like_advice or a.has_forbidden or a.is_disclaimer_only)
+    assert a.spans == []
+
+
+def test_flags_and_spans():
+    text = "We need to explain. Reasoning: you should rest."
+    a = analyze(text)
+    assert a.has_reasoning and a.looks_like_advice and a.has_forbidden
+    assert not a.acceptable
+
+    spans = {(c, text.lower()[s:e]) for c, s, e in a.spans}
+    assert (REASONING, "we need to") in spans
+    assert (REASONING, "reasoning:") in spans
+    assert (FORBIDDEN, "reasoning:") in spans
+    assert (ADVICE, "you should") in spans
+
+
+def test_overlapping_markers_all_found():
+    # "i recommend" contains "recommend"; "so we need to" contains "we need to"
+    assert analyze("I recommend rest").looks_like_advice
+    found = scan("and so we need to")
+    assert REASONING in found
+
+
+def test_reasoning_at_start_only_prefix():
+    assert analyze("  We needed more data on this topic.").has_reasoning
+    assert not analyze("Doctors say we needed more data on this topic, historically.").has_reasoning
+
+
+def test_disclaimer_only():
+    assert analyze("").is_disclaimer_only
+    assert analyze(f"  {DISCLAIMER}\n").is_disclaimer_only
+    assert not analyze(CLEAN).is_disclaimer_only
+    assert analyze(f"- {DISCLAIMER.upper()} \n {DISCLAIMER}").is_disclaimer_only
+
+    # a short body is an answer, with or without the disclaimer (stop sequence)
+    short = "Insulin helps move glucose from the blood into cells."
+    assert len(short) < len(DISCLAIMER)
+    assert analyze(short).acceptable
+    assert analyze(f"{short} {DISCLAIMER}").acceptable
+
+
+def test_clean_removes_meta_and_adds_disclaimer_once():
+    text = (
+        "Here are my reasoning steps: look at glucose\n\n"
+        "We must be careful.\n"
+        "Diabetes affects glucose use\n"
+        f"{DISCLAIMER} {DISCLAIMER}"
+    )
+    assert clean(text) == "Diabetes affects glucose use. " + DISCLAIMER
+    assert clean("we need to plan\nthus we need more") == ""
+    assert analyze("Glucose matters!").cleaned_text == "Glucose matters! " + DISCLAIMER
@@ -0,0 +1,213 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from openai import OpenAI
+
+from app import mock_router
+from app.backends import Backend, BackendConfig, BackendPool, NoBackendAvailable, load_backend_configs
+from app.mock_router import MockConfig, MockRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _backend(name, weight=1.0, max_concurrency=64, client=None):
+    config = BackendConfig(name, f"http://{name}/v1", "test", "m", weight, max_concurrency)
+    return Backend(config, client, None)
+
+
+def _pool(*backends, **kwargs):
+    return BackendPool(list(backends), failure_on=(ConnectionError,), **kwargs)
+
+
+def test_load_configs_applies_defaults():
+    configs = load_backend_configs(
+        '[{"name": "a", "base_url": "http://a/v1", "weight": 2}, {"base_url": "http://b/v1", "model": "x"}]',
+        None,
+        default_api_key="key",
+        default_model="default-model",
+    )
+    assert [c.name for c in configs] == ["a", "http://b/v1"]
+    assert configs[0].weight == 2.0 and configs[0].model == "default-model"
+    assert configs[1].model == "x" and configs[1].api_key == "key"
+    assert load_backend_configs(None, None, default_api_key="k", default_model="m") == []
+
+    with pytest.raises(ValueError):
+        load_backend_configs(
+            '[{"name": "a", "base_url": "u"}, {"name": "a", "base_url": "v"}]',
+            None,
+            default_api_key="k",
+            default_model="m",
+        )
+
+
+def test_routes_to_lowest_latency_times_load():
+    fast, slow = _backend("fast"), _backend("slow")
+    fast.ewma_s, slow.ewma_s = 0.1, 0.5
+    pool = _pool(fast, slow)
+
+    with pool.lease() as first:
+        assert first is fast
+        # fast now has one outstanding call: 0.1 * 2 < 0.5, still preferred
+        with pool.lease() as second:
+            assert second is fast
+
+    fast.outstanding = 20  # ~0.05 * 21 > 0.5
+    with pool.lease() as b:
+        assert b is slow
+
+
+def test_weight_and_concurrency_limit():
+    small, big = _backend("small", max_concurrency=1), _backend("big", weight=3.0)
+    pool = _pool(small, big)
+    with pool.lease() as b:
+        assert b is big  # same latency, 3x the weight
+
+    big.outstanding = 64
+    with pool.lease() as b:
+        assert b is small
+        with pytest.raises(NoBackendAvailable):
+            with pool.lease():
+                pass
+
+
+def test_failures_eject_then_backend_returns():
+    clock = FakeClock()
+    a, b = _backend("a"), _backend("b")
+    b.ewma_s = 2.0
+    pool = _pool(a, b, eject_after=2, eject_s=10, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with pool.lease():
+                raise ConnectionError("down")
+    assert a.ejections == 1 and a.failures == 2
+
+    with pool.lease() as picked:
+        assert picked is b
+
+    clock.now = 11
+    with pool.lease() as picked:
+        assert picked is a
+    assert a.outstanding == 0 and b.outstanding == 0
+
+
+def test_all_ejected_still_serves():
+    clock = FakeClock()
+    a = _backend("a")
+    pool = _pool(a, eject_after=1, clock=clock)
+    with pytest.raises(ConnectionError):
+        with pool.lease():
+            raise ConnectionError("down")
+    with pool.lease() as picked:
+        assert picked is a
+
+
+def test_non_upstream_errors_do_not_count():
+    a = _backend("a")
+    pool = _pool(a, eject_after=1)
+    with pytest.raises(ValueError):
+        with pool.lease():
+            raise ValueError("bad request")
+    assert a.failures == 0 and a.outstanding == 0
+
+
+def test_routes_around_dead_backend_with_local_servers():
+    mock_router.router_state = MockRouter(MockConfig(latency="fixed:0", tokens_per_s=0, seed=1))
+    good_client = OpenAI(
+        base_url="http://testserver/v1",
+        api_key="test",
+        http_client=TestClient(mock_router.app),
+        max_retries=0,
+    )
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    dead_client = OpenAI(
+        base_url="http://dead/v1",
+        api_key="test",
+        http_client=httpx.Client(transport=httpx.MockTransport(refuse)),
+        max_retries=0,
+    )
+
+    dead, good = _backend("dead", client=dead_client), _backend("good", client=good_client)
+    pool = BackendPool([dead, good], failure_on=(openai.APIConnectionError,), eject_after=1)
+
+    answers = 0
+    for _ in range(4):
+        try:
+            with pool.lease() as backend:
+                backend.client.chat.completions.create(
+                    model=backend.model, messages=[{"role": "user", "content": "hi"}]
+                )
+                answers += 1
+        except openai.APIConnectionError:
+            pass
+
+    assert answers == 3
+    stats = {s["name"]: s for s in pool.stats()}
+    assert stats["dead"]["ejected"] and stats["dead"]["requests"] == 1
+    assert stats["good"]["requests"] == 3
+
+
+def test_clients_built_on_first_use():
+    built = []
+
+    def factory(config):
+        built.append(config.name)
+        return "sync-client", "async-client"
+
+    backend = Backend(BackendConfig("lazy", "http://lazy/v1", None, "m"), factory=factory)
+    pool = BackendPool([backend])
+    assert not backend.connected and not pool.is_warm()
+
+    assert backend.client == "sync-client"
+    assert backend.async_client == "async-client"
+    assert built == ["lazy"] and pool.is_warm()
+
+
+def test_clients_built_once_under_concurrent_first_use():
+    built = []
+    gate = threading.Barrier(8)
+
+    def factory(config):
+        built.append(config.name)
+        time.sleep(0.01)  # widen the race window
+        return object(), object()
+
+    backend = Backend(BackendConfig("lazy", "http://lazy/v1", None, "m"), factory=factory)
+
+    def first_use():
+        gate.wait()
+        return backend.client, backend.async_client
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        seen = list(executor.map(lambda _: first_use(), range(8)))
+
+    assert built == ["lazy"]
+    assert len(set(seen)) == 1
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        {"base_url": "http://a/v1", "weight": 0},
+        {"base_url": "http://a/v1", "weight": -1},
+        {"base_url": "http://a/v1", "max_concurrency": 0},
+    ],
+)
+def test_rejects_unusable_weight_or_concurrency(raw):
+    with pytest.raises(ValueError, match="http://a/v1"):
+        load_backend_configs(json.dumps([raw]), None, default_api_key="k", default_model="m")
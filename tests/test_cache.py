@@ -0,0 +1,76 @@
+from app.cache import LRUCache, ResponseCache, SQLiteCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "b" is now least recently used
+
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.evictions == 1
+
+
+def test_lru_evicts_by_total_bytes():
+    cache = LRUCache(max_entries=100, max_bytes=10)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    assert cache.stats()["bytes"] == 6
+
+
+def test_lru_expires_entries_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(ttl_s=10, clock=clock)
+    cache.set("a", "1")
+
+    clock.now = 9.9
+    assert cache.get("a") == "1"
+
+    clock.now = 10.0
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_response_cache_keys_hide_prompt_and_normalize_whitespace():
+    cache = ResponseCache(model_id="m", prompt_version="v1", salt=b"salt")
+    key = cache.make_key("Patient: what is  type 2 diabetes?")
+
+    assert "diabetes" not in key
+    assert key == cache.make_key("patient: What is type 2 diabetes? ")
+    assert key != ResponseCache(model_id="m", prompt_version="v2", salt=b"salt").make_key(
+        "Patient: what is type 2 diabetes?"
+    )
+    assert key != ResponseCache(model_id="m", prompt_version="v1", salt=b"other").make_key(
+        "Patient: what is type 2 diabetes?"
+    )
+
+
+def test_response_cache_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+
+    first = ResponseCache(model_id="m", prompt_version="v1", salt=b"s", disk=SQLiteCache(path))
+    first.set("what is asthma?", "Asthma is ...")
+    first.disk.close()
+
+    second = ResponseCache(model_id="m", prompt_version="v1", salt=b"s", disk=SQLiteCache(path))
+    assert second.get("what is asthma?") == "Asthma is ..."
+    assert second.disk.hits == 1
+    # promoted into the memory tier
+    assert second.memory.get(second.make_key("what is asthma?")) == "Asthma is ..."
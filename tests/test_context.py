@@ -0,0 +1,60 @@
+from app.context import build_context, count_tokens, truncate_to_tokens
+from app.schemas import ChatMessage, QuestionRequest
+
+
+def _request(history="", turns=0, turn_words=10, question="What is type 2 diabetes?"):
+    messages = [
+        ChatMessage(
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"turn{i} " + "word " * turn_words,
+        )
+        for i in range(turns)
+    ]
+    return QuestionRequest(
+        medical_history=history,
+        diagnoses=["Type 2 Diabetes"],
+        question=question,
+        messages=messages,
+    )
+
+
+def test_count_and_truncate_tokens():
+    assert count_tokens("Hello, world!") == 4
+    assert truncate_to_tokens("one two three", 5) == "one two three"
+    assert truncate_to_tokens("one two three four", 2) == "one two …"
+    assert truncate_to_tokens("anything", 0) == ""
+
+
+def test_small_request_is_not_trimmed():
+    request = _request(history="Diabetic.", turns=2)
+    messages, report = build_context(request, ["diabetes"], [], budget=1000)
+
+    assert report.tokens_trimmed == 0
+    assert report.turns_kept == 2
+    assert not report.history_truncated
+    assert messages[-1] == {"role": "user", "content": "What is type 2 diabetes?"}
+    assert "Diabetic." in messages[0]["content"]
+    assert "['diabetes']" in messages[0]["content"]
+
+
+def test_budget_keeps_question_and_newest_turns_first():
+    request = _request(history="Long history. " * 200, turns=6, turn_words=40)
+    messages, report = build_context(request, [], [], budget=200)
+
+    assert report.tokens_used <= 200
+    assert report.tokens_trimmed > 0
+    assert report.history_truncated
+    assert 0 < report.turns_kept < 6
+    # kept turns are the most recent ones, in their original order
+    kept = [m["content"].split()[0] for m in messages[1:-1]]
+    assert kept == [f"turn{i}" for i in range(6 - report.turns_kept, 6)]
+    assert messages[-1]["content"] == "What is type 2 diabetes?"
+
+
+def test_history_is_truncated_with_leftover_budget():
+    request = _request(history="Diagnosed last year. " * 100)
+    messages, report = build_context(request, [], [], budget=150)
+
+    assert report.history_truncated
+    assert report.tokens_used <= 150
+    assert "…" in messages[0]["content"]
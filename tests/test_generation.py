@@ -0,0 +1,51 @@
+from app.generation import AdaptiveMaxTokens, PassSettings
+
+
+def _tuner(**kwargs):
+    return AdaptiveMaxTokens(PassSettings("pass_1", max_tokens=220, min_tokens=80), min_samples=5, **kwargs)
+
+
+def test_uses_ceiling_until_enough_samples():
+    tuner = _tuner()
+    for _ in range(4):
+        tuner.observe(50, "stop", 220)
+    assert tuner.max_tokens() == 220
+
+
+def test_limit_follows_p95_with_headroom():
+    tuner = _tuner()
+    for n in (90, 100, 100, 110, 120):
+        tuner.observe(n, "stop", 220)
+    assert tuner.max_tokens() == 150  # ceil(120 * 1.25)
+
+
+def test_limit_clamped_to_floor_and_ceiling():
+    tuner = _tuner()
+    for _ in range(5):
+        tuner.observe(10, "stop", 220)
+    assert tuner.max_tokens() == 80
+
+    tuner = _tuner()
+    for _ in range(5):
+        tuner.observe(400, "stop", 220)
+    assert tuner.max_tokens() == 220
+
+
+def test_truncated_answers_push_limit_back_up():
+    tuner = _tuner()
+    for _ in range(5):
+        tuner.observe(100, "stop", 220)
+    limit = tuner.max_tokens()
+    assert limit == 125
+
+    for _ in range(5):
+        tuner.observe(limit, "length", limit)
+    assert tuner.max_tokens() > limit
+    assert tuner.stats()["truncated"] == 5
+
+
+def test_not_adaptive_keeps_ceiling():
+    tuner = _tuner(adaptive=False)
+    for _ in range(10):
+        tuner.observe(40, "stop", 220)
+    assert tuner.max_tokens() == 220
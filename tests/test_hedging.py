@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from app.hedging import Hedger, LatencyWindow
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=10)
+    for ms in range(1, 11):
+        window.add(ms / 1000)
+
+    assert window.percentile(0.9) == 0.01
+    assert window.percentile(0.0) == 0.001
+    assert LatencyWindow().percentile(0.9) is None
+
+
+def test_no_hedge_until_enough_samples():
+    hedger = Hedger(min_samples=3)
+    assert hedger.hedge_delay() is None
+    for _ in range(3):
+        hedger.call(lambda: "ok")
+    assert hedger.hedge_delay() is not None
+    assert Hedger(enabled=False, delay_ms=10).hedge_delay() is None
+
+
+def test_sync_hedge_wins_when_primary_is_slow():
+    hedger = Hedger(delay_ms=20, max_rate=1.0)
+    delays = iter([0.5, 0.0])
+
+    def upstream():
+        time.sleep(next(delays))
+        return "answer"
+
+    started = time.perf_counter()
+    assert hedger.call(upstream) == "answer"
+    assert time.perf_counter() - started < 0.4
+    assert hedger.hedges_fired == 1
+    assert hedger.hedge_wins == 1
+
+
+def test_hedge_rate_is_capped():
+    hedger = Hedger(delay_ms=1, max_rate=0.0)
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    assert asyncio.run(hedger.acall(slow)) == "answer"
+    assert hedger.hedges_fired == 0
+    assert hedger.skipped_by_budget == 1
+    assert hedger.primary_wins == 1
+
+
+def test_async_hedge_cancels_loser():
+    hedger = Hedger(delay_ms=20, max_rate=1.0)
+    delays = iter([1.0, 0.0])
+    cancelled = []
+
+    async def upstream():
+        try:
+            await asyncio.sleep(next(delays))
+            return "answer"
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        result = await hedger.acall(upstream)
+        await asyncio.sleep(0)  # let the cancellation land
+        return result
+
+    assert asyncio.run(main()) == "answer"
+    assert hedger.hedge_wins == 1
+    assert cancelled == [True]
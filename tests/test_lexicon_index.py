@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.lexicon_index import MappedLexicon, compile_lexicon
+from app.nlp import CONDITIONS, SYMPTOMS
+from app.terminology import TermMatcher, load_lexicon
+
+LEXICON = {"condition": CONDITIONS, "symptom": SYMPTOMS}
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "lexicon.idx"
+    compile_lexicon(LEXICON, path)
+    return MappedLexicon(path)
+
+
+def test_matches_like_term_matcher(index):
+    tokens = "she have high blood pressure be diabetic and tired headaches high blood".split()
+    for kind, terms in LEXICON.items():
+        assert index.matcher(kind).match(tokens) == TermMatcher(terms).match(tokens)
+    assert index.matcher("condition").match(tokens) == ["diabetes", "hypertension"]
+    assert index.matcher("condition").match([]) == []
+    assert index.matcher("medication").match(tokens) == []
+
+
+def test_overlapping_terms_and_kinds(tmp_path):
+    path = tmp_path / "lexicon.idx"
+    compile_lexicon(
+        {
+            "condition": {"heart failure": ["heart failure"], "heart disease": ["heart"]},
+            "symptom": {"palpitations": ["heart racing"]},
+        },
+        path,
+    )
+    index = MappedLexicon(path)
+    tokens = "heart failure and heart racing".split()
+    assert index.matcher("condition").match(tokens) == ["heart failure", "heart disease"]
+    assert index.matcher("symptom").match(tokens) == ["palpitations"]
+    assert index.lookup("heart")[0] == 3  # a term and the prefix of longer ones
+    assert index.lookup("failure") is None
+
+
+def test_vocabulary_and_counts(index):
+    expected = TermMatcher(CONDITIONS).vocabulary | TermMatcher(SYMPTOMS).vocabulary
+    assert index.vocabulary() == expected
+    # terms (synonyms), like TermMatcher, not canonical names
+    assert len(index.matcher("condition")) == len(TermMatcher(CONDITIONS)) > len(CONDITIONS)
+    assert len(index.matcher("symptom")) == len(TermMatcher(SYMPTOMS))
+    assert len(index.matcher("medication")) == 0
+    assert index.kinds == ["condition", "symptom"]
+
+
+def test_large_csv_lexicon(tmp_path):
+    csv_path = tmp_path / "lexicon.csv"
+    rows = ["kind,canonical,term"]
+    rows += [f"condition,cond{i},rare condition number{chr(97 + i % 26)} x{i:05d}" for i in range(20000)]
+    rows += ["condition,asthma,asthma", "symptom,cough,cough", "symptom,cough,coughing"]
+    csv_path.write_text("\n".join(rows) + "\n")
+    lexicon = load_lexicon(csv_path)
+    compile_lexicon(lexicon, tmp_path / "lexicon.idx")
+
+    index = MappedLexicon(tmp_path / "lexicon.idx")
+    assert len(index.matcher("condition")) == 20001
+    tokens = "asthma and rare condition numberb and coughing".split()
+    assert index.matcher("condition").match(tokens) == ["asthma"]
+    assert index.matcher("symptom").match(tokens) == ["cough"]
+    tokens = "rare condition numberc x".split()  # digits are not tokens
+    assert index.matcher("condition").match(tokens) == TermMatcher(lexicon["condition"]).match(tokens)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "lexicon.csv"
+    path.write_bytes(b"kind,canonical,term\n" + b"\0" * 64)
+    with pytest.raises(ValueError, match="not a compiled lexicon"):
+        MappedLexicon(path)
+
+
+def test_nlp_import_maps_index_without_building_tables(tmp_path):
+    path = tmp_path / "lexicon.idx"
+    compile_lexicon(LEXICON, path)
+    env = {**os.environ, "NLP_LEXICON_INDEX": str(path), "NLP_BACKEND": "spacy"}
+    code = (
+        "from app import nlp; "
+        "assert type(nlp.condition_matcher).__name__ == 'MappedTermMatcher'; "
+        "assert nlp._fast_lemmatizer is None; "
+        "assert nlp.condition_matcher.match(['asthma']) == ['asthma']"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, env=env, cwd=Path(__file__).resolve().parents[1])
@@ -0,0 +1,334 @@
+import asyncio
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from app import logging_mlflow, main, mock_router, models, nlp
+from app.admission import Overloaded
+from app.backends import Backend, BackendConfig, BackendPool
+from app.mock_router import CLEAN_ANSWER, DISCLAIMER, MockConfig, MockRouter
+from app.startup import StartupTracker
+
+HISTORY = "Diabetic, often tired."
+BODY = CLEAN_ANSWER[: CLEAN_ANSWER.index(DISCLAIMER)]
+
+
+class FakeToken:
+    def __init__(self, text):
+        self.text = text
+        self.lemma_ = text
+        self.is_alpha = text.isalpha()
+
+
+class FakeNlp:
+    """
+    Stands in for en_core_web_sm; records every pipe() call.
+    """
+
+    def __init__(self):
+        self.pipes = []
+
+    def __call__(self, text):
+        return [FakeToken(t) for t in re.findall(r"\w+|[^\w\s]", text)]
+
+    def pipe(self, texts, batch_size=64):
+        texts = list(texts)
+        self.pipes.append(texts)
+        return (self(t) for t in texts)
+
+
+@pytest.fixture
+def api(upstream, monkeypatch):
+    """
+    TestClient for app.main (no lifespan) on the fake upstream; spaCy and
+    MLflow are replaced, logged runs are kept in `api.runs`.
+    """
+    fake_nlp = FakeNlp()
+    monkeypatch.setattr(nlp, "NLP_BACKEND", "spacy")
+    monkeypatch.setattr(nlp, "_nlp", fake_nlp)
+    monkeypatch.setattr(nlp, "entity_cache", None)
+    runs = []
+    monkeypatch.setattr(main, "log_ask_run", lambda **kw: runs.append(kw))
+    monkeypatch.setattr(main, "log_batch_run", lambda **kw: runs.append(kw))
+
+    client = TestClient(main.app)
+    client.upstream, client.nlp, client.runs = upstream, fake_nlp, runs
+    return client
+
+
+def _ask(question="Why am I tired?", **extra):
+    return {"medical_history": HISTORY, "question": question, **extra}
+
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    """
+    Parses an SSE body; every event must be exactly "event:" + "data:".
+    """
+    assert body.endswith("\n\n")
+    events = []
+    for block in body[:-2].split("\n\n"):
+        event_line, data_line = block.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+# ---------------------------------------------------------
+# /ask
+# ---------------------------------------------------------
+@pytest.fixture
+def cold(api, monkeypatch):
+    """
+    Nothing warmed yet: a fresh tracker, mlflow not loaded.
+    """
+    tracker = StartupTracker()
+    monkeypatch.setattr(main, "startup", tracker)
+    monkeypatch.setattr(logging_mlflow, "is_loaded", lambda: False)
+    return tracker
+
+
+def test_ready_waits_for_warm_up(api, cold, monkeypatch):
+    monkeypatch.setattr(main, "WARMUP", True)
+    monkeypatch.setattr(main, "INTENT_MODEL_PATH", "data/intent_model.npz")
+
+    r = api.get("/ready")
+    assert r.status_code == 503 and not r.json()["ready"]
+    components = r.json()["components"]
+    assert set(components) == {"nlp", "mlflow", "nlp_pool", "intent_model", "upstream"}
+    assert components["mlflow"]["state"] == "cold"
+    assert components["intent_model"]["state"] == "cold"
+    assert components["nlp_pool"]["state"] == "off"  # NLP_POOL_WORKERS=0
+
+    cold.record("mlflow", 0.1)
+    assert api.get("/ready").status_code == 503  # the intent model is still cold
+    cold.record("intent_model", 0.1)
+    assert api.get("/ready").status_code == 200
+
+
+def test_ready_at_once_without_warm_up(api, cold, monkeypatch):
+    monkeypatch.setattr(main, "WARMUP", False)
+
+    r = api.get("/ready")
+    assert r.status_code == 200 and r.json()["ready"]
+    assert r.json()["components"]["mlflow"]["state"] == "cold"
+
+
+def test_ask_uses_async_client(api, monkeypatch):
+    def blocking_call(**kwargs):
+        raise AssertionError("/ask must not use the sync client")
+
+    monkeypatch.setattr(api.upstream.chat, "create", blocking_call)
+
+    resp = api.post("/ask", json=_ask())
+
+    assert resp.status_code == 200
+    assert resp.json() == {"answer": CLEAN_ANSWER, "note": main.NOTE}
+    assert int(resp.headers["x-latency-ms"]) >= 0
+    assert len(api.upstream.chat.calls) == 1
+    assert api.runs[-1]["is_blocked"] is False and api.runs[-1]["error"] is None
+
+
+def test_ask_blocked_question_skips_upstream(api):
+    resp = api.post("/ask", json=_ask("Do I have diabetes?"))
+
+    assert resp.status_code == 200
+    assert api.upstream.chat.calls == []
+    assert api.runs[-1]["is_blocked"] is True
+
+
+def test_ask_rejects_overlong_question(api, monkeypatch):
+    monkeypatch.setattr(main, "QUESTION_MAX_CHARS", 20)
+
+    resp = api.post("/ask", json=_ask("a" * 21 + "?"))
+
+    assert resp.status_code == 400
+    assert "under 20 characters" in resp.json()["answer"]
+    assert api.upstream.chat.calls == []
+
+
+def test_concurrent_asks_do_not_block_each_other(api):
+    api.upstream.chat.delay_s = lambda messages: 0.3
+
+    async def ask_all(n):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *(client.post("/ask", json=_ask(f"What is topic {i}?")) for i in range(n))
+            )
+            return responses, time.perf_counter() - started
+
+    responses, elapsed = asyncio.run(ask_all(5))
+
+    assert [r.status_code for r in responses] == [200] * 5
+    # all five upstream calls waited together on the event loop
+    assert api.upstream.chat.peak == 5
+    assert elapsed < 1.0
+
+
+# ---------------------------------------------------------
+# /ask/stream
+# ---------------------------------------------------------
+def test_stream_sse_framing(api):
+    api.upstream.chat.pieces = [CLEAN_ANSWER[i:i + 9] for i in range(0, len(CLEAN_ANSWER), 9)]
+
+    resp = api.post("/ask/stream", json=_ask())
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = _events(resp.text)
+    names = [name for name, _ in events]
+    assert names[-1] == "final" and set(names[:-1]) == {"token"}
+    final = events[-1][1]
+    assert final["answer"] == CLEAN_ANSWER
+    assert final["note"] == main.NOTE and final["latency_ms"] >= 0
+    assert final["answer"].startswith("".join(data["text"] for _, data in events[:-1]))
+    assert api.runs[-1]["error"] is None
+
+
+def test_stream_reset_then_rewrite(api):
+    api.upstream.chat.pieces = [BODY + "You sh", "ould rest more. ", DISCLAIMER]
+
+    events = _events(api.post("/ask/stream", json=_ask()).text)
+
+    names = [name for name, _ in events]
+    assert names[0] == "token" and names[-2:] == ["reset", "final"]
+    assert events[-2][1] == {"reason": "rewrite"}
+    streamed = "".join(data["text"] for name, data in events if name == "token")
+    assert "you sh" not in streamed.lower()
+    assert events[-1][1]["answer"] == CLEAN_ANSWER
+    assert api.upstream.chat.streams[0].closed
+
+
+def test_stream_error_event(api, monkeypatch):
+    async def broken(text):
+        raise RuntimeError("nlp down")
+
+    monkeypatch.setattr(main.nlp_pool, "extract_entities", broken)
+
+    events = _events(api.post("/ask/stream", json=_ask()).text)
+
+    assert events == [("error", {"error": "Internal error: RuntimeError('nlp down')"})]
+    assert api.runs[-1]["error"] == "RuntimeError('nlp down')"
+
+
+def test_stream_error_event_when_shed_after_start(api, monkeypatch):
+    @asynccontextmanager
+    async def shed():
+        raise Overloaded("queue wait timed out", 3)
+        yield
+
+    monkeypatch.setattr(models.limiter, "slot", shed)
+
+    events = _events(api.post("/ask/stream", json=_ask()).text)
+
+    assert events == [("error", {"error": main.BUSY_ANSWER, "retry_after_s": 3})]
+
+
+def test_stream_invalid_request_is_json_400(api):
+    resp = api.post("/ask/stream", json={"question": "Why am I tired?"})
+
+    assert resp.status_code == 400
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.json()["note"] == main.NOTE
+    assert api.upstream.chat.calls == []
+
+
+def test_stream_through_mock_router(api, monkeypatch):
+    mock_router.router_state = MockRouter(MockConfig(latency="fixed:0", tokens_per_s=0, seed=1))
+    client = AsyncOpenAI(
+        base_url="http://testserver/v1",
+        api_key="test",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_router.app)),
+    )
+    config = BackendConfig("mock", "http://testserver/v1", "test", "m")
+    monkeypatch.setattr(models, "backend_pool", BackendPool([Backend(config, None, client)]))
+
+    events = _events(api.post("/ask/stream", json=_ask()).text)
+
+    assert events[-1][0] == "final"
+    assert events[-1][1]["answer"] == CLEAN_ANSWER
+    assert any(name == "token" for name, _ in events)
+
+
+# ---------------------------------------------------------
+# /ask/batch
+# ---------------------------------------------------------
+def _topic(messages) -> str:
+    return re.search(r"topic (\d+)", messages[-1]["content"]).group(1)
+
+
+def test_batch_keeps_input_order(api):
+    chat = api.upstream.chat
+    # later items finish first
+    chat.delay_s = lambda messages: 0.01 * (5 - int(_topic(messages)))
+    chat.answer = lambda messages: f"Glucose and energy, topic {_topic(messages)}. {DISCLAIMER}"
+    items = [_ask(f"What is topic {i}?") for i in range(5)]
+
+    resp = api.post("/ask/batch", json={"items": items})
+
+    assert resp.status_code == 200
+    results = resp.json()["items"]
+    assert [r["index"] for r in results] == list(range(5))
+    for i, r in enumerate(results):
+        assert r["status"] == 200 and f"topic {i}." in r["answer"]
+    assert chat.peak > 1
+
+
+def test_batch_isolates_item_failures(api, monkeypatch):
+    answer = main.aquery_huggingface_chat
+
+    async def flaky(messages):
+        content = messages[-1]["content"]
+        if "crash" in content:
+            raise RuntimeError("boom")
+        if "busy" in content:
+            raise Overloaded("queue full", 1)
+        return await answer(messages)
+
+    monkeypatch.setattr(main, "aquery_huggingface_chat", flaky)
+    items = [
+        _ask("Why am I tired?"),
+        {"question": "No context?"},
+        _ask("Do I have diabetes?"),
+        _ask("Will this crash?"),
+        _ask("Are you busy?"),
+        _ask("Why am I thirsty?"),
+    ]
+
+    results = api.post("/ask/batch", json={"items": items}).json()["items"]
+
+    assert [r["status"] for r in results] == [200, 400, 200, 500, 503, 200]
+    assert [r["blocked"] for r in results] == [False, False, True, False, False, False]
+    assert results[0]["answer"] == results[5]["answer"] == CLEAN_ANSWER
+    assert results[3]["answer"] == "Internal error: RuntimeError('boom')"
+    assert results[4]["answer"] == main.BUSY_ANSWER
+    run = api.runs[-1]
+    assert (run["batch_size"], run["blocked_count"], run["invalid_count"], run["error_count"]) == (6, 1, 1, 2)
+
+
+def test_batch_runs_nlp_in_one_pass(api):
+    items = [_ask(f"What is topic {i}?", medical_history=f"Asthma, tired {i}.") for i in range(4)]
+    items.append({"question": "No context?"})
+
+    assert api.post("/ask/batch", json={"items": items}).status_code == 200
+
+    assert len(api.nlp.pipes) == 1
+    assert len(api.nlp.pipes[0]) == 4
+
+
+def test_batch_over_limit_is_413(api, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 2)
+
+    resp = api.post("/ask/batch", json={"items": [_ask()] * 3})
+
+    assert resp.status_code == 413
+    assert resp.json() == {"detail": "A batch can hold at most 2 questions."}
+    assert api.upstream.chat.calls == []
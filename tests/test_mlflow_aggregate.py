@@ -0,0 +1,124 @@
+import asyncio
+
+from app import logging_mlflow
+from app.logging_mlflow import LatencyHistogram, WindowAggregator
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _aggregator(window_s=60):
+    records, clock = [], Clock()
+    return WindowAggregator(window_s, sink=records.append, clock=clock), records, clock
+
+
+def _ask(agg, latency_ms=100, blocked=False, error=None, symptoms=0, category=None):
+    agg.add_ask(
+        model_id="m",
+        is_blocked=blocked,
+        blocked_category=category,
+        latency_ms=latency_ms,
+        symptoms_count=symptoms,
+        conditions_count=1,
+        diagnoses_count=0,
+        error=error,
+    )
+
+
+def test_histogram_percentiles_within_bucket_error():
+    hist = LatencyHistogram()
+    for ms in range(1, 1001):
+        hist.add(ms)
+    for q, exact in ((0.5, 500), (0.9, 900), (0.99, 990)):
+        assert exact <= hist.percentile(q) <= exact * 1.12
+    assert hist.percentile(1.0) == 1000 and LatencyHistogram().percentile(0.5) is None
+    hist.add(500_000)  # beyond the last bound
+    assert hist.percentile(1.0) == 500_000
+
+
+def test_one_run_per_window_not_per_request():
+    agg, records, clock = _aggregator()
+    for i in range(200):
+        _ask(agg, latency_ms=10 + i, blocked=i % 10 == 0, category="diagnosis" if i % 10 == 0 else None,
+             error="boom" if i % 50 == 0 else None, symptoms=i % 7)
+    assert records == []
+
+    clock.now += 60
+    _ask(agg)  # first call of the next window closes the previous one
+    (record,) = records
+    m = record.metrics
+    assert m["asks"] == m["items"] == 200
+    assert m["blocked_count"] == 20 and m["blocked_rate"] == 0.1 and m["blocked_diagnosis_count"] == 20
+    assert m["error_count"] == 4 and m["error_rate"] == 0.02
+    assert 109 <= m["latency_ms_p50"] <= 109 * 1.12 and m["latency_ms_max"] == 209
+    assert sum(m[f"symptoms_count_{k}"] for k in range(5)) + m["symptoms_count_5plus"] == 200
+    assert m["conditions_count_1"] == 200 and m["diagnoses_count_0"] == 200
+    assert record.params["mode"] == "aggregate" and record.params["model_id"] == "m"
+    assert record.keep and record.own_run and record.timestamp_ms % 60_000 == 0
+    assert agg.stats()["windows_logged"] == 1 and agg.stats()["current_items"] == 1
+
+
+def test_batches_count_per_item():
+    agg, records, _ = _aggregator()
+    agg.add_batch(
+        model_id="m",
+        batch_size=4,
+        blocked_count=1,
+        error_count=1,
+        item_latencies_ms=[10, 20, 30],
+        blocked_categories={"treatment": 1},
+    )
+    _ask(agg)
+    agg.flush()
+    (record,) = records
+    m = record.metrics
+    assert m["batches"] == 1 and m["asks"] == 1 and m["items"] == 5
+    assert m["blocked_rate"] == 0.2 and m["blocked_treatment_count"] == 1
+    assert m["latency_ms_max"] == 100 and m["symptoms_count_0"] == 1  # distributions: /ask only
+
+
+def test_roll_and_empty_windows():
+    agg, records, clock = _aggregator(window_s=10)
+    assert not agg.roll()
+    _ask(agg)
+    clock.now += 5
+    assert not agg.roll()  # still inside the window
+    clock.now += 10
+    assert agg.roll() and len(records) == 1
+    clock.now += 100
+    assert not agg.roll()  # idle windows log nothing
+    agg.flush()
+    assert len(records) == 1
+
+
+def test_stop_flushing_logs_partial_window():
+    agg, records, _ = _aggregator()
+
+    async def run():
+        agg.start_flushing()
+        _ask(agg)
+        await agg.stop_flushing()
+
+    asyncio.run(run())
+    assert len(records) == 1 and records[0].metrics["asks"] == 1
+
+
+def test_aggregate_mode_skips_per_request_runs(monkeypatch):
+    agg, records, clock = _aggregator()
+    submitted = []
+    monkeypatch.setattr(logging_mlflow, "MLFLOW_LOG_MODE", "aggregate")
+    monkeypatch.setattr(logging_mlflow, "window_aggregator", agg)
+    monkeypatch.setattr(logging_mlflow, "_submit", submitted.append)
+
+    for _ in range(3):
+        logging_mlflow.log_ask_run(
+            model_id="m", is_blocked=False, latency_ms=5, symptoms_count=1, conditions_count=0, diagnoses_count=0
+        )
+    assert submitted == [] and records == []
+    agg.flush()
+    assert records[0].metrics["asks"] == 3
@@ -0,0 +1,206 @@
+import logging
+import threading
+from types import SimpleNamespace
+
+from app import logging_mlflow
+from app.logging_mlflow import MlflowWriter, RunRecord
+
+
+class FakeClient:
+    """
+    Records runs and store calls; `fail_on_batch=n` fails the n-th log_batch.
+    """
+
+    def __init__(self, fail_on_batch=None, gate=None):
+        self.runs = {}
+        self.calls = []
+        self.fail_on_batch = fail_on_batch
+        self.gate = gate  # threading.Event holding writes back
+
+    def create_run(self, experiment_id, start_time=None, tags=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append("create_run")
+        run_id = f"run{len(self.runs)}"
+        self.runs[run_id] = {
+            "experiment": experiment_id,
+            "metrics": [],
+            "params": {},
+            "tags": dict(tags or {}),
+            "ended": False,
+        }
+        return SimpleNamespace(info=SimpleNamespace(run_id=run_id))
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=()):
+        self.calls.append("log_batch")
+        if self.calls.count("log_batch") == self.fail_on_batch:
+            raise RuntimeError("store unavailable")
+        run = self.runs[run_id]
+        run["metrics"].extend((m.key, m.value, m.step) for m in metrics)
+        run["params"].update({p.key: p.value for p in params})
+        run["tags"].update({t.key: t.value for t in tags})
+
+    def set_terminated(self, run_id, end_time=None):
+        self.calls.append("set_terminated")
+        self.runs[run_id]["ended"] = True
+
+    def metric(self, run, key):
+        return {step: value for k, value, step in run["metrics"] if k == key}
+
+
+def _writer(client, **kwargs):
+    return MlflowWriter(connect=lambda: (client, "7"), **kwargs)
+
+
+def _record(i=0, keep=False, **params):
+    return RunRecord({"model_id": "m", **params}, {"latency_ms": i}, keep=keep)
+
+
+def test_one_run_per_flush_with_one_step_per_record():
+    client = FakeClient()
+    writer = _writer(client, batch_size=3, flush_interval_s=30)
+    writer.start()
+    for i in range(7):
+        assert writer.submit(_record(i))
+    writer.stop()
+
+    assert not writer.running
+    assert len(client.runs) == 3  # 3 + 3 + 1 records, not 7 runs
+    assert client.calls == ["create_run", "log_batch", "set_terminated"] * 3
+    run = client.runs["run0"]
+    assert client.metric(run, "latency_ms") == {0: 0, 1: 1, 2: 2}
+    assert run["params"] == {"records": "3"} and run["tags"]["model_id"] == "m"
+    assert all(r["ended"] and r["experiment"] == "7" for r in client.runs.values())
+    stats = writer.stats()
+    assert stats["written"] == 7 and stats["runs"] == 3 and stats["flushes"] == 3 and stats["queued"] == 0
+
+
+def test_params_become_step_metrics_and_tags():
+    client = FakeClient()
+    writer = _writer(client, batch_size=2, flush_interval_s=30)
+    writer.start()
+    writer.submit(_record(1, is_blocked=True, blocked_category="diagnosis", blocked_by="rules"))
+    writer.submit(_record(2, is_blocked=False, error="TimeoutError()"))
+    writer.stop()
+
+    (run,) = client.runs.values()
+    assert client.metric(run, "is_blocked") == {0: 1.0, 1: 0.0}
+    assert client.metric(run, "blocked_category_diagnosis") == {0: 1}
+    assert client.metric(run, "blocked_by_rules") == {0: 1}
+    assert client.metric(run, "error") == {1: 1}
+    assert run["tags"]["error.1"] == "TimeoutError()"
+
+
+def test_large_flush_split_at_mlflow_batch_limits():
+    client = FakeClient()
+    writer = _writer(client, batch_size=300, flush_interval_s=30)
+    for i in range(300):
+        writer.submit(RunRecord({}, {f"m{k}": i for k in range(5)}))  # 1500 metrics
+    writer.start()
+    writer.stop()
+
+    (run,) = client.runs.values()
+    assert client.calls.count("log_batch") == 2 and client.calls.count("create_run") == 1
+    assert len(run["metrics"]) == 1500 and writer.written == 300
+
+
+def test_failed_write_counts_lost_records(caplog):
+    client = FakeClient(fail_on_batch=2)
+    writer = _writer(client, batch_size=300, flush_interval_s=30)
+    for i in range(300):
+        writer.submit(RunRecord({}, {f"m{k}": i for k in range(5)}))
+    with caplog.at_level(logging.WARNING, logger="uvicorn.error"):
+        writer.start()
+        writer.stop()
+
+    # the first log_batch (200 whole records) landed, the second did not
+    stats = writer.stats()
+    assert stats["written"] == 200 and stats["lost"] == 100 and stats["write_errors"] == 1
+    assert "100 of 300 records lost" in caplog.text
+
+
+def test_time_trigger_flushes_partial_batch():
+    client = FakeClient()
+    writer = _writer(client, batch_size=100, flush_interval_s=0.05)
+    writer.start()
+    writer.submit(_record())
+    for _ in range(100):
+        if writer.written:
+            break
+        threading.Event().wait(0.02)
+    assert writer.written == 1
+    writer.stop()
+
+
+def test_own_run_records_are_not_merged():
+    client = FakeClient()
+    writer = _writer(client, batch_size=3, flush_interval_s=30)
+    writer.submit(RunRecord({"mode": "aggregate"}, {"asks": 10}, own_run=True))
+    writer.submit(_record(1))
+    writer.submit(_record(2))
+    writer.start()
+    writer.stop()
+
+    window, flush = client.runs.values()
+    assert window["params"] == {"mode": "aggregate"} and window["metrics"] == [("asks", 10, 0)]
+    assert flush["params"] == {"records": "2"}
+
+
+def test_overload_samples_routine_records_then_drops():
+    writer = _writer(FakeClient(), max_queue=10, overload_sample=0.5)  # not started
+    results = [writer.submit(_record(i)) for i in range(5)]  # below half full
+    results += [writer.submit(_record(i)) for i in range(4)]  # half full: 1 in 2 kept
+    results += [writer.submit(_record(keep=True)) for _ in range(4)]  # always kept, until full
+
+    assert results == [True] * 5 + [False, True, False, True] + [True, True, True, False]
+    stats = writer.stats()
+    assert stats["queued"] == 10 and stats["sampled_out"] == 2 and stats["dropped"] == 1
+    assert stats["submitted"] == 13
+
+
+def test_log_ask_run_only_queues(monkeypatch):
+    gate = threading.Event()  # the store "hangs" until released
+    client = FakeClient(gate=gate)
+    writer = _writer(client, batch_size=1, flush_interval_s=30)
+    monkeypatch.setattr(logging_mlflow, "mlflow_writer", writer)
+    monkeypatch.setattr(logging_mlflow, "MLFLOW_LOG_MODE", "batched")
+
+    logging_mlflow.log_ask_run(
+        model_id="m",
+        is_blocked=True,
+        blocked_category="diagnosis",
+        latency_ms=12,
+        symptoms_count=0,
+        conditions_count=0,
+        diagnoses_count=1,
+    )
+    assert writer.running and writer.submitted == 1 and not client.runs
+    gate.set()
+    writer.stop()
+
+    (run,) = client.runs.values()
+    assert client.metric(run, "latency_ms") == {0: 12} and client.metric(run, "diagnoses_count") == {0: 1}
+    assert client.metric(run, "blocked_category_diagnosis") == {0: 1}
+
+
+def test_per_request_mode_writes_inline(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(logging_mlflow, "MLFLOW_LOG_MODE", "per_request")
+    monkeypatch.setattr(logging_mlflow, "_default_client", lambda: (client, "0"))
+
+    logging_mlflow.log_batch_run(
+        model_id="m",
+        batch_size=3,
+        blocked_count=1,
+        blocked_categories={"diagnosis": 1},
+        invalid_count=0,
+        error_count=0,
+        latency_ms=40,
+        item_latencies_ms=[10, 30],
+        symptoms_count=2,
+        conditions_count=1,
+    )
+    (run,) = client.runs.values()
+    assert run["params"]["endpoint"] == "ask_batch"
+    assert client.metric(run, "blocked_diagnosis_count") == {0: 1}
+    assert client.metric(run, "item_latency_ms_max") == {0: 30}
@@ -0,0 +1,84 @@
+import random
+
+from fastapi.testclient import TestClient
+from openai import OpenAI
+
+from app import mock_router
+from app.mock_router import (
+    ADVICE_ANSWER,
+    CLEAN_ANSWER,
+    DISCLAIMER,
+    MockConfig,
+    MockRouter,
+    sample_latency_ms,
+)
+
+
+def _client(**config) -> OpenAI:
+    cfg = MockConfig(latency="fixed:0", tokens_per_s=0, seed=1)
+    cfg.update(config)
+    mock_router.router_state = MockRouter(cfg)
+    http = TestClient(mock_router.app)
+    return OpenAI(base_url="http://testserver/v1", api_key="test", http_client=http, max_retries=0)
+
+
+def test_latency_distributions():
+    rng = random.Random(0)
+    assert sample_latency_ms("fixed:250", rng) == 250
+    assert 10 <= sample_latency_ms("uniform:10,20", rng) <= 20
+    assert sample_latency_ms("lognormal:300,0.5", rng) > 0
+
+
+def test_chat_completion_is_sdk_compatible():
+    client = _client()
+    resp = client.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=500
+    )
+    assert resp.choices[0].message.content == CLEAN_ANSWER
+    assert resp.usage.completion_tokens > 0
+
+
+def test_stop_and_max_tokens_are_honored():
+    client = _client()
+    resp = client.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "hi"}], stop=[DISCLAIMER]
+    )
+    assert DISCLAIMER not in resp.choices[0].message.content
+
+    resp = client.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "hi"}], max_tokens=5
+    )
+    assert resp.choices[0].finish_reason == "length"
+    assert len(resp.choices[0].message.content.split()) == 5
+
+
+def test_streaming_yields_all_tokens():
+    client = _client()
+    stream = client.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": "hi"}], stream=True
+    )
+    text = "".join(c.choices[0].delta.content or "" for c in stream if c.choices)
+    assert text == CLEAN_ANSWER
+
+
+def test_canned_advice_answers_exercise_rewrite_passes():
+    client = _client(advice_rate=1.0)
+    pass_1 = client.chat.completions.create(
+        model="m", messages=[{"role": "system", "content": "You are..."}]
+    )
+    pass_3 = client.chat.completions.create(
+        model="m", messages=[{"role": "system", "content": "Rewrite to remove ALL advice."}]
+    )
+    assert pass_1.choices[0].message.content == ADVICE_ANSWER
+    assert pass_3.choices[0].message.content == CLEAN_ANSWER
+
+
+def test_error_injection():
+    client = _client(error_rate=1.0)
+    try:
+        client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+    except Exception as e:
+        assert getattr(e, "status_code", None) in (500, 503)
+    else:
+        raise AssertionError("expected an injected error")
+    assert mock_router.router_state.stats["errors"] == 1
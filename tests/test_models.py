@@ -0,0 +1,200 @@
+import asyncio
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app import models
+from app.backends import NoBackendAvailable
+from app.context import count_tokens
+from app.generation import AdaptiveMaxTokens, PassSettings
+from app.mock_router import CLEAN_ANSWER, DISCLAIMER
+
+from fakes import FakeStream, chat_reply
+
+BODY = CLEAN_ANSWER[: CLEAN_ANSWER.index(DISCLAIMER)]
+
+
+def test_pool_saturation_does_not_open_breaker(upstream):
+    messages = [{"role": "user", "content": "hi"}]
+    with ExitStack() as stack:  # every backend at max_concurrency
+        for _ in range(upstream.pool.backends[0].config.max_concurrency):
+            stack.enter_context(upstream.pool.lease())
+        for _ in range(2):
+            with pytest.raises(NoBackendAvailable):
+                models._call_chat(messages, max_tokens=10)
+
+    assert upstream.breaker.state == "closed"
+    assert upstream.limiter.decreases == 0
+    # capacity is back: the next call goes through, no fallback window
+    assert models._call_chat(messages, max_tokens=10) == CLEAN_ANSWER
+
+
+# ---------------------------------------------------------
+# Streaming pipeline
+# ---------------------------------------------------------
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+async def _collect(agen, on_event=None):
+    events = []
+    async for event, text in agen:
+        if on_event is not None:
+            on_event(event, text)
+        events.append((event, text))
+    return events
+
+
+def test_stream_holds_back_marker_length(upstream):
+    upstream.chat.pieces = _pieces(CLEAN_ANSWER, 7)
+    emitted = []
+
+    def check(event, text):
+        if event == "token":
+            emitted.append(text)
+            received = upstream.chat.streams[0].received
+            # never closer to the received end than the longest marker
+            assert len("".join(emitted)) <= len(received) - models._GUARD_HOLDBACK
+
+    events = asyncio.run(_collect(models._astream_pipeline("prompt"), check))
+
+    assert events[-1] == ("final", CLEAN_ANSWER)
+    assert CLEAN_ANSWER.startswith("".join(emitted))
+    assert len("".join(emitted)) >= len(BODY)
+    assert upstream.chat.streams[0].closed
+
+
+def test_stream_resets_when_marker_spans_chunks(upstream):
+    upstream.chat.pieces = [BODY + "You sh", "ould rest more. ", "Later text. ", DISCLAIMER]
+
+    events = asyncio.run(_collect(models._astream_pipeline("prompt")))
+
+    tokens = "".join(text for event, text in events if event == "token")
+    assert tokens and "you sh" not in tokens.lower()
+    assert [e for e, _ in events if e != "token"] == ["reset", "final"]
+    assert events[-1] == ("final", CLEAN_ANSWER)  # from the rewrite pass
+    stream = upstream.chat.streams[0]
+    assert stream.closed and not stream.received.endswith(DISCLAIMER)
+    assert [c.get("stream") for c in upstream.chat.calls] == [True, None]
+
+
+def test_stream_is_closed_when_consumer_leaves(upstream):
+    upstream.chat.pieces = _pieces(CLEAN_ANSWER, 40)
+
+    async def first_token():
+        agen = models._astream_pipeline("prompt")
+        async for event, _ in agen:
+            assert event == "token"
+            break
+        await agen.aclose()
+
+    asyncio.run(first_token())
+    stream = upstream.chat.streams[0]
+    assert stream.closed and stream.received != CLEAN_ANSWER
+
+
+def test_stream_is_closed_on_upstream_error(upstream, monkeypatch):
+    stream = FakeStream(_pieces(BODY, 40), error=ConnectionError("reset by peer"))
+    monkeypatch.setattr(upstream.chat, "_respond", lambda kwargs: stream)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(_collect(models._astream_pipeline("prompt")))
+    assert stream.closed
+
+
+def _record_observations(monkeypatch, limiter):
+    seen = []
+    monkeypatch.setattr(limiter, "observe", lambda latency_s, ok=True: seen.append(ok))
+    return seen
+
+
+def test_stream_holds_lease_and_feeds_limiter(upstream, monkeypatch):
+    upstream.chat.pieces = _pieces(CLEAN_ANSWER, 40)
+    observed = _record_observations(monkeypatch, upstream.limiter)
+    backend = upstream.pool.backends[0]
+    outstanding = []
+
+    def check(event, text):
+        if event == "token" and not upstream.chat.streams[0].closed:
+            outstanding.append(backend.outstanding)
+
+    asyncio.run(_collect(models._astream_pipeline("prompt"), check))
+
+    assert outstanding and set(outstanding) == {1}  # leased while streaming
+    assert backend.outstanding == 0 and backend.failures == 0
+    assert observed == [True]
+
+
+def test_stream_error_is_a_failure_for_backend_and_limiter(upstream, monkeypatch):
+    request = httpx.Request("POST", "http://only/v1/chat/completions")
+    stream = FakeStream(_pieces(BODY, 40), error=openai.APIConnectionError(request=request))
+    monkeypatch.setattr(upstream.chat, "_respond", lambda kwargs: stream)
+    observed = _record_observations(monkeypatch, upstream.limiter)
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(_collect(models._astream_pipeline("prompt")))
+
+    backend = upstream.pool.backends[0]
+    assert stream.closed and observed == [False]
+    assert backend.outstanding == 0 and backend.failures == 1
+
+
+# ---------------------------------------------------------
+# Truncated answers (finish_reason == "length")
+# ---------------------------------------------------------
+@pytest.fixture
+def tight_pass_1(monkeypatch):
+    """
+    pass_1 tuner whose adaptive limit (80) sits below its ceiling (220).
+    """
+    tuner = AdaptiveMaxTokens(PassSettings("pass_1", max_tokens=220, min_tokens=80), min_samples=1)
+    tuner.observe(10, "stop", 220)
+    monkeypatch.setitem(models.generation, "pass_1", tuner)
+    return tuner
+
+
+def test_truncated_answer_is_asked_again_at_the_ceiling(upstream, tight_pass_1):
+    chat = upstream.chat
+    chat.answer = lambda messages: ("Insulin moves glucose. It also", "length") if not chat.calls[1:] else BODY
+
+    assert models._call_chat([{"role": "user", "content": "hi"}], pass_name="pass_1") == BODY.strip()
+    assert [c["max_tokens"] for c in chat.calls] == [80, 220]
+    assert tight_pass_1.truncated == 1
+
+
+def test_truncated_at_the_ceiling_is_trimmed_to_a_sentence(upstream):
+    upstream.chat.answer = lambda messages: ("Insulin moves glucose. It also", "length")
+
+    text = asyncio.run(models._acall_chat([{"role": "user", "content": "hi"}], max_tokens=50))
+    assert text == "Insulin moves glucose."
+
+
+def test_truncated_stream_is_never_served_as_streamed(upstream):
+    upstream.chat.pieces = [BODY + "It also dep", "ends on"]
+    upstream.chat.finish_reason = "length"
+
+    events = asyncio.run(_collect(models._astream_pipeline("prompt")))
+
+    assert [e for e, _ in events if e != "token"] == ["reset", "final"]
+    assert events[-2] == ("reset", "truncated")
+    assert events[-1] == ("final", CLEAN_ANSWER)  # at the ceiling already: trimmed
+
+
+def test_both_paths_feed_the_tuner_in_count_tokens(upstream, tight_pass_1, monkeypatch):
+    samples = []
+    monkeypatch.setattr(tight_pass_1, "observe", lambda used, finish_reason, limit: samples.append(used))
+    reply = chat_reply(BODY)
+    reply.usage = SimpleNamespace(completion_tokens=999)  # model tokens, a different unit
+
+    def respond(kwargs):
+        return FakeStream([CLEAN_ANSWER]) if kwargs.get("stream") else reply
+
+    monkeypatch.setattr(upstream.chat, "_respond", respond)
+
+    models._call_chat([{"role": "user", "content": "hi"}], pass_name="pass_1")
+    asyncio.run(_collect(models._astream_pipeline("prompt")))
+
+    assert samples == [count_tokens(BODY.strip())] * 2
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from app import nlp
+from app.cache import LRUCache
+
+
+class FakeToken:
+    def __init__(self, text):
+        self.text = text
+        self.lemma_ = {"headaches": "headache", "coughing": "cough", "diabetic": "diabetic"}.get(text, text)
+        self.is_alpha = text.isalpha()
+
+
+class FakeNlp:
+    """
+    Stands in for en_core_web_sm: whitespace/punctuation tokens, tiny lemma table.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return [FakeToken(t) for t in re.findall(r"\w+|[^\w\s]", text)]
+
+    def pipe(self, texts, batch_size=64):
+        for text in texts:
+            yield self(text)
+
+
+@pytest.fixture
+def fake_nlp(monkeypatch):
+    fake = FakeNlp()
+    monkeypatch.setattr(nlp, "_nlp", fake)
+    monkeypatch.setattr(nlp, "entity_cache", LRUCache(max_entries=8, ttl_s=60))
+    return fake
+
+
+def test_one_pass_per_text(fake_nlp):
+    text = "Diabetic since 2019, asthma. Headaches and coughing; tired."
+    conditions, symptoms = nlp.extract_entities(text)
+    assert fake_nlp.calls == 1
+    assert conditions == ["diabetes", "asthma"]
+    assert symptoms == ["fatigue", "cough", "headache"]
+    assert (conditions, symptoms) == (nlp.extract_conditions(text), nlp.extract_symptoms(text))
+
+
+def test_batch_matches_single(fake_nlp):
+    texts = ["asthma and a cough", "", "diabetic, thirsty"]
+    assert nlp.extract_entities_batch(texts) == [nlp.extract_entities(t) for t in texts]
+
+
+def test_multi_word_terms(fake_nlp):
+    assert nlp.extract_entities("History of high blood pressure.") == (["hypertension"], [])
+
+
+def test_repeated_history_is_memoized(fake_nlp):
+    history = "Diabetic.  Tired and thirsty."
+    first = nlp.extract_entities(history)
+    assert nlp.extract_entities("diabetic. tired and\nthirsty.") == first
+    assert fake_nlp.calls == 1
+    assert nlp.entity_cache.stats()["hits"] == 1
+
+    # only hashes and labels are stored
+    (key, (_, _, value)), = nlp.entity_cache._data.items()
+    assert "diabetic" not in key and value == (("diabetes",), ("fatigue", "thirst"))
+
+    first[0].append("mutated")  # callers get fresh lists
+    assert nlp.extract_entities(history)[0] == ["diabetes"]
+
+
+def test_batch_parses_only_new_histories(fake_nlp):
+    nlp.extract_entities("asthma")
+    results = nlp.extract_entities_batch(["asthma", "a cough", "a cough", "asthma"])
+    assert results == [(["asthma"], []), ([], ["cough"]), ([], ["cough"]), (["asthma"], [])]
+    assert fake_nlp.calls == 2
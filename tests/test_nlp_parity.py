@@ -0,0 +1,37 @@
+import pytest
+
+from app import nlp
+
+# (history, expected conditions, expected symptoms)
+CORPUS = [
+    ("Diagnosed with type 2 diabetes in 2023. Experiencing fatigue and increased thirst.", ["diabetes"], ["fatigue", "thirst"]),
+    ("Diabetic since 2015; hypertension controlled with medication.", ["diabetes", "hypertension"], []),
+    ("History of high blood pressure. Frequent headaches, mostly in the morning.", ["hypertension"], ["headache"]),
+    ("Childhood asthma. Coughing at night and feeling tired during the day.", ["asthma"], ["fatigue", "cough"]),
+    ("Mother had breast cancer. No current symptoms.", ["cancer"], []),
+    ("Always thirsty and exhausted after work; persistent cough.", [], ["fatigue", "thirst", "cough"]),
+    ("Blood pressure was high at the last visit, patient coughs occasionally.", [], ["cough"]),
+    ("Asthma, diabetes and cancer screening scheduled. Tiredness and headache.", ["diabetes", "asthma", "cancer"], ["fatigue", "headache"]),
+    ("No known conditions.", [], []),
+    ("", [], []),
+]
+
+
+def _fast(text):
+    return nlp._entities(nlp.get_fast_lemmatizer().lemmas(text))
+
+
+@pytest.mark.parametrize("history,conditions,symptoms", CORPUS)
+def test_fast_backend(history, conditions, symptoms):
+    assert _fast(history) == (conditions, symptoms)
+
+
+def test_parity_with_spacy():
+    spacy = pytest.importorskip("spacy")
+    if not spacy.util.is_package("en_core_web_sm"):
+        pytest.skip("en_core_web_sm is not installed")
+
+    histories = [history for history, _, _ in CORPUS]
+    docs = nlp.get_nlp().pipe(h.lower() for h in histories)
+    for history, doc in zip(histories, docs):
+        assert _fast(history) == nlp._entities(nlp._lemmas(doc)), history
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import nlp
+from app.cache import LRUCache
+from app.nlp_pool import NlpPool
+
+LONG = "Diabetic. Persistent cough. " * 100
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_short_texts_stay_inline_long_ones_offload(monkeypatch):
+    monkeypatch.setattr(nlp, "entity_cache", None)
+    threads = []
+
+    def extract(text):
+        threads.append(threading.current_thread().name)
+        return ["diabetes"], ["cough"]
+
+    with ThreadPoolExecutor(1, thread_name_prefix="pool") as executor:
+        pool = NlpPool(min_chars=100, executor=executor, extract=extract)
+        assert _run(pool.extract_entities("short")) == (["diabetes"], ["cough"])
+        assert _run(pool.extract_entities(LONG)) == (["diabetes"], ["cough"])
+
+    assert not threads[0].startswith("pool") and threads[1].startswith("pool")
+    stats = pool.stats()
+    assert stats["inline"] == 1 and stats["offloaded"] == 1 and stats["p50_ms"] is not None
+
+
+def test_timeout_returns_no_entities(monkeypatch):
+    monkeypatch.setattr(nlp, "entity_cache", None)
+    release = threading.Event()
+
+    def slow(text):
+        release.wait(5)
+        return ["diabetes"], []
+
+    with ThreadPoolExecutor(1) as executor:
+        pool = NlpPool(min_chars=10, timeout_s=0.05, executor=executor, extract=slow)
+        assert _run(pool.extract_entities(LONG)) == ([], [])
+        release.set()
+    assert pool.stats()["timeouts"] == 1 and pool.stats()["in_flight"] == 0
+
+
+def test_memoized_histories_skip_the_pool(monkeypatch):
+    monkeypatch.setattr(nlp, "entity_cache", LRUCache(max_entries=8, ttl_s=60))
+    calls = []
+
+    def extract(text):
+        calls.append(text)
+        return ["asthma"], []
+
+    with ThreadPoolExecutor(1) as executor:
+        pool = NlpPool(min_chars=10, executor=executor, extract=extract)
+        _run(pool.extract_entities(LONG))
+        assert _run(pool.extract_entities(LONG)) == (["asthma"], [])
+    assert len(calls) == 1
+
+
+def test_process_pool_with_fast_backend(monkeypatch):
+    # children are spawned with this environment and import app.nlp themselves
+    monkeypatch.setenv("NLP_BACKEND", "fast")
+    monkeypatch.setattr(nlp, "entity_cache", None)
+    pool = NlpPool(workers=1, min_chars=10)
+    pool.start()
+    try:
+        _run(pool.warm_up())
+        assert _run(pool.extract_entities(LONG)) == (["diabetes"], ["cough"])
+    finally:
+        pool.shutdown()
+
+
+def test_dead_worker_falls_back_inline_and_restarts(monkeypatch):
+    monkeypatch.setenv("NLP_BACKEND", "fast")
+    monkeypatch.setattr(nlp, "NLP_BACKEND", "fast")  # for the inline fallback
+    monkeypatch.setattr(nlp, "entity_cache", None)
+    pool = NlpPool(workers=1, min_chars=10)
+    pool.start()
+    try:
+        _run(pool.warm_up())
+        broken = pool._executor
+        for pid in list(broken._processes):
+            os.kill(pid, signal.SIGKILL)  # e.g. OOM-killed on a long history
+
+        assert _run(pool.extract_entities(LONG)) == (["diabetes"], ["cough"])
+        assert pool.stats()["restarts"] == 1 and pool.stats()["inline"] == 1
+        assert pool._executor is not broken
+
+        # the new pool serves the next long history
+        assert _run(pool.extract_entities(LONG + " ")) == (["diabetes"], ["cough"])
+        assert pool.stats()["offloaded"] == 2 and pool.stats()["restarts"] == 1
+    finally:
+        pool.shutdown()
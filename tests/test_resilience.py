@@ -0,0 +1,142 @@
+import pytest
+
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Deadline,
+    DeadlineExceeded,
+    RetryPolicy,
+    backoff_delay,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Transient(Exception):
+    pass
+
+
+def test_backoff_is_jittered_and_capped():
+    assert backoff_delay(0, 0.2, 2.0, rng=lambda: 1.0) == 0.2
+    assert backoff_delay(3, 0.2, 2.0, rng=lambda: 1.0) == 1.6
+    assert backoff_delay(10, 0.2, 2.0, rng=lambda: 1.0) == 2.0
+    assert backoff_delay(10, 0.2, 2.0, rng=lambda: 0.0) == 0.0
+
+
+def test_breaker_opens_then_half_opens_then_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, open_s=10, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    breaker.before_call()  # the single probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats()["short_circuited"] == 2
+
+
+def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, open_s=5, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 5
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+
+def test_retries_transient_errors_then_succeeds():
+    policy = RetryPolicy(retry_on=(Transient,), max_attempts=3, base_s=0.0, cap_s=0.0)
+    outcomes = iter([Transient(), Transient(), "ok"])
+    timeouts = []
+
+    def fn(timeout):
+        timeouts.append(timeout)
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert policy.call(fn, Deadline(5.0)) == "ok"
+    assert policy.retries == 2
+    assert all(0 < t <= policy.call_timeout_s for t in timeouts)
+
+
+def test_per_call_timeout_is_capped_by_deadline():
+    clock = FakeClock()
+    policy = RetryPolicy(retry_on=(Transient,), call_timeout_s=20.0)
+
+    assert policy.call(lambda timeout: timeout, Deadline(3.0, clock=clock)) == 3.0
+
+    expired = Deadline(1.0, clock=clock)
+    clock.now = 1.0
+    with pytest.raises(DeadlineExceeded):
+        policy.call(lambda timeout: timeout, expired)
+
+
+def test_non_transient_errors_are_not_retried():
+    policy = RetryPolicy(retry_on=(Transient,), max_attempts=3)
+
+    def fn(timeout):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        policy.call(fn, Deadline(5.0))
+    assert policy.attempts == 1
+
+
+def test_open_breaker_short_circuits_retries():
+    breaker = CircuitBreaker(failure_threshold=1, open_s=60)
+    policy = RetryPolicy(
+        retry_on=(Transient,), max_attempts=5, base_s=0.0, cap_s=0.0, breaker=breaker
+    )
+
+    def fn(timeout):
+        raise Transient()
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(fn, Deadline(5.0))
+    assert policy.attempts == 1
+
+
+class Busy(Exception):
+    pass
+
+
+def test_only_failure_on_errors_count_against_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, open_s=60)
+    policy = RetryPolicy(
+        retry_on=(Transient, Busy),
+        failure_on=(Transient,),
+        max_attempts=3,
+        base_s=0.0,
+        cap_s=0.0,
+        breaker=breaker,
+    )
+
+    def busy(timeout):
+        raise Busy()
+
+    with pytest.raises(Busy):
+        policy.call(busy, Deadline(5.0))
+    assert policy.attempts == 3 and breaker.state == "closed"
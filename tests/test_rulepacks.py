@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from app.rulepacks import RulePack, RulePackError, check_pattern, load_rule_pack
+from app import safety
+
+
+def test_builtin_rules_come_from_the_shipped_pack():
+    pack = load_rule_pack("data/safety_rules.json")
+    assert safety.BUILTIN_PACK == pack
+    assert safety.UNSAFE_PATTERNS == pack.for_locale("en")
+    assert safety.DIAGNOSIS_PATTERNS == pack.for_locale("en")[safety.DIAGNOSIS]
+    assert set(safety.ALL_UNSAFE_PATTERNS) == {p for ps in pack.for_locale("en").values() for p in ps}
+
+
+def test_locale_tags():
+    pack = RulePack.from_dict(
+        {
+            "version": "2",
+            "locale": "en",
+            "rules": [
+                {"category": "diagnosis", "patterns": [r"\bdo i have\b"]},
+                {"category": "diagnosis", "locale": "de", "patterns": [r"\bhabe ich\b"]},
+                {"category": "treatment", "locale": "*", "patterns": [r"\bibuprofen\b"]},
+            ],
+        }
+    )
+    assert pack.version == "2" and pack.locales == ["*", "de", "en"]
+    assert pack.for_locale("de") == {"diagnosis": [r"\bhabe ich\b"], "treatment": [r"\bibuprofen\b"]}
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [r"(a+)+$", r"(\w*\s?)*x", r"(?:do|i|have{1,3})*", r"(x)\1", "(unclosed", "a" * 600],
+)
+def test_rejects_dangerous_or_invalid_patterns(pattern):
+    with pytest.raises(RulePackError):
+        check_pattern(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern,problem",
+    [
+        (r"(.*a){12}x", "variable repeat inside a repeat"),  # bounded outer repeat
+        (r"(a|aa)*c", "alternatives inside a repeat"),
+        (r"(a|a)*c", "alternatives inside a repeat"),
+        (r"(?:a|ab)+$", "alternatives inside a repeat"),
+        (r"(?:a.|ab)*c", "alternatives inside a repeat"),  # "ab" matches both
+        (r"\s*\s*\s*x", "adjacent repeats"),
+        (r"\w+\b\d*$", "adjacent repeats"),
+        # through capturing groups and nullable items
+        (r"(a*)(a*)x", "adjacent repeats"),
+        (r"\w*(?:\s?)\w*!", "adjacent repeats"),
+        (r"a*b?a*x", "adjacent repeats"),
+        (r"\w+(?:-|)\w+!", "adjacent repeats"),
+        (r"\w+\s*\w+", "adjacent repeats"),
+    ],
+)
+def test_rejects_backtracking_shapes(pattern, problem):
+    with pytest.raises(RulePackError, match=problem):
+        check_pattern(pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"\bdo i have\b",
+        r"\b\d+\s*mg\b",
+        r"(?:ab){2}+",
+        r"(?>\s+\w+)*",
+        r"(?:foo|bar)+x",
+        r"(?:ab|ac)*x",
+        r"\w+\s+\w+",
+        r"(\d+)\s*(mg|ml)\b",
+        r"\bdo(?:es)? i have\b.*",
+        r"\bstop\b.*\bmedication\b",
+    ],
+)
+def test_accepts_linear_patterns(pattern):
+    check_pattern(pattern)
+
+
+def test_load_errors_name_the_rule(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"version": "1", "rules": [{"category": "x", "patterns": ["(a+)+"]}]}))
+    with pytest.raises(RulePackError, match=r"rules\[0\]"):
+        load_rule_pack(path)
+
+    path.write_text("{not json")
+    with pytest.raises(RulePackError):
+        load_rule_pack(path)
+
+
+def test_yaml_pack(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "rules.yaml"
+    path.write_text(
+        "version: 3\nlocale: en\nrules:\n  - category: diagnosis\n    patterns: ['\\bam i sick\\b']\n"
+    )
+    pack = load_rule_pack(path)
+    assert pack.version == "3" and pack.for_locale("en") == {"diagnosis": [r"\bam i sick\b"]}
@@ -0,0 +1,122 @@
+import json
+import re
+
+import pytest
+
+from app.rulepacks import RulePackError
+from app.safety import (
+    ACTION_ADVICE,
+    DIAGNOSIS,
+    MEDICATION_CHANGE,
+    REFUSAL,
+    UNSAFE_PATTERNS,
+    SafetyEngine,
+    SafetyRules,
+    check_safety,
+    classify_safety,
+)
+
+
+def test_allowed_question_passes():
+    result = classify_safety("What does HbA1c mean in my report?")
+    assert not result.blocked and result.category is None
+    assert check_safety("What does HbA1c mean in my report?") is None
+
+
+def test_reports_every_category_in_order():
+    result = classify_safety("Do I have diabetes? Should I stop metformin? What should I do?")
+    assert result.categories == (DIAGNOSIS, MEDICATION_CHANGE, ACTION_ADVICE)
+    assert result.category == DIAGNOSIS
+    assert result.spans[0] == (DIAGNOSIS, 0, len("do i have"))
+    assert check_safety("DO I HAVE diabetes?") == REFUSAL
+
+
+def test_word_boundaries():
+    assert not classify_safety("how do i haveli?").blocked
+    assert classify_safety("so... do i have it?").blocked
+
+
+def test_overlapping_rules_are_all_found():
+    # "what disease do i have" contains "do i have": both match
+    result = classify_safety("what disease do i have")
+    assert [s[1] for s in result.spans] == [0, len("what disease ")]
+
+
+def test_regex_rules_and_large_rule_sets():
+    rules = {k: list(v) for k, v in UNSAFE_PATTERNS.items()}
+    rules[MEDICATION_CHANGE] += [rf"\bshould i take drug{i}\b" for i in range(2000)]
+    rules["dosage"] = [r"\b\d+\s*mg\b"]
+    engine = SafetyEngine(rules)
+
+    assert len(engine) == sum(len(v) for v in UNSAFE_PATTERNS.values()) + 2001
+    assert engine.classify("should i take drug1999 tonight").category == MEDICATION_CHANGE
+    assert not engine.classify("should i take drug20000").blocked
+    assert engine.classify("is 500 mg a lot").categories == ("dosage",)
+
+
+def test_phrase_prefixes_report_their_categories():
+    engine = SafetyEngine({DIAGNOSIS: [r"\bdo i have\b"], MEDICATION_CHANGE: [r"\bdo i have to stop\b"]})
+    result = engine.classify("Do I have to stop metformin?")
+    assert set(result.categories) == {DIAGNOSIS, MEDICATION_CHANGE}
+    assert sorted(result.spans) == [(DIAGNOSIS, 0, 9), (MEDICATION_CHANGE, 0, 17)]
+    assert engine.classify("do i have diabetes").categories == (DIAGNOSIS,)
+
+    # only word-bounded prefixes: "i can" does not match inside "i cannot"
+    engine = SafetyEngine({DIAGNOSIS: [r"\bi can\b"], ACTION_ADVICE: [r"\bi cannot\b"]})
+    assert engine.classify("i cannot sleep").categories == (ACTION_ADVICE,)
+
+
+def test_rules_matching_at_the_same_position_are_all_found():
+    engine = SafetyEngine({DIAGNOSIS: [r"\bdo i have\b"], "dosage": [r"\bdo i have \d+\s*mg\b", r"\bdo\b.*\bmg\b"]})
+    result = engine.classify("do i have 500 mg left")
+    assert set(result.categories) == {DIAGNOSIS, "dosage"}
+    assert len([s for s in result.spans if s[0] == "dosage"]) == 2
+
+
+def test_bad_rule_fails_at_compile():
+    with pytest.raises(re.error):
+        SafetyEngine({DIAGNOSIS: [r"\bunclosed (group\b"]})
+
+
+@pytest.mark.parametrize("pattern", [r"(?i)\bdo i have\b", r"(?x) do \s i", r"\b(a)\1\b"])
+def test_rule_that_breaks_the_combined_regex_fails_alone(pattern):
+    # each compiles on its own, but not as a branch of the combined regex
+    re.compile(pattern)
+    with pytest.raises(re.error) as error:
+        SafetyEngine({DIAGNOSIS: [r"\bdo i have\b"], MEDICATION_CHANGE: [pattern]})
+    # reported against the rule's own branch, not the whole combined regex
+    assert error.value.pattern == f"(?P<r0>{pattern})"
+    assert SafetyEngine({DIAGNOSIS: [r"\bfoo(?i:bar)\b"]}).classify("foobar").blocked
+
+
+def _write_pack(path, version, patterns):
+    path.write_text(json.dumps({"version": version, "rules": [{"category": DIAGNOSIS, "patterns": patterns}]}))
+
+
+def test_hot_reload_swaps_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    _write_pack(path, "1", [r"\bdo i have\b"])
+    rules = SafetyRules(str(path))
+    assert not rules.classify("am i sick").blocked
+    assert not rules.reload()  # unchanged file
+
+    _write_pack(path, "2", [r"\bam i sick\b"])
+    assert rules.reload(force=True)
+    assert rules.classify("am i sick").blocked and not rules.classify("do i have it").blocked
+    assert rules.stats()["version"] == "2" and rules.stats()["reloads"] == 1
+
+
+def test_bad_pack_keeps_previous_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    _write_pack(path, "1", [r"\bdo i have\b"])
+    rules = SafetyRules(str(path))
+
+    _write_pack(path, "2", [r"(\w+\s?)*$"])
+    assert not rules.reload(force=True)
+    assert rules.pack.version == "1" and rules.classify("do i have it").blocked
+    assert rules.stats()["reload_errors"] == 1 and "rejected" in rules.stats()["last_error"]
+
+
+def test_broken_pack_at_startup_raises(tmp_path):
+    with pytest.raises(RulePackError):
+        SafetyRules(str(tmp_path / "missing.json"))
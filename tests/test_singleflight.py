@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_sync_duplicates_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow(x):
+        calls.append(x)
+        started.set()
+        time.sleep(0.1)
+        return x * 2
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(flight.do, "k", slow, 21)
+        started.wait()
+        rest = [pool.submit(flight.do, "k", slow, 21) for _ in range(4)]
+        results = [first.result()] + [f.result() for f in rest]
+
+    assert results == [42] * 5
+    assert calls == [21]
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "duplicates_saved": 4}
+
+
+def test_exception_is_shared_and_key_is_released():
+    flight = SingleFlight()
+
+    def boom():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        flight.do("k", boom)
+
+    # a later call starts a fresh flight
+    assert flight.do("k", lambda: "ok") == "ok"
+    assert flight.leaders == 2
+
+
+def test_async_duplicates_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", slow) for _ in range(10)))
+
+    assert asyncio.run(main()) == ["answer"] * 10
+    assert len(calls) == 1
+    assert flight.shared == 9
+
+
+def test_sync_caller_joins_async_leader():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "shared"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        follower = await asyncio.to_thread(flight.do, "k", lambda: "not called")
+        return await leader, follower
+
+    assert asyncio.run(main()) == ("shared", "shared")
+    assert flight.shared == 1
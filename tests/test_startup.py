@@ -0,0 +1,39 @@
+from app.startup import StartupTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_phase_records_state_and_time():
+    clock = FakeClock()
+    tracker = StartupTracker(clock=clock)
+    assert tracker.state("nlp") == "cold"
+
+    with tracker.phase("nlp"):
+        assert tracker.state("nlp") == "warming"
+        clock.now = 1.5
+    assert tracker.component("nlp") == {"state": "ready", "seconds": 1.5, "error": None}
+
+
+def test_failed_phase_is_recorded_not_raised():
+    tracker = StartupTracker(clock=FakeClock())
+    with tracker.phase("upstream"):
+        raise RuntimeError("no backend")
+    component = tracker.component("upstream")
+    assert component["state"] == "error"
+    assert "no backend" in component["error"]
+
+
+def test_lazily_loaded_component_counts_as_ready():
+    tracker = StartupTracker(clock=FakeClock())
+    assert tracker.state("mlflow", loaded=True) == "ready"
+
+
+def test_unconfigured_component_is_off():
+    tracker = StartupTracker(clock=FakeClock())
+    assert tracker.component("nlp_pool", enabled=False) == {"state": "off", "seconds": None, "error": None}
@@ -0,0 +1,40 @@
+from app.nlp import CONDITIONS, SYMPTOMS
+from app.terminology import TermMatcher, load_lexicon, term_tokens
+
+
+def test_single_and_multi_word_terms():
+    matcher = TermMatcher(CONDITIONS)
+    tokens = "she have high blood pressure and be diabetic".split()
+    assert matcher.match(tokens) == ["diabetes", "hypertension"]  # lexicon order, not text order
+    assert matcher.match("high blood sugar".split()) == []
+    assert matcher.match([]) == []
+
+
+def test_overlapping_terms_and_duplicates():
+    matcher = TermMatcher({"heart failure": ["heart failure"], "heart disease": ["heart"], "kidney": ["kidney failure"]})
+    assert matcher.match("heart failure and heart trouble".split()) == ["heart failure", "heart disease"]
+    assert matcher.match("kidney kidney failure".split()) == ["kidney"]
+
+
+def test_terms_tokenized_like_lemmas():
+    assert term_tokens("Type 2 Diabetes") == ("type", "diabetes")
+    matcher = TermMatcher({"type 2 diabetes": ["type 2 diabetes"]})
+    assert matcher.match(["type", "diabetes"]) == ["type 2 diabetes"]
+
+
+def test_large_lexicon(tmp_path):
+    path = tmp_path / "lexicon.csv"
+    rows = ["kind,canonical,term"]
+    rows += [f"condition,cond{i},rare condition number{chr(97 + i % 26)} x{i:05d}" for i in range(20000)]
+    rows += ["condition,asthma,asthma", "symptom,cough,cough", "symptom,cough,coughing"]
+    path.write_text("\n".join(rows) + "\n")
+
+    lexicon = load_lexicon(path)
+    conditions = TermMatcher(lexicon["condition"])
+    assert len(conditions) == 20001
+    assert conditions.match("asthma and rare condition numberb".split()) == ["asthma"]
+    assert TermMatcher(lexicon["symptom"]).match(["coughing"]) == ["cough"]
+
+
+def test_shipped_lexicon_matches_builtin_tables():
+    assert load_lexicon("data/lexicon.csv") == {"condition": CONDITIONS, "symptom": SYMPTOMS}